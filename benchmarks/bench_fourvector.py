@@ -0,0 +1,82 @@
+# coding: utf-8
+"""
+Benchmarks of the 4-vector arithmetic (V4 on whole columns and V4Array).
+"""
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import numpy as np
+
+from datawarehouse.higgsml import V4
+from datawarehouse.fourvector import V4Array
+
+from .common import SIZES
+
+
+def _random_pt_eta_phi(n_samples, seed):
+    random = np.random.RandomState(seed)
+    return (random.uniform(20, 150, n_samples),
+            random.uniform(-2.5, 2.5, n_samples),
+            random.uniform(-np.pi, np.pi, n_samples))
+
+
+class TimeV4(object):
+    params = SIZES
+    param_names = ['n_samples']
+
+    def setup(self, n_samples):
+        self.a = _random_pt_eta_phi(n_samples, 1)
+        self.b = _random_pt_eta_phi(n_samples, 2)
+        self.v1 = V4()
+        self.v1.setPtEtaPhiM(*self.a, m=0.8)
+        self.v2 = V4()
+        self.v2.setPtEtaPhiM(*self.b, m=0.)
+
+    def time_setPtEtaPhiM(self, n_samples):
+        V4().setPtEtaPhiM(*self.a, m=0.8)
+
+    def time_add_mass(self, n_samples):
+        (self.v1 + self.v2).m()
+
+    def time_deltaR(self, n_samples):
+        self.v1.deltaR(self.v2)
+
+    def time_scaleFixedM(self, n_samples):
+        self.v1.copy().scaleFixedM(1.03)
+
+
+class TimeV4Array(object):
+    params = SIZES
+    param_names = ['n_samples']
+
+    def setup(self, n_samples):
+        self.a = _random_pt_eta_phi(n_samples, 1)
+        self.b = _random_pt_eta_phi(n_samples, 2)
+        self.v1 = V4Array.fromPtEtaPhiM(*self.a, m=0.8)
+        self.v2 = V4Array.fromPtEtaPhiM(*self.b, m=0.)
+
+    def time_fromPtEtaPhiM(self, n_samples):
+        V4Array.fromPtEtaPhiM(*self.a, m=0.8)
+
+    def time_add_mass(self, n_samples):
+        (self.v1 + self.v2).m()
+
+    def time_deltaR(self, n_samples):
+        self.v1.invalidate()
+        self.v2.invalidate()
+        self.v1.deltaR(self.v2)
+
+    def time_scaleFixedM(self, n_samples):
+        self.v1.copy().scaleFixedM(1.03)
+
+
+class PeakMemV4Array(object):
+    params = [SIZES[-2]]
+    param_names = ['n_samples']
+
+    def setup(self, n_samples):
+        self.a = _random_pt_eta_phi(n_samples, 1)
+
+    def peakmem_fromPtEtaPhiM_mass(self, n_samples):
+        V4Array.fromPtEtaPhiM(*self.a, m=0.8).m()
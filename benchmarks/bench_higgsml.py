@@ -0,0 +1,81 @@
+# coding: utf-8
+"""
+Benchmarks of the HiggsML systematics and features.
+"""
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+from datawarehouse import higgsml
+from datawarehouse import higgstautau
+
+from .common import SIZES
+from .common import make_higgs
+from .common import make_tautau
+
+
+class TimeTauEnergyScale(object):
+    params = SIZES
+    param_names = ['n_samples']
+    number = 1 # the data is modified inplace : fresh copy for every sample
+    timeout = 600
+
+    def setup(self, n_samples):
+        if not hasattr(self, 'base') or len(self.base) != n_samples:
+            self.base = make_higgs(n_samples)
+            higgsml.label_to_float(self.base)
+        self.data = self.base.copy()
+
+    def time_tau_energy_scale(self, n_samples):
+        higgsml.tau_energy_scale(self.data, 1.03)
+
+    def time_tau_energy_scale_grid(self, n_samples):
+        higgsml.tau_energy_scale_grid(self.data, [0.97, 1.0, 1.03])
+
+    def time_bkg_weight_norm(self, n_samples):
+        higgsml.bkg_weight_norm(self.data, 1.05)
+
+    def time_add_radians(self, n_samples):
+        higgsml.add_radians(self.data)
+
+    def time_add_detail_label(self, n_samples):
+        higgsml.add_detail_label(self.data)
+
+    def time_normalize_weight(self, n_samples):
+        higgsml.normalize_weight(self.data['Weight'], self.data['Label'])
+
+    def time_centralities(self, n_samples):
+        higgsml.METphi_centrality(self.data['PRI_lep_phi'], self.data['PRI_tau_phi'], self.data['PRI_met_phi'])
+        higgsml.eta_centrality(self.data['PRI_lep_eta'], self.data['PRI_jet_leading_eta'],
+                               self.data['PRI_jet_subleading_eta'])
+
+    def peakmem_tau_energy_scale(self, n_samples):
+        higgsml.tau_energy_scale(self.data, 1.03)
+
+
+class TimeLabelToFloat(object):
+    params = SIZES
+    param_names = ['n_samples']
+    number = 1
+
+    def setup(self, n_samples):
+        if not hasattr(self, 'base') or len(self.base) != n_samples:
+            self.base = make_higgs(n_samples)
+        self.data = self.base.copy()
+
+    def time_label_to_float(self, n_samples):
+        higgsml.label_to_float(self.data)
+
+
+class TimeHiggsTauTau(object):
+    params = SIZES
+    param_names = ['n_samples']
+    number = 1
+
+    def setup(self, n_samples):
+        if not hasattr(self, 'base') or len(self.base) != n_samples:
+            self.base = make_tautau(n_samples)
+        self.data = self.base.copy()
+
+    def time_tau_energy_scale(self, n_samples):
+        higgstautau.tau_energy_scale(self.data, 1.03)
@@ -0,0 +1,215 @@
+# coding: utf-8
+"""
+Benchmarks of the file loaders on locally generated fixture files (no download).
+"""
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import os
+import shutil
+
+from datawarehouse import higgsml
+from datawarehouse import higgstautau
+from datawarehouse import baldi2016
+from datawarehouse import magic_gamma
+from datawarehouse import mnist
+from datawarehouse.cache import get_cache_dir
+from datawarehouse.loader import BatchLoader
+from datawarehouse.synthetic_higgs import write_higgs_like_cache
+
+from .common import FILE_SIZES
+from .common import HIGGS_FILE
+from .common import GAMMA_FILE
+from .common import BALDI_FILE
+from .common import make_higgs
+from .common import make_tautau
+from .common import use_data_dir
+from .common import fixture_dir
+from .common import write_gamma
+from .common import write_baldi
+from .common import write_mnist
+
+
+def _make_fixture_dirs(write):
+    """Calls write(path, n_samples) for every FILE_SIZES in its own fixture directory"""
+    # Files created in the current directory are kept for the benchmarks
+    root = os.path.abspath("fixtures")
+    for n_samples in FILE_SIZES:
+        path = fixture_dir(root, n_samples)
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        write(path, n_samples)
+    return root
+
+
+def _write_higgs_files(path, n_samples):
+    make_higgs(n_samples).to_csv(os.path.join(path, HIGGS_FILE), index=False)
+    tautau = make_tautau(n_samples).rename(columns={v: k for k, v in higgstautau.COLUMN_RENAME_FOR_SKEWING.items()})
+    for name in ["htautau.txt.gz", "ztautau.txt.gz"]:
+        tautau.to_csv(os.path.join(path, name), sep='\t', header=False, index=False)
+
+
+class TimeLoadHiggs(object):
+    params = FILE_SIZES
+    param_names = ['n_samples']
+    timeout = 600
+
+    def setup_cache(self):
+        return _make_fixture_dirs(_write_higgs_files)
+
+    def setup(self, root, n_samples):
+        use_data_dir(fixture_dir(root, n_samples))
+        higgsml.load_higgs() # build the columnar cache
+
+    def time_load_higgs_csv(self, root, n_samples):
+        higgsml.load_higgs(cache=False)
+
+    def time_load_higgs_cache(self, root, n_samples):
+        higgsml.load_higgs()
+
+    def time_load_higgs_compact(self, root, n_samples):
+        higgsml.load_higgs(compact=True)
+
+    def time_load_higgs_columns(self, root, n_samples):
+        higgsml.load_higgs(columns=['PRI_tau_pt', 'Weight', 'Label'], filters=[('PRI_jet_num', '>=', 2)])
+
+    def time_load_higgs_split(self, root, n_samples):
+        higgsml.load_higgs(split='train')
+
+    def time_iter_higgs(self, root, n_samples):
+        for data in higgsml.iter_higgs():
+            pass
+
+    def time_build_cache(self, root, n_samples):
+        shutil.rmtree(get_cache_dir(os.path.join(fixture_dir(root, n_samples), HIGGS_FILE)))
+        higgsml.load_higgs()
+
+    def time_load_htautau(self, root, n_samples):
+        higgstautau.load_htautau(restricted_cols=False)
+
+    def time_load_higgstautau(self, root, n_samples):
+        higgstautau.load_higgstautau()
+
+    def peakmem_load_higgs_cache(self, root, n_samples):
+        higgsml.load_higgs()
+
+    def peakmem_load_higgs_compact(self, root, n_samples):
+        higgsml.load_higgs(compact=True)
+
+
+class TimeLoadBaldi2016(object):
+    params = FILE_SIZES
+    param_names = ['n_samples']
+    timeout = 600
+
+    def setup_cache(self):
+        return _make_fixture_dirs(lambda path, n_samples: write_baldi(os.path.join(path, BALDI_FILE), n_samples))
+
+    def setup(self, root, n_samples):
+        use_data_dir(fixture_dir(root, n_samples))
+
+    def time_load_baldi2016(self, root, n_samples):
+        baldi2016.load_baldi2016_train_no_pile()
+
+    def time_load_baldi2016_mmap(self, root, n_samples):
+        baldi2016.load_baldi2016_train_no_pile(mmap=True)
+
+    def time_iter_baldi2016(self, root, n_samples):
+        for X, y in baldi2016.iter_baldi2016_train_no_pile():
+            pass
+
+    def peakmem_load_baldi2016(self, root, n_samples):
+        baldi2016.load_baldi2016_train_no_pile()
+
+    def peakmem_load_baldi2016_mmap(self, root, n_samples):
+        baldi2016.load_baldi2016_train_no_pile(mmap=True)
+
+
+class TimeLoadGammaTelescope(object):
+    params = FILE_SIZES
+    param_names = ['n_samples']
+    timeout = 600
+
+    def setup_cache(self):
+        return _make_fixture_dirs(lambda path, n_samples: write_gamma(os.path.join(path, GAMMA_FILE), n_samples))
+
+    def setup(self, root, n_samples):
+        use_data_dir(fixture_dir(root, n_samples))
+
+    def time_load_gamma_telescope(self, root, n_samples):
+        magic_gamma.load_gamma_telescope()
+
+    def time_iter_gamma_telescope(self, root, n_samples):
+        for X, y in magic_gamma.iter_gamma_telescope():
+            pass
+
+
+class TimeLoadMnist(object):
+    # The MNIST sizes are fixed : 60000 train and 10000 test images
+    timeout = 600
+
+    def setup_cache(self):
+        root = os.path.abspath("fixtures_mnist")
+        if not os.path.isdir(root):
+            os.makedirs(root)
+        write_mnist(root)
+        return root
+
+    def setup(self, root):
+        use_data_dir(root)
+        mnist.load_mnist(scaled=False) # decode the IDX files once
+
+    def time_load_mnist(self, root):
+        mnist.load_mnist()
+
+    def time_load_mnist_uint8(self, root):
+        mnist.load_mnist(scaled=False)
+
+    def time_iter_mnist(self, root):
+        for X, y in mnist.iter_mnist():
+            pass
+
+    def time_decode_mnist(self, root):
+        os.remove(os.path.join(root, mnist.CACHE_SOURCES))
+        mnist.load_mnist(scaled=False)
+
+    def peakmem_load_mnist(self, root):
+        mnist.load_mnist()
+
+
+class TimeSyntheticHiggs(object):
+    params = FILE_SIZES
+    param_names = ['n_samples']
+    timeout = 600
+
+    def setup(self, n_samples):
+        self.cache_dir = os.path.abspath("synthetic_{}.cache".format(n_samples))
+
+    def teardown(self, n_samples):
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def time_make_higgs_like(self, n_samples):
+        make_higgs(n_samples)
+
+    def time_write_higgs_like_cache(self, n_samples):
+        write_higgs_like_cache(self.cache_dir, n_samples, seed=42)
+
+    def peakmem_write_higgs_like_cache(self, n_samples):
+        write_higgs_like_cache(self.cache_dir, n_samples, seed=42)
+
+
+class TimeBatchLoader(object):
+    params = ([10**5, 10**6], [0, 2])
+    param_names = ['n_samples', 'prefetch']
+    timeout = 600
+
+    def setup(self, n_samples, prefetch):
+        data = make_higgs(n_samples)
+        self.X = data[higgsml.HIGGS_FEATURES]
+        self.y = data['Label'] == 's'
+        self.W = data['Weight']
+
+    def time_epoch(self, n_samples, prefetch):
+        for batch in BatchLoader(self.X, self.y, self.W, batch_size=1024, seed=42, prefetch=prefetch):
+            pass
@@ -0,0 +1,77 @@
+# coding: utf-8
+"""
+Benchmarks of the pizza toy dataset.
+"""
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import numpy as np
+
+from datawarehouse.pizza import make_pizza_slice
+from datawarehouse.pizza import iter_pizza_slice
+from datawarehouse.pizza import shuffle_array
+
+from .common import SIZES
+
+
+class TimePizza(object):
+    params = (SIZES, [True, False])
+    param_names = ['n_samples', 'shuffle']
+
+    def setup(self, n_samples, shuffle):
+        np.random.seed(42)
+
+    def time_make_pizza_slice(self, n_samples, shuffle):
+        make_pizza_slice(n_samples, shuffle=shuffle)
+
+    def peakmem_make_pizza_slice(self, n_samples, shuffle):
+        make_pizza_slice(n_samples, shuffle=shuffle)
+
+
+class TimeShuffleArray(object):
+    params = (SIZES[:-1], ['copy', 'inplace', 'out'])
+    param_names = ['n_samples', 'mode']
+
+    def setup(self, n_samples, mode):
+        self.X = np.random.RandomState(42).normal(size=(n_samples, 30))
+        self.y = np.arange(n_samples)
+        self.out = (np.empty_like(self.X), np.empty_like(self.y))
+
+    def _shuffle(self, mode):
+        if mode == 'copy':
+            shuffle_array(self.X, self.y, seed=42)
+        elif mode == 'inplace':
+            shuffle_array(self.X, self.y, seed=42, inplace=True)
+        else:
+            shuffle_array(self.X, self.y, seed=42, out=self.out)
+
+    def time_shuffle_array(self, n_samples, mode):
+        self._shuffle(mode)
+
+    def peakmem_shuffle_array(self, n_samples, mode):
+        self._shuffle(mode)
+
+
+class TimePizzaGenerator(object):
+    params = (SIZES, ['float64', 'float32'])
+    param_names = ['n_samples', 'dtype']
+
+    def time_make_pizza_slice_seeded(self, n_samples, dtype):
+        make_pizza_slice(n_samples, seed=42, dtype=dtype)
+
+    def peakmem_make_pizza_slice_seeded(self, n_samples, dtype):
+        make_pizza_slice(n_samples, seed=42, dtype=dtype)
+
+    def peakmem_iter_pizza_slice(self, n_samples, dtype):
+        for X, y in iter_pizza_slice(n_samples, seed=42, dtype=dtype):
+            pass
+
+
+class TimePizzaParallel(object):
+    params = ([10**7], [1, 2, 4])
+    param_names = ['n_samples', 'n_jobs']
+    timeout = 600
+
+    def time_make_pizza_slice_parallel(self, n_samples, n_jobs):
+        make_pizza_slice(n_samples, seed=42, dtype='float32', n_jobs=n_jobs)
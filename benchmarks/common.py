@@ -0,0 +1,93 @@
+# coding: utf-8
+"""
+Synthetic data shared by the benchmarks (no network needed).
+"""
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import os
+import gzip
+
+import h5py
+import numpy as np
+import pandas as pd
+
+import datawarehouse.download
+from datawarehouse.synthetic_higgs import make_higgs_like
+
+# Number of rows of the synthetic datasets
+SIZES = [10**4, 10**5, 10**6, 10**7]
+# Number of rows of the fixture files (written once by setup_cache)
+FILE_SIZES = [10**4, 10**5, 10**6]
+
+HIGGS_FILE = "atlas-higgs-challenge-2014-v2.csv.gz"
+GAMMA_FILE = "magic04.data"
+BALDI_FILE = "train_no_pile_10000000.h5"
+
+
+def make_higgs(n_samples, seed=42):
+    """
+    A synthetic HiggsML dataset (see datawarehouse.synthetic_higgs).
+    """
+    return make_higgs_like(n_samples, seed=seed)
+
+
+def make_tautau(n_samples, seed=42):
+    """
+    A higgstautau shaped pandas.DataFrame (restricted columns renamed for the skewing).
+    """
+    random = np.random.RandomState(seed)
+    data = {}
+    for name in ['PRI_tau', 'PRI_lep']:
+        data[name + '_pt'] = random.uniform(20, 150, n_samples)
+        data[name + '_eta'] = random.uniform(-2.5, 2.5, n_samples)
+        data[name + '_phi'] = random.uniform(-np.pi, np.pi, n_samples)
+    data['PRI_met'] = random.uniform(0, 150, n_samples)
+    data['PRI_met_phi'] = random.uniform(-np.pi, np.pi, n_samples)
+    return pd.DataFrame(data)
+
+
+def write_gamma(filename, n_samples, seed=42):
+    """A magic04.data shaped file : 10 float features and the class (g or h), no header"""
+    random = np.random.RandomState(seed)
+    data = pd.DataFrame(random.uniform(0, 100, size=(n_samples, 10)).round(4))
+    data[10] = np.where(random.uniform(size=n_samples) < 0.65, 'g', 'h')
+    data.to_csv(filename, header=False, index=False)
+
+
+def write_baldi(filename, n_samples, seed=42):
+    """A baldi2016 shaped HDF5 file : contiguous "features" (n_samples, 6) and "targets" (n_samples, 1)"""
+    random = np.random.RandomState(seed)
+    with h5py.File(filename, 'w') as f:
+        f.create_dataset("features", data=random.normal(size=(n_samples, 6)))
+        f.create_dataset("targets", data=random.randint(0, 2, size=(n_samples, 1)).astype(np.float64))
+
+
+def write_mnist(directory, n_train=60000, n_test=10000, seed=42):
+    """The 4 gzipped IDX files of MNIST filled with random sparse images (mostly black like the real ones)"""
+    from datawarehouse import mnist
+    random = np.random.RandomState(seed)
+    for n_items, images_name, labels_name in [(n_train, mnist.FNAME_TRAIN_IMAGES, mnist.FNAME_TRAIN_LABELS),
+                                              (n_test, mnist.FNAME_TEST_IMAGES, mnist.FNAME_TEST_LABELS)]:
+        images = random.randint(0, 256, size=(n_items, 28, 28)).astype(np.uint8)
+        images[random.uniform(size=images.shape) < 0.8] = 0
+        labels = random.randint(0, 10, size=n_items).astype(np.uint8)
+        # IDX header : magic number (type uint8 and number of dimensions) then the big endian shape
+        with gzip.open(os.path.join(directory, images_name), 'wb', compresslevel=6) as f:
+            f.write(np.array([0x803, n_items, 28, 28], dtype='>i4').tobytes())
+            f.write(images.tobytes())
+        with gzip.open(os.path.join(directory, labels_name), 'wb', compresslevel=6) as f:
+            f.write(np.array([0x801, n_items], dtype='>i4').tobytes())
+            f.write(labels.tobytes())
+
+
+def use_data_dir(path):
+    """Make the datawarehouse loaders read (and never download) from the given directory"""
+    datawarehouse.download.DATA_DIR = path
+    # The fixtures are random : they must not be verified against the checksums of the real files
+    datawarehouse.download.CHECKSUMS = {}
+
+
+def fixture_dir(root, n_samples):
+    return os.path.join(root, "data_{}".format(n_samples))
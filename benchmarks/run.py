@@ -0,0 +1,161 @@
+# coding: utf-8
+"""
+Minimal runner of the asv benchmark classes for environments without asv.
+
+It follows the asv conventions used by the benchmarks (params, setup_cache, setup, teardown)
+and only runs the time_ methods (best of a few repeats). The results are written to a json file
+that a later run can compare against to report the regressions.
+
+    python -m benchmarks.run --max-size 100000 --output benchmarks/baseline.json
+    python -m benchmarks.run --max-size 100000 --compare benchmarks/baseline.json
+"""
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import os
+import sys
+import json
+import inspect
+import argparse
+import platform
+import itertools
+import importlib
+import shutil
+import subprocess
+import tempfile
+import timeit
+
+import numpy as np
+
+MODULES = ['bench_fourvector', 'bench_higgsml', 'bench_loaders', 'bench_pizza']
+
+
+def parse_args(main_args=None):
+    parser = argparse.ArgumentParser(description="Run the benchmarks without asv.")
+    parser.add_argument('--bench', default='', help='only the benchmarks whose name contains this string')
+    parser.add_argument('--max-size', type=int, default=10**5, help='skip the parameters larger than this')
+    parser.add_argument('--repeat', type=int, default=3, help='number of timings (the best is kept)')
+    parser.add_argument('--output', help='json file to write the results to')
+    parser.add_argument('--compare', help='json file of previous results to compare to')
+    parser.add_argument('--factor', type=float, default=1.25, help='slow down reported as a regression')
+    return parser.parse_args(main_args)
+
+
+def iter_benchmarks(pattern=''):
+    """
+    Yield
+    -----
+        name, cls, method_name : every time_ method of the benchmark classes
+    """
+    for module_name in MODULES:
+        module = importlib.import_module('benchmarks.' + module_name)
+        for cls_name, cls in inspect.getmembers(module, inspect.isclass):
+            if cls.__module__ != module.__name__:
+                continue
+            for method_name in sorted(m for m in dir(cls) if m.startswith('time_')):
+                name = '.'.join([module_name, cls_name, method_name])
+                if pattern in name:
+                    yield name, cls, method_name
+
+
+def iter_params(cls, max_size):
+    """All the parameter combinations of the benchmark class with every integer parameter <= max_size"""
+    params = getattr(cls, 'params', None)
+    if params is None:
+        return [()]
+    if not isinstance(params, tuple):
+        params = (params,)
+    return [p for p in itertools.product(*params)
+            if all(not isinstance(v, (int, np.integer)) or v <= max_size for v in p)]
+
+
+def time_benchmark(obj, method_name, args, repeat):
+    """
+    Best time (seconds) of one call of the benchmark. As asv does, setup and teardown surround
+    every sample of number calls : number is the class attribute if any, otherwise it is
+    calibrated so that a sample lasts at least 0.2 s.
+    """
+    times = []
+    for _ in range(repeat):
+        if hasattr(obj, 'setup'):
+            obj.setup(*args)
+        timer = timeit.Timer(lambda: getattr(obj, method_name)(*args))
+        number = getattr(obj, 'number', None)
+        if number is None:
+            number, seconds = timer.autorange()
+        else:
+            seconds = timer.timeit(number)
+        times.append(seconds / number)
+        if hasattr(obj, 'teardown'):
+            obj.teardown(*args)
+    return min(times)
+
+
+def run(pattern='', max_size=10**5, repeat=3):
+    results = {}
+    caches = {}
+    for name, cls, method_name in iter_benchmarks(pattern):
+        obj = cls()
+        cache_args = ()
+        if hasattr(obj, 'setup_cache'):
+            if cls not in caches:
+                caches[cls] = obj.setup_cache()
+            cache_args = (caches[cls],)
+        for params in iter_params(cls, max_size):
+            seconds = time_benchmark(obj, method_name, cache_args + params, repeat)
+            key = name if not params else '{}({})'.format(name, ', '.join(map(str, params)))
+            results[key] = seconds
+            print('{:<90} {:10.4f} s'.format(key, seconds))
+            sys.stdout.flush()
+    return results
+
+
+def machine_info():
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.STDOUT).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'machine': platform.node(), 'platform': platform.platform(), 'cpu_count': os.cpu_count(),
+            'python': platform.python_version(), 'numpy': np.__version__, 'commit': commit}
+
+
+def compare(results, previous, factor):
+    """Print the benchmarks slower than factor times their previous time. Returns their number"""
+    n_regressions = 0
+    for key in sorted(results):
+        if key not in previous:
+            continue
+        ratio = results[key] / previous[key]
+        if ratio > factor:
+            n_regressions += 1
+            print('REGRESSION {:<80} {:10.4f} s -> {:10.4f} s  x{:.2f}'.format(key, previous[key], results[key], ratio))
+    return n_regressions
+
+
+def main(main_args=None):
+    args = parse_args(main_args)
+    output = os.path.abspath(args.output) if args.output else None
+    previous = None
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            previous = json.load(f)['results']
+    # The fixtures are written in the current directory : use a temporary one
+    cwd = os.getcwd()
+    tmp_dir = tempfile.mkdtemp(prefix='benchmarks.')
+    os.chdir(tmp_dir)
+    try:
+        results = run(args.bench, args.max_size, args.repeat)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    if output:
+        with open(output, 'w') as f:
+            json.dump({'info': machine_info(), 'max_size': args.max_size, 'results': results},
+                      f, indent=1, sort_keys=True)
+    if previous is not None and compare(results, previous, args.factor):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -12,13 +12,27 @@ from .download import set_data_dir
 from .download import get_data_dir
 
 from .higgsml import load_higgs
+from .higgsml import iter_higgs
 from .higgstautau import load_higgstautau
+from .higgstautau import iter_higgstautau
 from .higgstautau import load_htautau
 from .higgstautau import load_ztautau
+from .higgstautau import iter_htautau
+from .higgstautau import iter_ztautau
 from .baldi2016 import load_baldi2016_train_no_pile
 from .baldi2016 import load_baldi2016_train_pile
 from .baldi2016 import load_baldi2016_test_pile
 from .baldi2016 import load_baldi2016_test_no_pile
+from .baldi2016 import iter_baldi2016_train_no_pile
+from .baldi2016 import iter_baldi2016_train_pile
+from .baldi2016 import iter_baldi2016_test_pile
+from .baldi2016 import iter_baldi2016_test_no_pile
 from .mnist import load_mnist
+from .mnist import iter_mnist
+from .mnist import load_mnist_split
+from .mnist import scale_mnist
 from .magic_gamma import load_gamma_telescope
-from .pizza import make_pizza_slice
\ No newline at end of file
+from .magic_gamma import iter_gamma_telescope
+from .pizza import make_pizza_slice
+from .pizza import iter_pizza_slice
+from .loader import BatchLoader
\ No newline at end of file
@@ -1,68 +1,170 @@
 # -*- coding: utf-8 -*-
 import sys
 import os
+import numpy as np
 import pandas as pd
 import h5py
 from .download import maybe_download
 from .download import get_data_dir
 
-def load_baldi2016_train_no_pile():
+def load_baldi2016_train_no_pile(mmap=False):
     """
     Loads data from the baldi2016 dataset, and downloads it if necessary.
 
+    Args
+    ----
+        mmap: (default=False) if True the DataFrames are backed by read-only memory maps
+            of the HDF5 file instead of in-memory copies.
+
     Return
     ------
         X, y : as Dataframe, where X is the data and y is the labels
     """
     url = "http://mlphysics.ics.uci.edu/data/hepjets/highlevel/train_no_pile_10000000.h5"
     filename = os.path.join( get_data_dir(), "train_no_pile_10000000.h5" )
-    X, y = _load( filename, url )
+    X, y = _load( filename, url, mmap=mmap )
     return X, y
 
-def load_baldi2016_train_pile():
+def load_baldi2016_train_pile(mmap=False):
     """
     Loads data from the baldi2016 dataset, and downloads it if necessary.
 
+    Args
+    ----
+        mmap: (default=False) if True the DataFrames are backed by read-only memory maps
+            of the HDF5 file instead of in-memory copies.
+
     Return
     ------
         X, y : as Dataframe, where X is the data and y is the labels
     """
     url = "http://mlphysics.ics.uci.edu/data/hepjets/highlevel/train_pile_10000000.h5"
     filename = os.path.join( get_data_dir(), "train_pile_10000000.h5" )
-    X, y = _load( filename, url )
+    X, y = _load( filename, url, mmap=mmap )
     return X, y
 
-def load_baldi2016_test_pile():
+def load_baldi2016_test_pile(mmap=False):
     """
     Loads data from the baldi2016 dataset, and downloads it if necessary.
 
+    Args
+    ----
+        mmap: (default=False) if True the DataFrames are backed by read-only memory maps
+            of the HDF5 file instead of in-memory copies.
+
     Return
     ------
         X, y : as Dataframe, where X is the data and y is the labels
     """
     url = "http://mlphysics.ics.uci.edu/data/hepjets/highlevel/test_pile_5000000.h5"
     filename = os.path.join( get_data_dir(), "test_pile_5000000.h5" )
-    X, y = _load( filename, url )
+    X, y = _load( filename, url, mmap=mmap )
     return X, y
 
-def load_baldi2016_test_no_pile():
+def load_baldi2016_test_no_pile(mmap=False):
     """
     Loads data from the baldi2016 dataset, and downloads it if necessary.
 
+    Args
+    ----
+        mmap: (default=False) if True the DataFrames are backed by read-only memory maps
+            of the HDF5 file instead of in-memory copies.
+
     Return
     ------
         X, y : as Dataframe, where X is the data and y is the labels
     """
     url = "http://mlphysics.ics.uci.edu/data/hepjets/highlevel/test_no_pile_5000000.h5"
     filename = os.path.join( get_data_dir(), "test_no_pile_5000000.h5" )
-    X, y = _load( filename, url )
+    X, y = _load( filename, url, mmap=mmap )
     return X, y
 
+def iter_baldi2016_train_no_pile(chunksize=100000):
+    """
+    Iterates over the baldi2016 dataset by chunks of rows, and downloads it if necessary.
+    Only one chunk at a time is read from the HDF5 file.
+
+    Yield
+    -----
+        X, y : as Dataframe, a chunk of the data and the corresponding labels
+    """
+    url = "http://mlphysics.ics.uci.edu/data/hepjets/highlevel/train_no_pile_10000000.h5"
+    filename = os.path.join( get_data_dir(), "train_no_pile_10000000.h5" )
+    return _iter( filename, url, chunksize )
+
+def iter_baldi2016_train_pile(chunksize=100000):
+    """
+    Iterates over the baldi2016 dataset by chunks of rows, and downloads it if necessary.
+    Only one chunk at a time is read from the HDF5 file.
+
+    Yield
+    -----
+        X, y : as Dataframe, a chunk of the data and the corresponding labels
+    """
+    url = "http://mlphysics.ics.uci.edu/data/hepjets/highlevel/train_pile_10000000.h5"
+    filename = os.path.join( get_data_dir(), "train_pile_10000000.h5" )
+    return _iter( filename, url, chunksize )
+
+def iter_baldi2016_test_pile(chunksize=100000):
+    """
+    Iterates over the baldi2016 dataset by chunks of rows, and downloads it if necessary.
+    Only one chunk at a time is read from the HDF5 file.
+
+    Yield
+    -----
+        X, y : as Dataframe, a chunk of the data and the corresponding labels
+    """
+    url = "http://mlphysics.ics.uci.edu/data/hepjets/highlevel/test_pile_5000000.h5"
+    filename = os.path.join( get_data_dir(), "test_pile_5000000.h5" )
+    return _iter( filename, url, chunksize )
 
-def _load(filename, url):
+def iter_baldi2016_test_no_pile(chunksize=100000):
+    """
+    Iterates over the baldi2016 dataset by chunks of rows, and downloads it if necessary.
+    Only one chunk at a time is read from the HDF5 file.
+
+    Yield
+    -----
+        X, y : as Dataframe, a chunk of the data and the corresponding labels
+    """
+    url = "http://mlphysics.ics.uci.edu/data/hepjets/highlevel/test_no_pile_5000000.h5"
+    filename = os.path.join( get_data_dir(), "test_no_pile_5000000.h5" )
+    return _iter( filename, url, chunksize )
+
+
+COLUMNS = ["$m_{trim}$","$τ_{21}^{β=1}$","$C_2^{β=1}$","$C_2^{β=2}$","$D_2^{β=1}$","$D_2^{β=2}$"]
+
+def _load(filename, url, mmap=False):
     maybe_download(filename, url)
-    file = h5py.File(filename,'r')
-    columns = ["$m_{trim}$","$τ_{21}^{β=1}$","$C_2^{β=1}$","$C_2^{β=2}$","$D_2^{β=1}$","$D_2^{β=2}$"]
-    X = pd.DataFrame(file["features"].value, columns=columns)
-    y = pd.DataFrame(file["targets"].value.ravel())
+    with h5py.File(filename,'r') as file:
+        features = _read_dataset(filename, file["features"], mmap=mmap)
+        targets = _read_dataset(filename, file["targets"], mmap=mmap)
+    X = pd.DataFrame(features, columns=COLUMNS, copy=False)
+    y = pd.DataFrame(targets.ravel(), copy=False)
     return X, y
+
+def _read_dataset(filename, dataset, mmap=False):
+    """
+    Read a HDF5 dataset. If mmap is True and the dataset is stored contiguously
+    (not chunked hence not compressed) it is memory mapped read-only so that
+    several processes share the page cache.
+    Falls back to a full read otherwise.
+    """
+    if mmap and dataset.chunks is None:
+        offset = dataset.id.get_offset()
+        if offset is not None:
+            return np.memmap(filename, dtype=dataset.dtype, mode='r', offset=offset, shape=dataset.shape)
+    return dataset[()]
+
+def _iter(filename, url, chunksize):
+    maybe_download(filename, url)
+    with h5py.File(filename,'r') as file:
+        features = file["features"]
+        targets = file["targets"]
+        n_rows = features.shape[0]
+        for start in range(0, n_rows, chunksize):
+            stop = min(start + chunksize, n_rows)
+            index = pd.RangeIndex(start, stop)
+            X = pd.DataFrame(features[start:stop], columns=COLUMNS, index=index)
+            y = pd.DataFrame(targets[start:stop].ravel(), index=index)
+            yield X, y
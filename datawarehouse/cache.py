@@ -0,0 +1,599 @@
+# coding: utf-8
+"""
+Columnar binary cache for the text datasets.
+
+A cache is a directory next to the source file holding one raw ``.npy`` file per column
+and a ``manifest.json`` describing the columns and the source file it was built from.
+String columns are stored as integer codes, the categories are kept in the manifest.
+The cache is rebuilt automatically when the source file changes (size, mtime and SHA-256).
+"""
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import os
+import json
+import shutil
+import struct
+import tempfile
+import warnings
+
+import pandas as pd
+import numpy as np
+
+from .download import sha256sum
+
+CACHE_VERSION = 1
+MANIFEST = "manifest.json"
+
+
+def get_cache_dir(filename):
+    """
+    Default cache directory of the given source file.
+    """
+    return filename + ".cache"
+
+
+def source_info(filename, checksum=True):
+    """
+    Description of a source file used to detect its changes : name, size, modification time
+    and (if checksum is True) SHA-256 hex digest.
+    """
+    stat = os.stat(filename)
+    info = {"name": os.path.basename(filename),
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+            }
+    if checksum:
+        info["sha256"] = sha256sum(filename)
+    return info
+
+
+def _column_path(cache_dir, name):
+    # escape the path separators of column names like 'Pt/Pt' (tautau datasets)
+    name = str(name).replace("%", "%25").replace("/", "%2F").replace("\\", "%5C")
+    return os.path.join(cache_dir, "{}.npy".format(name))
+
+
+def read_manifest(cache_dir):
+    """
+    Read the manifest of the given cache directory.
+    Returns None if there is no (readable) manifest.
+    """
+    try:
+        with open(os.path.join(cache_dir, MANIFEST), 'r') as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def _make_tmp_dir(cache_dir):
+    """
+    Make the temporary directory of a cache, next to it, renamed into cache_dir once complete.
+    mkdtemp creates it with mode 0700 : it is given the default mode (umask) of a new directory
+    so that a shared data directory stays readable by the other users.
+    """
+    parent = os.path.dirname(os.path.abspath(cache_dir))
+    tmp_dir = tempfile.mkdtemp(prefix=os.path.basename(cache_dir) + ".", suffix=".tmp", dir=parent)
+    umask = os.umask(0)
+    os.umask(umask)
+    os.chmod(tmp_dir, 0o777 & ~umask)
+    return tmp_dir
+
+
+def _write_manifest(cache_dir, manifest):
+    tmp = os.path.join(cache_dir, MANIFEST + ".tmp")
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f, indent=1)
+    os.rename(tmp, os.path.join(cache_dir, MANIFEST))
+
+
+def is_cache_valid(cache_dir, filename):
+    """
+    Check that the cache was built from the current version of the source file.
+
+    The size and modification time are checked first.
+    If only the modification time changed the SHA-256 checksum decides
+    (and the manifest is refreshed to avoid recomputing it at next call).
+    """
+    manifest = read_manifest(cache_dir)
+    if manifest is None or manifest.get("version") != CACHE_VERSION:
+        return False
+    source = manifest.get("source")
+    if source is None:
+        return False
+    current = source_info(filename, checksum=False)
+    if current["size"] != source["size"]:
+        return False
+    if current["mtime"] == source["mtime"]:
+        return True
+    if sha256sum(filename) != source["sha256"]:
+        return False
+    source["mtime"] = current["mtime"]
+    try:
+        _write_manifest(cache_dir, manifest)
+    except (IOError, OSError):
+        pass
+    return True
+
+
+def write_cache(cache_dir, data, source=None):
+    """
+    Write the given DataFrame into a columnar cache directory.
+
+    The cache is first written in a temporary directory which is then renamed,
+    so that concurrent readers never see a half written cache.
+
+    Args
+    ----
+        cache_dir: the cache directory.
+        data: the dataset as a pandas.DataFrame.
+        source: (default=None) the source file the data was read from.
+            Used to invalidate the cache when the source changes.
+    """
+    tmp_dir = _make_tmp_dir(cache_dir)
+    try:
+        manifest = {"version": CACHE_VERSION,
+                    "source": None if source is None else source_info(source),
+                    "nrows": len(data),
+                    "columns": [],
+                    }
+        for name in data.columns:
+            col = data[name]
+            entry = {"name": name, "dtype": str(col.dtype)}
+            if col.dtype.kind in "biuf":
+                values = col.to_numpy()
+            else:
+                codes, categories = pd.factorize(col)
+                values = codes.astype(np.min_scalar_type(-len(categories)))
+                entry["categories"] = [str(c) for c in categories]
+            np.save(_column_path(tmp_dir, name), np.ascontiguousarray(values))
+            manifest["columns"].append(entry)
+        _write_manifest(tmp_dir, manifest)
+        if os.path.isdir(cache_dir):
+            shutil.rmtree(cache_dir, ignore_errors=True)
+        try:
+            os.rename(tmp_dir, cache_dir)
+        except OSError:
+            # Another process built the cache in the meantime. Keep its version.
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+
+class CacheWriter(object):
+    """
+    Write a columnar cache directory chunk by chunk, without knowing the number of rows in advance.
+    Only one chunk at a time is held in memory.
+
+    The columns are appended to their .npy files after a fixed size header which is rewritten
+    with the final number of rows by close(). The cache is written in a temporary directory
+    renamed by close() (abort() drops it).
+
+    The string columns should be pandas.Categorical with the same categories in every chunk
+    (stored as the smallest integer codes). Other non numeric columns are stored as int32 codes
+    with the categories found along the way.
+    """
+    HEADER_SIZE = 128
+
+    def __init__(self, cache_dir, source=None):
+        """
+        Args
+        ----
+            cache_dir: the cache directory.
+            source: (default=None) the source file the data was made from (see write_cache).
+        """
+        self.cache_dir = cache_dir
+        self.source = source
+        self.tmp_dir = _make_tmp_dir(cache_dir)
+        self.entries = None
+        self.files = {}
+        self.dtypes = {}
+        self.lookups = {}
+        self.nrows = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def _open(self, data):
+        self.entries = []
+        for name in data.columns:
+            col = data[name]
+            entry = {"name": name, "dtype": str(col.dtype)}
+            if col.dtype.kind in "biuf":
+                dtype = col.dtype
+            elif isinstance(col.dtype, pd.CategoricalDtype):
+                entry["dtype"] = "object"
+                entry["categories"] = [str(c) for c in col.cat.categories]
+                dtype = np.min_scalar_type(-len(entry["categories"]))
+            else:
+                entry["dtype"] = "object"
+                entry["categories"] = []
+                self.lookups[name] = {}
+                dtype = np.int32
+            self.dtypes[name] = np.dtype(dtype)
+            f = open(_column_path(self.tmp_dir, name), 'wb')
+            f.write(_npy_header(self.dtypes[name], 0, self.HEADER_SIZE))
+            self.files[name] = f
+            self.entries.append(entry)
+
+    def write(self, data):
+        """Append the rows of the given pandas.DataFrame"""
+        if self.entries is None:
+            self._open(data)
+        for entry in self.entries:
+            name = entry["name"]
+            col = data[name]
+            if name in self.lookups:
+                lookup = self.lookups[name]
+                codes, uniques = pd.factorize(col)
+                # trailing -1 : the code of missing values
+                mapping = np.array([lookup.setdefault(str(u), len(lookup)) for u in uniques] + [-1],
+                                   dtype=np.int32)
+                values = mapping[codes]
+                entry["categories"] = list(lookup)
+            elif "categories" in entry:
+                if [str(c) for c in col.cat.categories] != entry["categories"]:
+                    raise ValueError("The categories of {} changed between chunks".format(name))
+                values = col.cat.codes.to_numpy()
+            else:
+                values = col.to_numpy()
+            self.files[name].write(np.ascontiguousarray(values, dtype=self.dtypes[name]).tobytes())
+        self.nrows += len(data)
+
+    def close(self):
+        """Finalize the .npy files and the manifest, then move the cache to its place"""
+        try:
+            for name, f in self.files.items():
+                f.seek(0)
+                f.write(_npy_header(self.dtypes[name], self.nrows, self.HEADER_SIZE))
+                f.close()
+            manifest = {"version": CACHE_VERSION,
+                        "source": None if self.source is None else source_info(self.source),
+                        "nrows": self.nrows,
+                        "columns": self.entries or [],
+                        }
+            _write_manifest(self.tmp_dir, manifest)
+            if os.path.isdir(self.cache_dir):
+                shutil.rmtree(self.cache_dir, ignore_errors=True)
+            try:
+                os.rename(self.tmp_dir, self.cache_dir)
+            except OSError:
+                # Another process built the cache in the meantime. Keep its version.
+                shutil.rmtree(self.tmp_dir, ignore_errors=True)
+        except BaseException:
+            self.abort()
+            raise
+
+    def abort(self):
+        """Drop the partially written cache"""
+        for f in self.files.values():
+            f.close()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+
+def _npy_header(dtype, n_rows, size):
+    """A .npy (version 1.0) header of exactly size bytes for a 1D array"""
+    header = "{{'descr': {!r}, 'fortran_order': False, 'shape': ({},), }}".format(
+        np.lib.format.dtype_to_descr(dtype), n_rows)
+    magic = np.lib.format.magic(1, 0)
+    padding = size - len(magic) - 2 - len(header) - 1
+    if padding < 0:
+        raise ValueError("The .npy header does not fit in {} bytes".format(size))
+    header = header + ' ' * padding + '\n'
+    return magic + struct.pack('<H', len(header)) + header.encode('latin1')
+
+
+def write_cache_chunks(cache_dir, chunks, n_rows=None, source=None):
+    """
+    Write a dataset given chunk by chunk into a columnar cache directory (see CacheWriter).
+    Only one chunk at a time is held in memory.
+
+    Args
+    ----
+        cache_dir: the cache directory.
+        chunks: iterable of pandas.DataFrame with the same columns and dtypes.
+        n_rows: (default=None) the expected total number of rows (checked). None means unknown.
+        source: (default=None) the source file the data was made from (see write_cache).
+    """
+    with CacheWriter(cache_dir, source=source) as writer:
+        for data in chunks:
+            writer.write(data)
+        if n_rows is not None and writer.nrows != n_rows:
+            raise ValueError("The chunks contain {} rows, expected n_rows={}".format(writer.nrows, n_rows))
+
+
+def _decode_column(entry, values):
+    categories = entry.get("categories")
+    if categories is None:
+        return values
+    # code -1 is a missing value and lands on the trailing NaN
+    lookup = np.empty(len(categories) + 1, dtype=object)
+    lookup[:-1] = categories
+    lookup[-1] = np.nan
+    decoded = lookup[values]
+    if entry["dtype"] != "object":
+        decoded = pd.array(decoded, dtype=entry["dtype"])
+    return decoded
+
+
+# Comparison operators of the row filters
+_OPERATORS = {'==': np.equal,
+              '!=': np.not_equal,
+              '<': np.less,
+              '<=': np.less_equal,
+              '>': np.greater,
+              '>=': np.greater_equal,
+              'in': np.isin,
+              'not in': lambda values, other: np.isin(values, other, invert=True),
+              }
+
+
+def _check_filters(filters):
+    for name, op, value in filters:
+        if op not in _OPERATORS:
+            raise ValueError("Unknown filter operator {!r} (expected one of {})".format(op, sorted(_OPERATORS)))
+
+
+def filter_columns(filters):
+    """
+    The column names used by the given row filters.
+    """
+    return [name for name, op, value in filters]
+
+
+def filter_mask(data, filters):
+    """
+    Evaluate row filters on a pandas.DataFrame.
+
+    Args
+    ----
+        data: the dataset as a pandas.DataFrame (must contain the filtered columns).
+        filters: list of (column, operator, value) tuples combined with a logical and.
+            operator is one of '==', '!=', '<', '<=', '>', '>=', 'in', 'not in'.
+            Example : [('KaggleSet', '==', 't'), ('PRI_jet_num', '>=', 2)]
+
+    Return
+    ------
+        mask: boolean numpy array of the kept rows
+    """
+    _check_filters(filters)
+    mask = np.ones(len(data), dtype=bool)
+    for name, op, value in filters:
+        mask &= _OPERATORS[op](np.asarray(data[name]), value)
+    return mask
+
+
+def _cache_filter_mask(cache_dir, entries, filters, nrows, rows=None):
+    """Evaluate the row filters on the memory mapped columns of the cache (at the given rows)."""
+    _check_filters(filters)
+    mask = np.ones(nrows if rows is None else len(rows), dtype=bool)
+    for name, op, value in filters:
+        entry = entries[name]
+        values = np.load(_column_path(cache_dir, name), mmap_mode='r')
+        values = values[:nrows] if rows is None else values[rows]
+        categories = entry.get("categories")
+        if categories is not None and op in ('==', '!=', 'in', 'not in'):
+            # Compare the integer codes instead of decoding the strings
+            wanted = set(str(v) for v in ([value] if op in ('==', '!=') else value))
+            codes = [i for i, c in enumerate(categories) if c in wanted]
+            keep = np.isin(values, codes, invert=op in ('!=', 'not in'))
+        else:
+            keep = _OPERATORS[op](np.asarray(_decode_column(entry, values)), value)
+        mask &= keep
+    return mask
+
+
+def _as_slice(rows):
+    """The slice equivalent to the sorted row numbers if they are contiguous, else None"""
+    if len(rows) == 0:
+        return slice(0, 0)
+    start, stop = int(rows[0]), int(rows[-1]) + 1
+    if stop - start == len(rows):
+        return slice(start, stop)
+    return None
+
+
+def read_cache(cache_dir, columns=None, mmap_mode=None, nrows=None, filters=None, rows=None):
+    """
+    Read a columnar cache directory.
+
+    Only the requested columns and rows are read from the disk : the filters are evaluated
+    on the memory mapped columns and the other columns are gathered at the kept rows.
+    A contiguous selection of rows is read as a slice (a view with mmap_mode='r').
+
+    Args
+    ----
+        cache_dir: the cache directory.
+        columns: (default=None) the columns to read. None means every column.
+        mmap_mode: (default=None) given to numpy.load. Use 'r' to memory map the numeric columns
+            (not possible if the kept rows are not contiguous since they are gathered).
+        nrows: (default=None) only read the first nrows rows. None means every row.
+        filters: (default=None) list of (column, operator, value) row filters (see filter_mask).
+        rows: (default=None) sorted row numbers to read (see cached_rows). None means every row.
+
+    Return
+    ------
+        data: the dataset as a pandas.DataFrame (indexed by row number)
+    """
+    manifest = read_manifest(cache_dir)
+    if manifest is None:
+        raise IOError("No cache found in {}".format(cache_dir))
+    entries = {entry["name"]: entry for entry in manifest["columns"]}
+    if columns is None:
+        columns = [entry["name"] for entry in manifest["columns"]]
+    n_rows = manifest["nrows"] if nrows is None else min(nrows, manifest["nrows"])
+    if rows is not None:
+        rows = rows[:np.searchsorted(rows, n_rows)]
+    if filters:
+        mask = _cache_filter_mask(cache_dir, entries, filters, n_rows, rows)
+        rows = np.flatnonzero(mask) if rows is None else rows[mask]
+    if rows is None:
+        selection = slice(0, n_rows)
+        index = pd.RangeIndex(0, n_rows)
+    else:
+        selection = _as_slice(rows)
+        if selection is None:
+            selection = rows
+            index = pd.Index(rows)
+        else:
+            index = pd.RangeIndex(selection.start, selection.stop)
+    data = {}
+    for name in columns:
+        values = np.load(_column_path(cache_dir, name), mmap_mode='r')
+        if mmap_mode is None or isinstance(selection, np.ndarray):
+            # copy in memory only the selected rows
+            values = np.array(values[selection])
+        else:
+            values = values[selection]
+        data[name] = _decode_column(entries[name], values)
+    return pd.DataFrame(data, columns=columns, index=index)
+
+
+def cached_rows(filename, name, column, values, cache_dir=None):
+    """
+    The row numbers of the cached csv file where the given column is in values.
+
+    The row numbers are computed once and saved in the cache directory as rows_<name>.npy
+    (they are dropped with the cache when the source file changes).
+    The cache is built if necessary.
+
+    Args
+    ----
+        filename: the csv file.
+        name: the name of the row selection (used for the file name).
+        column: the column name.
+        values: the list of accepted values.
+        cache_dir: (default=None) the cache directory. None means next to the source file.
+
+    Return
+    ------
+        rows: sorted numpy array of row numbers (memory mapped)
+    """
+    if cache_dir is None:
+        cache_dir = get_cache_dir(filename)
+    path = os.path.join(cache_dir, "rows_{}.npy".format(name))
+    if os.path.exists(path) and is_cache_valid(cache_dir, filename):
+        return np.load(path, mmap_mode='r')
+    selected = load_cached_csv(filename, cache_dir=cache_dir, columns=[column],
+                               filters=[(column, 'in', list(values))])
+    rows = np.asarray(selected.index, dtype=np.int64)
+    try:
+        tmp = path + ".tmp.npy"
+        np.save(tmp, rows)
+        os.rename(tmp, path)
+    except (IOError, OSError) as e:
+        warnings.warn("Could not write the row index {} : {}".format(path, e), RuntimeWarning)
+    return rows
+
+
+def read_csv_filtered(filename, columns=None, nrows=None, filters=None, chunksize=100000, **kwargs):
+    """
+    Read a csv file keeping only the given columns and the rows passing the filters.
+
+    Only the requested and filtered columns are parsed. The filters are applied chunk
+    by chunk so that the rejected rows are never held in memory all together.
+
+    Args
+    ----
+        filename: the csv file.
+        columns: (default=None) the columns to read. None means every column.
+        nrows: (default=None) only read the first nrows rows of the file. None means every row.
+        filters: (default=None) list of (column, operator, value) row filters (see filter_mask).
+        chunksize: (default=100000) the number of rows parsed at once when filtering.
+        kwargs: given to pandas.read_csv.
+
+    Return
+    ------
+        data: the dataset as a pandas.DataFrame (indexed by row number)
+    """
+    if not filters:
+        return pd.read_csv(filename, usecols=columns, nrows=nrows, **kwargs)
+    usecols = None
+    if columns is not None:
+        usecols = list(columns) + [name for name in filter_columns(filters) if name not in columns]
+    chunks = []
+    for data in pd.read_csv(filename, usecols=usecols, nrows=nrows, chunksize=chunksize, **kwargs):
+        chunks.append(data[filter_mask(data, filters)])
+    data = pd.concat(chunks)
+    if columns is not None:
+        data = data[list(columns)]
+    return data
+
+
+def load_cached_csv(filename, cache_dir=None, columns=None, nrows=None, filters=None, rows=None, **kwargs):
+    """
+    Load a csv file through its columnar cache.
+    The cache is built at first call (or when the source file changed).
+
+    Args
+    ----
+        filename: the csv file.
+        cache_dir: (default=None) the cache directory. None means next to the source file.
+        columns: (default=None) the columns to read. None means every column.
+        nrows: (default=None) only read the first nrows rows. None means every row.
+        filters: (default=None) list of (column, operator, value) row filters (see filter_mask).
+        rows: (default=None) sorted row numbers to read (see cached_rows). None means every row.
+        kwargs: given to pandas.read_csv when building the cache.
+
+    Return
+    ------
+        data: the dataset as a pandas.DataFrame
+    """
+    if cache_dir is None:
+        cache_dir = get_cache_dir(filename)
+    if is_cache_valid(cache_dir, filename):
+        return read_cache(cache_dir, columns=columns, nrows=nrows, filters=filters, rows=rows)
+    data = pd.read_csv(filename, **kwargs)
+    try:
+        write_cache(cache_dir, data, source=filename)
+    except (IOError, OSError) as e:
+        warnings.warn("Could not write the cache {} : {}".format(cache_dir, e), RuntimeWarning)
+    if columns is None and nrows is None and not filters and rows is None:
+        return data
+    if rows is not None:
+        data = data.take(rows)
+    if nrows is not None:
+        data = data[data.index < nrows]
+    if filters:
+        data = data[filter_mask(data, filters)]
+    if columns is not None:
+        data = data[list(columns)]
+    return data
+
+
+def iter_cache(cache_dir, chunksize=100000, columns=None):
+    """
+    Iterate over a columnar cache directory by chunks of rows.
+    The columns are memory mapped so only one chunk at a time is held in memory.
+
+    Args
+    ----
+        cache_dir: the cache directory.
+        chunksize: (default=100000) the number of rows per chunk.
+        columns: (default=None) the columns to read. None means every column.
+
+    Yield
+    -----
+        data: a chunk of the dataset as a pandas.DataFrame (indexed by row number)
+    """
+    manifest = read_manifest(cache_dir)
+    if manifest is None:
+        raise IOError("No cache found in {}".format(cache_dir))
+    entries = {entry["name"]: entry for entry in manifest["columns"]}
+    if columns is None:
+        columns = [entry["name"] for entry in manifest["columns"]]
+    arrays = [np.load(_column_path(cache_dir, name), mmap_mode='r') for name in columns]
+    n_rows = manifest["nrows"]
+    for start in range(0, n_rows, chunksize):
+        stop = min(start + chunksize, n_rows)
+        data = {name: _decode_column(entries[name], np.array(values[start:stop]))
+                for name, values in zip(columns, arrays)}
+        yield pd.DataFrame(data, columns=columns, index=pd.RangeIndex(start, stop))
@@ -1,16 +1,36 @@
 # -*- coding: utf-8 -*-
-import sys
 import os
-
-if sys.version_info[0] == 2:
-    from urllib import urlretrieve
-else:
-    from urllib.request import urlretrieve
+import re
+import json
+import shutil
+import hashlib
+import threading
+import warnings
+from urllib.request import urlopen, Request
+from urllib.error import HTTPError
 
 DATA_DIR = os.path.join(os.path.expanduser('~'), 'datawarehouse')
 if not os.path.isdir(DATA_DIR):
     os.mkdir(DATA_DIR)
 
+# Known checksums of the downloaded files (by file name) : SHA-256 hex digests,
+# or "md5:<hex digest>" when only the MD5 is published.
+# More checksums can be given in a checksums.json file in the data directory. The first download
+# of a file without a known checksum cannot be verified (a warning says so) : its SHA-256 is
+# recorded there, so that the next downloads (after a deletion or a corruption) are verified against it.
+CHECKSUMS = {
+    # MNIST (the published MD5 of the files)
+    'train-images-idx3-ubyte.gz': 'md5:f68b3c2dcbeaaa9fbdd348bbdeb94873',
+    'train-labels-idx1-ubyte.gz': 'md5:d53e105ee54ea40749a09fcbcd1e9432',
+    't10k-images-idx3-ubyte.gz': 'md5:9fb629c4189551a2d022fa330f9573f3',
+    't10k-labels-idx1-ubyte.gz': 'md5:ec29112dd5afa0611ce80d1b7f02629c',
+    }
+CHECKSUMS_FILE = "checksums.json"
+# Size and modification time of the files already verified against their checksum
+# (the existing files are hashed only once, not at every call)
+VERIFIED_FILE = "verified.json"
+_CHECKSUMS_LOCK = threading.Lock() # concurrent downloads (maybe_download_all) record their checksums
+
 def get_data_dir():
     return DATA_DIR
 
@@ -23,8 +43,201 @@ def set_data_dir(new_data_dir):
         DATA_DIR = new_data_dir
     print('new directory', DATA_DIR)
 
-def maybe_download(filename, url):
-    if not os.path.exists(filename):
-        print("downloading " + filename + "...", end='')
-        urlretrieve(url, filename)
-        print("Done.")
+def get_checksum(filename):
+    """
+    Returns the expected checksum of the given file (from CHECKSUMS or the checksums.json
+    file of the data directory) or None if unknown.
+    """
+    name = os.path.basename(filename)
+    if name in CHECKSUMS:
+        return CHECKSUMS[name]
+    return _read_checksums().get(name)
+
+def _read_checksums():
+    return _read_json(CHECKSUMS_FILE)
+
+def _read_json(name):
+    try:
+        with open(os.path.join(get_data_dir(), name), 'r') as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):
+        return {}
+
+def _record(name, key, value):
+    """Set key to value in the json file name of the data directory"""
+    with _CHECKSUMS_LOCK:
+        content = _read_json(name)
+        content[key] = value
+        path = os.path.join(get_data_dir(), name)
+        try:
+            with open(path + ".tmp", 'w') as f:
+                json.dump(content, f, indent=1, sort_keys=True)
+            os.replace(path + ".tmp", path)
+        except (IOError, OSError):
+            pass # only a protection for the next downloads
+
+def _record_checksum(filename, sha256):
+    """Add the SHA-256 of a downloaded file to the checksums.json file of the data directory"""
+    _record(CHECKSUMS_FILE, os.path.basename(filename), sha256)
+
+def _file_state(filename, checksum):
+    stat = os.stat(filename)
+    return [checksum, stat.st_size, stat.st_mtime_ns]
+
+def _record_verified(filename, checksum):
+    _record(VERIFIED_FILE, os.path.basename(filename), _file_state(filename, checksum))
+
+def _is_verified(filename, checksum):
+    """True if filename was verified against checksum and has not changed since"""
+    return _read_json(VERIFIED_FILE).get(os.path.basename(filename)) == _file_state(filename, checksum)
+
+_CHECKSUM_FORMAT = re.compile(r"^(md5:[0-9a-f]{32}|[0-9a-f]{64})$")
+
+def check_checksum_format(checksum):
+    """Raise ValueError if checksum is neither a SHA-256 hex digest nor "md5:<hex digest>" """
+    if not _CHECKSUM_FORMAT.match(checksum):
+        raise ValueError("Invalid checksum {!r} : expected a SHA-256 hex digest or "
+                         "'md5:<hex digest>' (lower case)".format(checksum))
+
+def file_checksum(filename, checksum):
+    """
+    Compute the checksum of the given file in the format of the expected checksum
+    ("md5:<hex digest>" or a SHA-256 hex digest).
+    """
+    if checksum.startswith("md5:"):
+        return "md5:" + hashsum(filename, hashlib.md5())
+    return sha256sum(filename)
+
+def maybe_download(filename, url, checksum=None, sha256=None):
+    """
+    Download the url into filename if it does not exist yet.
+
+    The data is first written into filename + '.part' which is renamed once complete
+    and verified. An interrupted download is resumed (HTTP Range request) at next call.
+    An existing file with a known checksum is verified once (its size and modification time
+    are then recorded in the verified.json file of the data directory). If it does not match
+    (a truncated file of an older version for instance), it is downloaded again.
+    A resumed download that does not match is downloaded again from scratch.
+
+    Args
+    ----
+        filename: the destination file.
+        url: the source url.
+        checksum: (default=None) the expected checksum of the file : a SHA-256 hex digest
+            or "md5:<hex digest>". None means the one given by get_checksum. If unknown the
+            download is not verified (with a warning) and its SHA-256 is recorded in the
+            checksums.json file of the data directory.
+        sha256: (default=None) deprecated alias of checksum.
+    """
+    if sha256 is not None:
+        if checksum is not None and checksum != sha256:
+            raise ValueError("checksum and its alias sha256 are different : {} and {}".format(checksum, sha256))
+        checksum = sha256
+    if checksum is not None:
+        check_checksum_format(checksum)
+    if checksum is None:
+        checksum = get_checksum(filename)
+    part = filename + ".part"
+    if os.path.exists(filename):
+        if checksum is None or _is_verified(filename, checksum):
+            return
+        digest = file_checksum(filename, checksum)
+        if digest == checksum:
+            _record_verified(filename, checksum)
+            return
+        # Probably truncated by an interrupted download : resumed from where it stopped
+        warnings.warn("Checksum mismatch for the existing {} : expected {} got {}. "
+                      "Downloading it again.".format(filename, checksum, digest), RuntimeWarning)
+        os.replace(filename, part)
+    print("downloading " + filename + "...")
+    resumed = os.path.exists(part)
+    _fetch(url, part)
+    if checksum is not None:
+        digest = file_checksum(part, checksum)
+        if digest != checksum and resumed:
+            # The beginning of the part file was wrong : start from scratch
+            os.remove(part)
+            _fetch(url, part)
+            digest = file_checksum(part, checksum)
+        if digest != checksum:
+            os.remove(part)
+            raise IOError("Checksum mismatch for {} : expected {} got {}".format(url, checksum, digest))
+    else:
+        digest = sha256sum(part)
+        warnings.warn("No known checksum for {} : the download is not verified. Its SHA-256 {} is recorded "
+                      "in {} to verify the next downloads.".format(url, digest, CHECKSUMS_FILE), RuntimeWarning)
+        _record_checksum(filename, digest)
+        checksum = digest
+    os.replace(part, filename)
+    _record_verified(filename, checksum)
+    print("Done " + filename)
+
+def maybe_download_all(files, max_workers=4):
+    """
+    Concurrent maybe_download of several files using a thread pool.
+
+    Args
+    ----
+        files: list of (filename, url) or (filename, url, checksum) tuples.
+        max_workers: (default=4) the maximum number of simultaneous downloads.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = [pool.submit(maybe_download, *args) for args in files]
+        for future in futures:
+            future.result() # raise the download errors
+
+def _fetch(url, part, blocksize=1<<20, timeout=60):
+    """Download url into part, resuming from the current size of part if any."""
+    start = os.path.getsize(part) if os.path.exists(part) else 0
+    request = Request(url)
+    if start > 0:
+        request.add_header("Range", "bytes={}-".format(start))
+    try:
+        response = urlopen(request, timeout=timeout)
+    except HTTPError as e:
+        if e.code == 416 and start > 0:
+            # Range not satisfiable : the part file is complete only if its size is the
+            # size of the file (Content-Range: bytes */size), otherwise start again
+            if _content_range_size(e.headers) == start:
+                return
+            os.remove(part)
+            return _fetch(url, part, blocksize=blocksize, timeout=timeout)
+        raise
+    try:
+        # 206 : the server accepted the range, otherwise it sends the whole file again
+        if start > 0 and response.getcode() == 206:
+            mode, expected = 'ab', _content_range_size(response.headers)
+        else:
+            mode, expected = 'wb', response.headers.get("Content-Length")
+        with open(part, mode) as f:
+            shutil.copyfileobj(response, f, blocksize)
+    finally:
+        response.close()
+    size = os.path.getsize(part)
+    if expected is not None and size != int(expected):
+        raise IOError("Incomplete download of {} : got {} bytes, expected {}. "
+                      "Call again to resume.".format(url, size, expected))
+
+def _content_range_size(headers):
+    """The total size of the file given by a Content-Range header ("bytes a-b/size") or None"""
+    content_range = headers.get("Content-Range") if headers is not None else None
+    if not content_range or "/" not in content_range:
+        return None
+    size = content_range.rsplit("/", 1)[1].strip()
+    return int(size) if size.isdigit() else None
+
+def sha256sum(filename, blocksize=1<<20):
+    """
+    Compute the SHA-256 hex digest of the given file (read by blocks).
+    """
+    return hashsum(filename, hashlib.sha256(), blocksize=blocksize)
+
+def hashsum(filename, hasher, blocksize=1<<20):
+    """
+    Compute the hex digest of the given file (read by blocks) with the given hashlib object.
+    """
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(blocksize), b''):
+            hasher.update(block)
+    return hasher.hexdigest()
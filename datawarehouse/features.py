@@ -0,0 +1,332 @@
+# coding: utf-8
+"""
+Registry of the derived features of the HiggsML dataset.
+
+Every feature (or intermediate quantity like the 4-vectors) is registered with the
+names of its dependencies : raw columns of the dataset or other registered quantities.
+compute(data, names) evaluates only the needed part of the dependency graph, each node once,
+so that intermediates (vlep, vltau, the phi differences, ...) are shared between features.
+
+Computed features can be cached. The cache key is the fingerprint (blake2b hash) of the raw
+columns the feature depends on, so a feature is recomputed as soon as one of its input
+columns changes, and only then. The cache holds full length arrays : it is bounded by a number
+of features and a number of bytes. The cache of the global REGISTRY is disabled by default
+(maxsize=0), enable it with REGISTRY.set_cache_size and free it with clear().
+
+The DER features are recomputed from the PRI columns like in tau_energy_scale
+(same approximations, missing jet values and rounding to 3 decimals).
+DER_mass_MMC cannot be recomputed and is not registered.
+"""
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import hashlib
+from collections import OrderedDict
+
+import pandas as pd
+import numpy as np
+
+from .fourvector import V4Array
+from .higgsml import METphi_centrality
+from .higgsml import eta_centrality
+from .higgsml import normalize_weight
+from .higgsml import phi_differences
+from .higgsml import RADIANS
+from .higgsml import radian_from_differences
+from .higgsml import DECIMALS
+
+
+class FeatureRegistry(object):
+    """
+    A set of named quantities with declared dependencies, and the cache of their values.
+    """
+    def __init__(self, maxsize=64, max_bytes=2**30):
+        """
+        Args
+        ----
+            maxsize: (default=64) the maximum number of cached feature values
+                (the least recently used are dropped first). 0 disables the cache.
+            max_bytes: (default=2**30) the maximum total size in bytes of the cached values.
+                None means no limit.
+        """
+        self.nodes = {}
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._cache = OrderedDict()
+        self._columns = {}
+
+    def register(self, name, depends, intermediate=False):
+        """
+        Decorator registering a function computing the quantity name.
+        The function receives the values of the dependencies as positional arguments.
+
+        Args
+        ----
+            name: the name of the quantity.
+            depends: the names of the dependencies (raw columns or registered quantities).
+            intermediate: (default=False) if True the quantity is shared inside a call to
+                compute but is neither cached nor returned (for heavy objects like 4-vectors).
+        """
+        def decorator(func):
+            self.nodes[name] = (tuple(depends), func, intermediate)
+            self._columns.clear()
+            return func
+        return decorator
+
+    def features(self):
+        """The names of the registered features (intermediates excluded)"""
+        return sorted(name for name, (depends, func, intermediate) in self.nodes.items() if not intermediate)
+
+    def columns(self, name):
+        """The raw columns needed to compute the given quantity"""
+        try:
+            return self._columns[name]
+        except KeyError:
+            pass
+        if name not in self.nodes:
+            columns = (name,)
+        else:
+            depends = self.nodes[name][0]
+            columns = tuple(sorted(set(c for dep in depends for c in self.columns(dep))))
+        self._columns[name] = columns
+        return columns
+
+    def set_cache_size(self, maxsize=64, max_bytes=2**30):
+        """Change the bounds of the cache (see __init__), dropping the values beyond them"""
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self._shrink()
+
+    def clear(self):
+        """Drop every cached value"""
+        self._cache.clear()
+        self.nbytes = 0
+
+    def _shrink(self):
+        while self._cache and (len(self._cache) > self.maxsize or
+                               (self.max_bytes is not None and self.nbytes > self.max_bytes)):
+            key, value = self._cache.popitem(last=False)
+            self.nbytes -= value.nbytes
+
+    def compute(self, data, names, cache=True):
+        """
+        Compute the given features.
+
+        Args
+        ----
+            data: the dataset should be a pandas.DataFrame like object.
+            names: the features to compute.
+            cache: (default=True) if False ignore the cache (and do not fill it).
+                Nothing is cached when maxsize is 0.
+
+        Return
+        ------
+            features: the features as a pandas.DataFrame (same index as data)
+        """
+        cache = cache and self.maxsize > 0
+        for name in names:
+            if name not in self.nodes or self.nodes[name][2]:
+                raise KeyError("Unknown feature {!r} (available : {})".format(name, self.features()))
+        fingerprints = {}
+        values = {}
+        for name in names:
+            self._evaluate(name, data, values, fingerprints, cache)
+        return pd.DataFrame({name: values[name] for name in names}, columns=list(names), index=data.index)
+
+    def _key(self, name, data, fingerprints):
+        columns = self.columns(name)
+        for c in columns:
+            if c not in fingerprints:
+                fingerprints[c] = fingerprint(data[c])
+        return (name,) + tuple(fingerprints[c] for c in columns)
+
+    def _evaluate(self, name, data, values, fingerprints, cache):
+        if name in values:
+            return values[name]
+        if name not in self.nodes:
+            value = np.asarray(data[name])
+            values[name] = value
+            return value
+        depends, func, intermediate = self.nodes[name]
+        key = None
+        if cache and not intermediate:
+            key = self._key(name, data, fingerprints)
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                values[name] = self._cache[key]
+                return values[name]
+        value = func(*[self._evaluate(dep, data, values, fingerprints, cache) for dep in depends])
+        values[name] = value
+        if key is not None:
+            value = np.asarray(value)
+            self._cache[key] = value
+            self.nbytes += value.nbytes
+            self._shrink()
+        return value
+
+
+def fingerprint(values):
+    """
+    A hash of the content (and dtype) of an array like used as its version number.
+    """
+    values = np.asarray(values)
+    dtype = str(values.dtype)
+    if values.dtype.kind not in "biuf":
+        # strings and objects are hashed element wise first
+        values = pd.util.hash_array(values.astype(object))
+    digest = hashlib.blake2b(np.ascontiguousarray(values).view(np.uint8), digest_size=16)
+    digest.update(dtype.encode())
+    return digest.hexdigest()
+
+
+# ==================================================================================
+#  The HiggsML features
+# ==================================================================================
+# The cache is opt-in : at 10M rows every cached feature is 80 MB
+REGISTRY = FeatureRegistry(maxsize=0)
+register = REGISTRY.register
+MISSING_VALUE = -999.0
+
+
+def compute(data, names, cache=True):
+    """
+    Compute the given derived features of the HiggsML dataset (see REGISTRY.features()).
+
+    Args
+    ----
+        data: the dataset should be a pandas.DataFrame like object.
+        names: the features to compute. Example : ["DER_mass_vis", "radian_1"]
+        cache: (default=True) if False ignore the cache (and do not fill it).
+            The cache of REGISTRY is disabled unless REGISTRY.set_cache_size is called.
+
+    Return
+    ------
+        features: the features as a pandas.DataFrame (same index as data)
+    """
+    return REGISTRY.compute(data, names, cache=cache)
+
+
+def clear():
+    """Drop the cached features of REGISTRY"""
+    REGISTRY.clear()
+
+
+def _round(values):
+    return np.round(values, decimals=DECIMALS)
+
+
+# Intermediates
+@register("vtau", ["PRI_tau_pt", "PRI_tau_eta", "PRI_tau_phi"], intermediate=True)
+def _vtau(pt, eta, phi):
+    return V4Array.fromPtEtaPhiM(pt, eta, phi, 0.8) # tau mass 0.8 like in original
+
+@register("vlep", ["PRI_lep_pt", "PRI_lep_eta", "PRI_lep_phi"], intermediate=True)
+def _vlep(pt, eta, phi):
+    return V4Array.fromPtEtaPhiM(pt, eta, phi, 0.) # lep mass 0
+
+@register("vmet", ["PRI_met", "PRI_met_phi"], intermediate=True)
+def _vmet(met, phi):
+    return V4Array.fromPtEtaPhiM(met, 0., phi, 0.) # met mass zero
+
+@register("has_jet_1", ["PRI_jet_num"], intermediate=True)
+def _has_jet_1(jet_num):
+    return jet_num > 0
+
+@register("has_jet_2", ["PRI_jet_num"], intermediate=True)
+def _has_jet_2(jet_num):
+    return jet_num > 1
+
+@register("vj1", ["has_jet_1", "PRI_jet_leading_pt", "PRI_jet_leading_eta", "PRI_jet_leading_phi"], intermediate=True)
+def _vj1(has_jet, pt, eta, phi):
+    return V4Array.fromPtEtaPhiM(np.where(has_jet, pt, 0), np.where(has_jet, eta, 0), np.where(has_jet, phi, 0), 0.)
+
+@register("vj2", ["has_jet_2", "PRI_jet_subleading_pt", "PRI_jet_subleading_eta", "PRI_jet_subleading_phi"], intermediate=True)
+def _vj2(has_jet, pt, eta, phi):
+    return V4Array.fromPtEtaPhiM(np.where(has_jet, pt, 0), np.where(has_jet, eta, 0), np.where(has_jet, phi, 0), 0.)
+
+@register("vjsum", ["vj1", "vj2"], intermediate=True)
+def _vjsum(vj1, vj2):
+    return vj1 + vj2
+
+@register("vltau", ["vlep", "vtau"], intermediate=True)
+def _vltau(vlep, vtau):
+    return vlep + vtau
+
+@register("vltaumet", ["vltau", "vmet"], intermediate=True)
+def _vltaumet(vltau, vmet):
+    return vltau + vmet
+
+@register("phi_differences", ["PRI_tau_phi", "PRI_lep_phi", "PRI_met_phi"], intermediate=True)
+def _phi_differences(tau_phi, lep_phi, met_phi):
+    return phi_differences({'PRI_tau_phi': tau_phi, 'PRI_lep_phi': lep_phi, 'PRI_met_phi': met_phi})
+
+
+# DER features
+@register("DER_deltaeta_jet_jet", ["has_jet_2", "vj1", "vj2"])
+def _deltaeta_jet_jet(has_jet, vj1, vj2):
+    return _round(np.where(has_jet, vj1.deltaEta(vj2), MISSING_VALUE))
+
+@register("DER_mass_jet_jet", ["has_jet_2", "vjsum"])
+def _mass_jet_jet(has_jet, vjsum):
+    return _round(np.where(has_jet, vjsum.m(), MISSING_VALUE))
+
+@register("DER_prodeta_jet_jet", ["has_jet_2", "vj1", "vj2"])
+def _prodeta_jet_jet(has_jet, vj1, vj2):
+    return _round(np.where(has_jet, vj1.eta() * vj2.eta(), MISSING_VALUE))
+
+@register("DER_lep_eta_centrality", ["has_jet_2", "PRI_lep_eta", "PRI_jet_leading_eta", "PRI_jet_subleading_eta"])
+def _lep_eta_centrality(has_jet, eta, etaJ1, etaJ2):
+    return _round(np.where(has_jet, eta_centrality(eta, etaJ1, etaJ2), MISSING_VALUE))
+
+@register("DER_mass_transverse_met_lep", ["vlep", "vmet"])
+def _mass_transverse_met_lep(vlep, vmet):
+    vtransverse = V4Array.fromPtEtaPhiM(vlep.pt(), 0., vlep.phi(), 0.) # just the transverse component of the lepton
+    vtransverse += vmet
+    return _round(vtransverse.m())
+
+@register("DER_mass_vis", ["vltau"])
+def _mass_vis(vltau):
+    return _round(vltau.m())
+
+@register("DER_pt_h", ["vltaumet"])
+def _pt_h(vltaumet):
+    return _round(vltaumet.pt())
+
+@register("DER_deltar_tau_lep", ["vtau", "vlep"])
+def _deltar_tau_lep(vtau, vlep):
+    return _round(vtau.deltaR(vlep))
+
+@register("DER_pt_tot", ["vltaumet", "vjsum"])
+def _pt_tot(vltaumet, vjsum):
+    return _round((vltaumet + vjsum).pt())
+
+@register("DER_sum_pt", ["vlep", "vtau", "PRI_jet_all_pt"])
+def _sum_pt(vlep, vtau, jet_all_pt):
+    return _round(vlep.pt() + vtau.pt() + jet_all_pt) # sum_pt is the scalar sum
+
+@register("DER_pt_ratio_lep_tau", ["vlep", "vtau"])
+def _pt_ratio_lep_tau(vlep, vtau):
+    return _round(vlep.pt() / vtau.pt())
+
+@register("DER_met_phi_centrality", ["PRI_lep_phi", "PRI_tau_phi", "PRI_met_phi"])
+def _met_phi_centrality(lep_phi, tau_phi, met_phi):
+    return _round(METphi_centrality(lep_phi, tau_phi, met_phi))
+
+
+# New features
+def _register_radian(name):
+    @register(name, ["phi_differences"])
+    def _radian(diff):
+        return radian_from_differences(diff, name)
+
+for _name in RADIANS:
+    _register_radian(_name)
+
+
+@register("normalized_weight", ["Weight", "Label"])
+def _normalized_weight(W, y):
+    if y.dtype.kind not in "biuf":
+        y = (y == 's')
+    return normalize_weight(W, y.astype(np.float64))
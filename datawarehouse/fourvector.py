@@ -0,0 +1,186 @@
+# coding: utf-8
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import numpy as np
+
+PX, PY, PZ, E = 0, 1, 2, 3
+
+
+class V4Array(object):
+    """
+    A batch of N 4-vectors stored as one (N, 4) float array of (px, py, pz, e).
+
+    The array is in Fortran order so that each component is contiguous in memory
+    (struct of arrays) and every operation runs at numpy speed on whole columns.
+    Derived quantities (pt, eta, phi, m, ...) are cached and the cache is invalidated
+    by every modification made through the methods or the px, py, pz, e setters.
+    If you write directly into `data` call `invalidate()` afterward.
+    """
+    def __init__(self, data):
+        """
+        Constructor from a (N, 4) array of (px, py, pz, e). The array is used without copy
+        if it already has the right layout.
+        """
+        self.data = np.asfortranarray(data)
+        if self.data.ndim != 2 or self.data.shape[1] != 4:
+            raise ValueError("V4Array expects a (N, 4) array, got shape {}".format(self.data.shape))
+        self._cache = {}
+
+    @classmethod
+    def empty(cls, n, dtype=np.float64):
+        return cls(np.empty((n, 4), dtype=dtype, order='F'))
+
+    @classmethod
+    def zeros(cls, n, dtype=np.float64):
+        return cls(np.zeros((n, 4), dtype=dtype, order='F'))
+
+    @classmethod
+    def fromPtEtaPhiM(cls, pt, eta=0., phi=0., m=0., dtype=np.float64):
+        """Build from : pt, eta, phi and m (arrays or scalars broadcasted to the length of pt)"""
+        v = cls.empty(len(pt), dtype=dtype)
+        v.setPtEtaPhiM(pt, eta, phi, m)
+        return v
+
+    def invalidate(self):
+        """Drop the cached derived quantities"""
+        self._cache.clear()
+
+    def _cached(self, name, compute):
+        try:
+            return self._cache[name]
+        except KeyError:
+            value = compute()
+            self._cache[name] = value
+            return value
+
+    def __len__(self):
+        return self.data.shape[0]
+
+    def copy(self):
+        return V4Array(self.data.copy(order='F'))
+
+    # Components (views on the columns of data)
+    @property
+    def px(self):
+        return self.data[:, PX]
+
+    @px.setter
+    def px(self, value):
+        self.data[:, PX] = value
+        self.invalidate()
+
+    @property
+    def py(self):
+        return self.data[:, PY]
+
+    @py.setter
+    def py(self, value):
+        self.data[:, PY] = value
+        self.invalidate()
+
+    @property
+    def pz(self):
+        return self.data[:, PZ]
+
+    @pz.setter
+    def pz(self, value):
+        self.data[:, PZ] = value
+        self.invalidate()
+
+    @property
+    def e(self):
+        return self.data[:, E]
+
+    @e.setter
+    def e(self, value):
+        self.data[:, E] = value
+        self.invalidate()
+
+    # Derived quantities (cached)
+    def p2(self):
+        return self._cached("p2", lambda: self.px**2 + self.py**2 + self.pz**2)
+
+    def p(self):
+        return self._cached("p", lambda: np.sqrt(self.p2()))
+
+    def pt2(self):
+        return self._cached("pt2", lambda: self.px**2 + self.py**2)
+
+    def pt(self):
+        return self._cached("pt", lambda: np.sqrt(self.pt2()))
+
+    def m(self):
+        return self._cached("m", lambda: np.sqrt( np.abs( self.e**2 - self.p2() ) )) # abs is needed for protection
+
+    def eta(self):
+        def compute():
+            with np.errstate(divide='ignore', invalid='ignore'):
+                return np.arcsinh( self.pz/self.pt() )
+        return self._cached("eta", compute)
+
+    def phi(self):
+        return self._cached("phi", lambda: np.arctan2(self.py, self.px))
+
+    def deltaPhi(self, v):
+        """delta phi with another v"""
+        return (self.phi() - v.phi() + 3*np.pi) % (2*np.pi) - np.pi
+
+    def deltaEta(self, v):
+        """delta eta with another v"""
+        return self.eta()-v.eta()
+
+    def deltaR(self, v):
+        """delta R with another v"""
+        return np.sqrt(self.deltaPhi(v)**2+self.deltaEta(v)**2 )
+
+    def eWithM(self, m=0.):
+        """recompute e given m"""
+        return np.sqrt(self.p2()+m**2)
+
+    def __str__(self):
+        return "V4Array of {} 4-vectors (px, py, pz, e) :\n{}".format(len(self), self.data)
+
+    # Modifications (in place)
+    def scale(self, factor=1.):
+        """Apply a simple scaling"""
+        self.data[:, :E] *= factor
+        self.data[:, E] *= factor
+        np.abs(self.e, out=self.e)
+        self.invalidate()
+
+    def scaleFixedM(self, factor=1.):
+        """Scale (keeping mass unchanged)"""
+        m = self.m()
+        self.data[:, :E] *= factor
+        self.invalidate()
+        self.e = self.eWithM(m)
+
+    def setPtEtaPhiM(self, pt=0., eta=0., phi=0., m=0.):
+        """Re-initialize with : pt, eta, phi and m"""
+        pt, eta, phi = np.asarray(pt), np.asarray(eta), np.asarray(phi)
+        np.multiply(pt, np.cos(phi), out=self.px)
+        np.multiply(pt, np.sin(phi), out=self.py)
+        np.multiply(pt, np.sinh(eta), out=self.pz)
+        self.invalidate()
+        self.e = self.eWithM(m)
+
+    def sum(self, v):
+        """Add another V4Array into self"""
+        self.data += v.data
+        self.invalidate()
+
+    def __iadd__(self, other):
+        """Add another V4Array into self"""
+        if not isinstance(other, V4Array):
+            return NotImplemented
+        self.data += other.data
+        self.invalidate()
+        return self
+
+    def __add__(self, other):
+        """Add 2 V4Array : v3 = v1 + v2 = v1.__add__(v2)"""
+        if not isinstance(other, V4Array):
+            return NotImplemented
+        return V4Array(np.add(self.data, other.data, order='F'))
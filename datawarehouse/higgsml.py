@@ -52,17 +52,151 @@ import gzip
 import copy
 import pandas as pd
 import numpy as np
+try:
+    import numba
+except ImportError:
+    numba = None
 
 from .download import maybe_download
 from .download import get_data_dir
+from .cache import load_cached_csv
+from .cache import get_cache_dir
+from .cache import is_cache_valid
+from .cache import iter_cache
+from .cache import read_csv_filtered
+from .cache import cached_rows
+from .fourvector import V4Array
+
+# Declared schema of the HiggsML csv : the column names and their compact dtypes
+# (used with compact=True). The default loading keeps the float64 inferred by pandas.
+# Weights stay float64 because the detail labels are recovered from their exact values.
+HIGGS_FEATURES = [
+    'DER_mass_MMC', 'DER_mass_transverse_met_lep', 'DER_mass_vis', 'DER_pt_h',
+    'DER_deltaeta_jet_jet', 'DER_mass_jet_jet', 'DER_prodeta_jet_jet', 'DER_deltar_tau_lep',
+    'DER_pt_tot', 'DER_sum_pt', 'DER_pt_ratio_lep_tau', 'DER_met_phi_centrality',
+    'DER_lep_eta_centrality', 'PRI_tau_pt', 'PRI_tau_eta', 'PRI_tau_phi', 'PRI_lep_pt',
+    'PRI_lep_eta', 'PRI_lep_phi', 'PRI_met', 'PRI_met_phi', 'PRI_met_sumet', 'PRI_jet_num',
+    'PRI_jet_leading_pt', 'PRI_jet_leading_eta', 'PRI_jet_leading_phi',
+    'PRI_jet_subleading_pt', 'PRI_jet_subleading_eta', 'PRI_jet_subleading_phi',
+    'PRI_jet_all_pt',
+    ]
+HIGGS_COLUMNS = ['EventId'] + HIGGS_FEATURES + ['Weight', 'Label', 'KaggleSet', 'KaggleWeight']
+HIGGS_SCHEMA = dict([(name, 'float32') for name in HIGGS_FEATURES],
+                    EventId='int32',
+                    PRI_jet_num='int8',
+                    Weight='float64',
+                    Label=pd.CategoricalDtype(['b', 's']),
+                    KaggleSet=pd.CategoricalDtype(['t', 'b', 'v', 'u']),
+                    KaggleWeight='float64',
+                    )
+
+# The Kaggle challenge splits and their KaggleSet value
+HIGGS_SPLITS = {'train': 't',
+                'public': 'b',  # public leaderboard
+                'private': 'v', # private leaderboard
+                'unused': 'u',
+                }
+
+def compact_dtypes(data, schema, inplace=False):
+    """
+    Cast the columns of data to the dtypes declared in the given schema.
+    Columns missing from the schema are left unchanged.
+
+    Args
+    ----
+        data: the dataset should be a pandas.DataFrame like object.
+        schema: dict column name -> dtype.
+        inplace: (default=False) if True modify the given data and return it.
+
+    Return
+    ------
+        data : the dataset with the compact dtypes
+    """
+    dtypes = {name: schema[name] for name in data.columns if name in schema}
+    if not inplace:
+        return data.astype(dtypes)
+    for name, dtype in dtypes.items():
+        data[name] = data[name].astype(dtype)
+    return data
+
+def load_higgs(cache=True, compact=False, columns=None, nrows=None, filters=None, split=None):
+    """
+    Loads the HiggsML dataset, and downloads it if necessary.
+
+    The gzipped csv is converted once into a columnar binary cache (next to the csv file)
+    which is used by later calls. The cache is rebuilt if the csv file changes.
 
-def load_higgs():
+    Args
+    ----
+        cache: (default=True) if False always parse the csv file.
+        compact: (default=False) if True use the compact dtypes of HIGGS_SCHEMA
+            (float32 features, int8 PRI_jet_num, categorical Label and KaggleSet)
+            which roughly halves the memory footprint.
+        columns: (default=None) the columns to load. None means every column.
+            The other columns are never parsed nor allocated.
+        nrows: (default=None) only load the first nrows rows. None means every row.
+        filters: (default=None) list of (column, operator, value) row filters combined with
+            a logical and, evaluated before loading the other columns.
+            operator is one of '==', '!=', '<', '<=', '>', '>=', 'in', 'not in'.
+            Example : [('KaggleSet', '==', 't'), ('PRI_jet_num', '>=', 2)]
+        split: (default=None) only load one of the Kaggle challenge splits :
+            'train', 'public' (leaderboard), 'private' (leaderboard) or 'unused'.
+            None means every row. With the cache the row numbers of each split are computed
+            once and stored in the cache directory, so a split is read as a slice or gather.
+
+    Return
+    ------
+        data : the dataset as a pandas.DataFrame (indexed by row number)
+    """
     url = "http://opendata.cern.ch/record/328/files/atlas-higgs-challenge-2014-v2.csv.gz"
     filename = os.path.join(get_data_dir(), "atlas-higgs-challenge-2014-v2.csv.gz")
     maybe_download(filename, url)
-    data = pd.read_csv(filename)
+    if split is not None and split not in HIGGS_SPLITS:
+        raise ValueError("Unknown split {!r} (expected one of {})".format(split, sorted(HIGGS_SPLITS)))
+    if cache:
+        rows = None
+        if split is not None:
+            rows = cached_rows(filename, split, 'KaggleSet', [HIGGS_SPLITS[split]])
+        data = load_cached_csv(filename, columns=columns, nrows=nrows, filters=filters, rows=rows)
+        if compact:
+            data = compact_dtypes(data, HIGGS_SCHEMA, inplace=True)
+    else:
+        if split is not None:
+            filters = [('KaggleSet', '==', HIGGS_SPLITS[split])] + list(filters or [])
+        dtype = HIGGS_SCHEMA if compact else None
+        data = read_csv_filtered(filename, columns=columns, nrows=nrows, filters=filters, dtype=dtype)
     return data
 
+def iter_higgs(chunksize=100000, cache=True, compact=False):
+    """
+    Iterates over the HiggsML dataset by chunks of rows, and downloads it if necessary.
+    Only one chunk at a time is held in memory.
+
+    Reads the columnar cache if it is available (see load_higgs) otherwise parses the csv.
+
+    Args
+    ----
+        chunksize: (default=100000) the number of rows per chunk.
+        cache: (default=True) if False always parse the csv file.
+        compact: (default=False) if True use the compact dtypes of HIGGS_SCHEMA.
+
+    Yield
+    -----
+        data : a chunk of the dataset as a pandas.DataFrame
+    """
+    url = "http://opendata.cern.ch/record/328/files/atlas-higgs-challenge-2014-v2.csv.gz"
+    filename = os.path.join(get_data_dir(), "atlas-higgs-challenge-2014-v2.csv.gz")
+    maybe_download(filename, url)
+    cache_dir = get_cache_dir(filename)
+    if cache and is_cache_valid(cache_dir, filename):
+        chunks = iter_cache(cache_dir, chunksize=chunksize)
+    else:
+        chunks = pd.read_csv(filename, chunksize=chunksize)
+    for data in chunks:
+        if compact:
+            data = compact_dtypes(data, HIGGS_SCHEMA, inplace=True)
+        yield data
+
 def normalize_weight(W, y, background_luminosity=410999.84732187376, signal_luminosity=691.9886077135781):
     """Normalize the given weight to assert that the luminosity is the same as the nominal.
     Returns the normalized weight vector/Series
@@ -80,6 +214,7 @@ def normalize_weight(W, y, background_luminosity=410999.84732187376, signal_lumi
 class V4:
     """
     A simple 4-vector class to ease calculation
+    For whole columns prefer fourvector.V4Array which avoids the deep copies.
     """
     px=0
     py=0
@@ -196,46 +331,141 @@ class V4:
 
 # magic variable
 # FIXME : does it really returns sqrt(2) if in dead center ?
-def METphi_centrality(aPhi, bPhi, cPhi):
+def METphi_centrality(aPhi, bPhi, cPhi, out=None, backend=None):
     """
     Calculate the phi centrality score for an object to be between two other objects in phi
     Returns sqrt(2) if in dead center
     Returns smaller than 1 if an object is not between
     a and b are the bounds, c is the vector to be tested
+
+    Computed in place in 3 buffers of the size of one input (out included : it is used as scratch).
+    Non finite intermediate values are replaced like numpy.nan_to_num with +inf -> 0.
+
+    Args
+    ----
+        aPhi, bPhi, cPhi: the phi angles (array like).
+        out: (default=None) the float64 array where to write the result. None means a new array.
+        backend: (default=None) 'numpy', 'numba' (fused ufunc) or 'auto' (numba if available).
+            None means 'numpy'. The numba ufunc may differ in the last bits (sin implementation).
+
+    Return
+    ------
+        res: the centrality as a numpy array
     """
+    aPhi, bPhi, cPhi = np.asarray(aPhi), np.asarray(bPhi), np.asarray(cPhi)
+    if _get_backend(backend) == "numba":
+        ufunc = _get_numba_ufunc("METphi_centrality")
+        with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+            return ufunc(aPhi, bPhi, cPhi) if out is None else ufunc(aPhi, bPhi, cPhi, out=out)
     # Safely compute and set to zeros results of zero divisions
     with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
-        
-        A = np.true_divide(np.sin(cPhi - aPhi), np.sin(bPhi - aPhi))
-        A[A == np.inf] = 0
-        A = np.nan_to_num(A)
-        
-        B = np.true_divide(np.sin(bPhi - cPhi), np.sin(bPhi - aPhi))
-        B[B == np.inf] = 0
-        B = np.nan_to_num(B)
-        
-        res = (A+B)/np.sqrt(A**2 + B**2)
-        res[res == np.inf] = 0
-        res = np.nan_to_num(res)
+        # den is computed in out (if given) : it becomes the result once A and B are done
+        den = np.subtract(bPhi, aPhi, out=out)
+        np.sin(den, out=den)
+
+        A = np.subtract(cPhi, aPhi)
+        np.sin(A, out=A)
+        np.divide(A, den, out=A)
+        np.nan_to_num(A, copy=False, posinf=0.)
+
+        B = np.subtract(bPhi, cPhi)
+        np.sin(B, out=B)
+        np.divide(B, den, out=B)
+        np.nan_to_num(B, copy=False, posinf=0.)
+
+        res = den # den is not needed anymore
+        np.add(A, B, out=res)
+        np.square(A, out=A)
+        np.square(B, out=B)
+        A += B
+        np.sqrt(A, out=A)
+        res /= A
+        np.nan_to_num(res, copy=False, posinf=0.)
     return res
 
 
 # another magic variable
-def eta_centrality(eta, etaJ1, etaJ2):
+def eta_centrality(eta, etaJ1, etaJ2, out=None, backend=None):
     """
     Calculate the eta centrality score for an object to be between two other objects in eta
     Returns 1 if in dead center
     Returns value smaller than 1/e if object is not between
+
+    Computed in place in 2 buffers of the size of one input (out included : it is used as scratch).
+
+    Args
+    ----
+        eta, etaJ1, etaJ2: the eta of the object and of the 2 jets (array like).
+        out: (default=None) the float64 array where to write the result. None means a new array.
+        backend: (default=None) 'numpy', 'numba' (fused ufunc) or 'auto' (numba if available).
+            None means 'numpy'. The numba ufunc may differ in the last bit (exp implementation).
+
+    Return
+    ------
+        res: the centrality as a numpy array (or a pandas.Series with the index of eta
+            if eta is a pandas.Series).
     """
-    center = (etaJ1 + etaJ2) / 2.
-    
-    # Safely compute and set to zeros results of zero divisions
-    with np.errstate(divide='ignore', invalid='ignore'):
-        width  = 1. / (etaJ1 - center)**2
-        width[width == np.inf] = 0
-        width = np.nan_to_num(width)
-        
-    return np.exp(-width * (eta - center)**2)
+    index = eta.index if isinstance(eta, pd.Series) else None
+    eta, etaJ1, etaJ2 = np.asarray(eta), np.asarray(etaJ1), np.asarray(etaJ2)
+    if _get_backend(backend) == "numba":
+        ufunc = _get_numba_ufunc("eta_centrality")
+        with np.errstate(divide='ignore', invalid='ignore'):
+            res = ufunc(eta, etaJ1, etaJ2) if out is None else ufunc(eta, etaJ1, etaJ2, out=out)
+    else:
+        # center is computed in out (if given) : it becomes the result once width is done
+        center = np.add(etaJ1, etaJ2, out=out)
+        center /= 2.
+
+        # Safely compute and set to zeros results of zero divisions
+        with np.errstate(divide='ignore', invalid='ignore'):
+            width = np.subtract(etaJ1, center)
+            np.square(width, out=width)
+            np.divide(1., width, out=width)
+            np.nan_to_num(width, copy=False, posinf=0.)
+
+        res = center
+        np.subtract(eta, center, out=res)
+        np.square(res, out=res)
+        res *= width
+        np.negative(res, out=res)
+        np.exp(res, out=res)
+    if index is not None:
+        res = pd.Series(res, index=index, copy=False)
+    return res
+
+
+def _nan_to_num(x):
+    """numpy.nan_to_num of a scalar with +inf -> 0 (for the numba ufuncs)"""
+    if np.isnan(x) or x == np.inf:
+        return 0.
+    if x == -np.inf:
+        return -1.7976931348623157e308
+    return x
+
+def _get_numba_ufunc(name):
+    """Compile (once) the fused float64 numba ufuncs of the centralities"""
+    if name not in _NUMBA_KERNELS:
+        nan_to_num = numba.njit(error_model='numpy')(_nan_to_num)
+        signature = ["float64(float64, float64, float64)"]
+
+        @numba.vectorize(signature, nopython=True)
+        def METphi_centrality(aPhi, bPhi, cPhi):
+            den = np.sin(bPhi - aPhi)
+            A = nan_to_num(np.sin(cPhi - aPhi) / den)
+            B = nan_to_num(np.sin(bPhi - cPhi) / den)
+            return nan_to_num((A+B) / np.sqrt(A*A + B*B))
+
+        @numba.vectorize(signature, nopython=True)
+        def eta_centrality(eta, etaJ1, etaJ2):
+            center = (etaJ1 + etaJ2) / 2.
+            diff = etaJ1 - center
+            width = nan_to_num(1. / (diff*diff))
+            diff = eta - center
+            return np.exp(-(width * (diff*diff)))
+
+        _NUMBA_KERNELS["METphi_centrality"] = METphi_centrality
+        _NUMBA_KERNELS["eta_centrality"] = eta_centrality
+    return _NUMBA_KERNELS[name]
 
 
 # ==================================================================================
@@ -255,13 +485,61 @@ def label_to_float(data):
         data: the dataset should be a pandas.DataFrame like object.
             This function will modify the given data inplace.
     """
-    if data['Label'].dtype == object:
+    if data['Label'].dtype.kind not in "biuf":
         #copy entry in human usable form
         data["Label"] = (data["Label"] == 's').astype("float")
     else:
         pass
 
 # ==================================================================================
+# Original weights (times 1e7 and rounded) of the simulated subpopulations.
+# Every other weight comes from the W background.
+# numeric detail label (prefered)
+DETAIL_LABEL_NUM={
+    57207:0, # Signal
+    4613:1,
+    8145:2,
+    4610:3,
+    917703: 105, #Z
+    5127399:111,
+    4435976:112,
+    4187604:113,
+    2407146:114,
+    1307751:115,
+    944596:122,
+    936590:123,
+    1093224:124,
+    225326:132,
+    217575:133,
+    195328:134,
+    254338:135,
+    2268701:300 #T
+    }
+# complementary for W detaillabeldict=200
+#previous alphanumeric detail label
+DETAIL_LABEL_STR={
+   57207:"S0",
+   4613:"S1",
+   8145:"S2",
+   4610:"S3",
+   917703:"Z05",
+   5127399:"Z11",
+   4435976:"Z12",
+   4187604:"Z13",
+   2407146:"Z14",
+   1307751:"Z15",
+   944596:"Z22",
+   936590:"Z23",
+   1093224:"Z24",
+   225326:"Z32",
+   217575:"Z33",
+   195328:"Z34",
+   254338:"Z35",
+   2268701:"T"
+}
+# Sorted lookup table for the vectorized version
+_DETAIL_LABEL_KEYS = np.array(sorted(DETAIL_LABEL_NUM), dtype=np.int64)
+
 def getDetailLabel(origWeight, Label, num=True):
     """
     Given original weight and label, 
@@ -278,56 +556,12 @@ def getDetailLabel(origWeight, Label, num=True):
     ------
         detailLabel: the corresponding detail label ("W" is the default if not found)
 
-    Note : Could be better optimized but this is fast enough.
-    """
-    # prefer numeric detail label
-    detail_label_num={
-        57207:0, # Signal
-        4613:1,
-        8145:2,
-        4610:3,
-        917703: 105, #Z
-        5127399:111,
-        4435976:112,
-        4187604:113,
-        2407146:114,
-        1307751:115,
-        944596:122,
-        936590:123,
-        1093224:124,
-        225326:132,
-        217575:133,
-        195328:134,
-        254338:135,
-        2268701:300 #T
-        }
-    # complementary for W detaillabeldict=200
-    #previous alphanumeric detail label    
-    detail_lable_str={
-       57207:"S0",
-       4613:"S1",
-       8145:"S2",
-       4610:"S3",
-       917703:"Z05",
-       5127399:"Z11",
-       4435976:"Z12",
-       4187604:"Z13",
-       2407146:"Z14",
-       1307751:"Z15",
-       944596:"Z22",
-       936590:"Z23",
-       1093224:"Z24",
-       225326:"Z32",
-       217575:"Z33",
-       195328:"Z34",
-       254338:"Z35",
-       2268701:"T"
-    }
-
+    Note : use detail_label() for whole columns.
+    """
     if num:
-        detailLabelDict = detail_label_num
+        detailLabelDict = DETAIL_LABEL_NUM
     else:
-        detailLabelDict = detail_label_str
+        detailLabelDict = DETAIL_LABEL_STR
 
     iWeight=int(1e7*origWeight+0.5)
     detailLabel = detailLabelDict.get(iWeight, "W") # "W" is the default value if not found
@@ -335,9 +569,46 @@ def getDetailLabel(origWeight, Label, num=True):
         raise ValueError("ERROR! if not in detailLabelDict sould have Label==1 ({}, {})".format(iWeight,Label))
     return detailLabel
 
+def detail_label(origWeight, Label, num=True):
+    """
+    Vectorized getDetailLabel.
+
+    Args
+    ----
+        origWeight: the original weights of the events (array like)
+        Label : the labels of the events (can be {"b", "s"} or {0,1})
+        num: (default=True) if True use the numeric detail labels
+                else use the string detail labels. You should prefer numeric labels.
+
+    Return
+    ------
+        detailLabel: the detail labels as a pandas.Categorical (int8 codes),
+            "W" is the category of the weights not found.
+    """
+    label_dict = DETAIL_LABEL_NUM if num else DETAIL_LABEL_STR
+    keys = _DETAIL_LABEL_KEYS
+    iWeight = np.floor(1e7*np.asarray(origWeight, dtype=np.float64) + 0.5).astype(np.int64)
+    position = np.searchsorted(keys, iWeight)
+    np.minimum(position, len(keys)-1, out=position)
+    found = keys[position] == iWeight
+    # code of not found weights is len(keys) : the "W" category
+    codes = np.where(found, position, len(keys)).astype(np.int8)
+
+    Label = np.asarray(Label)
+    if Label.dtype.kind in "biuf":
+        background = Label == 0
+    else:
+        background = Label == 'b'
+    wrong = ~found & ~background
+    if wrong.any():
+        i = np.flatnonzero(wrong)[0]
+        raise ValueError("ERROR! if not in detailLabelDict sould have Label==1 ({}, {})".format(iWeight[i],Label[i]))
+    categories = [label_dict[k] for k in keys] + ["W"]
+    return pd.Categorical.from_codes(codes, categories=categories)
+
 def add_detail_label(data, num=True):
     """
-    Add a 'detailLabel' column with the detailed labels.
+    Add a 'detailLabel' column with the detailed labels (categorical).
 
     Args
     ----
@@ -347,9 +618,9 @@ def add_detail_label(data, num=True):
                 else use the string detail labels. You should prefer numeric labels.
     """
     if "origWeight" in data.columns:
-        detailLabel = [getDetailLabel(w, label, num=num) for w, label in zip(data["origWeight"], data["Label"])]
+        detailLabel = detail_label(data["origWeight"], data["Label"], num=num)
     else:
-        detailLabel = [getDetailLabel(w, label, num=num) for w, label in zip(data["Weight"], data["Label"])]
+        detailLabel = detail_label(data["Weight"], data["Label"], num=num)
     data["detailLabel"] = detailLabel
 
 # ==================================================================================
@@ -376,7 +647,67 @@ def bkg_weight_norm(data, systBkgNorm):
 # ==================================================================================
 # TES : Tau Energy Scale
 # ==================================================================================
-def tau_energy_scale(data, systTauEnergyScale, missing_value=-999.0):
+
+# Columns read by the TES computation
+TES_INPUTS = [
+    "PRI_tau_pt",
+    "PRI_tau_eta",
+    "PRI_tau_phi",
+    "PRI_lep_pt",
+    "PRI_lep_eta",
+    "PRI_lep_phi",
+    "PRI_met",
+    "PRI_met_phi",
+    "PRI_met_sumet",
+    "PRI_jet_num",
+    "PRI_jet_leading_pt",
+    "PRI_jet_leading_eta",
+    "PRI_jet_leading_phi",
+    "PRI_jet_subleading_pt",
+    "PRI_jet_subleading_eta",
+    "PRI_jet_subleading_phi",
+    "PRI_jet_all_pt",
+    "DER_mass_MMC",
+    "DER_sum_pt",
+    ]
+
+# Columns written by the TES computation (recomputed or only rounded)
+TES_OUTPUTS = [
+    "DER_mass_MMC",
+    "DER_mass_transverse_met_lep",
+    "DER_mass_vis",
+    "DER_pt_h",
+    "DER_deltaeta_jet_jet",
+    "DER_mass_jet_jet",
+    "DER_prodeta_jet_jet",
+    "DER_deltar_tau_lep",
+    "DER_pt_tot",
+    "DER_sum_pt",
+    "DER_pt_ratio_lep_tau",
+    "DER_met_phi_centrality",
+    "DER_lep_eta_centrality",
+    "PRI_tau_pt",
+    "PRI_tau_eta",
+    "PRI_tau_phi",
+    "PRI_lep_pt",
+    "PRI_lep_eta",
+    "PRI_lep_phi",
+    "PRI_met",
+    "PRI_met_phi",
+    "PRI_met_sumet",
+    "PRI_jet_leading_pt",
+    "PRI_jet_leading_eta",
+    "PRI_jet_leading_phi",
+    "PRI_jet_subleading_pt",
+    "PRI_jet_subleading_eta",
+    "PRI_jet_subleading_phi",
+    "PRI_jet_all_pt",
+    ]
+
+# Fix precision to 3 decimals
+DECIMALS = 3
+
+def tau_energy_scale(data, systTauEnergyScale, missing_value=-999.0, backend=None, n_jobs=1):
     """
     Manipulate one primary input : the PRI_tau_pt and recompute the others values accordingly.
 
@@ -387,6 +718,8 @@ def tau_energy_scale(data, systTauEnergyScale, missing_value=-999.0):
         systTauEnergyScale : the factor applied : PRI_tau_pt <-- PRI_tau_pt * systTauEnergyScale
         missing_value : (default=-999.0) the value used to code missing value. 
             This is not used to find missing values but to write them in feature column that have some.
+        backend : (default=None) see tau_energy_scale_columns.
+        n_jobs : (default=1) see tau_energy_scale_columns.
 
     Notes :
     -------
@@ -415,202 +748,785 @@ def tau_energy_scale(data, systTauEnergyScale, missing_value=-999.0):
     data["ORIG_mass_MMC"] = data["DER_mass_MMC"]
     data["ORIG_sum_pt"] = data["DER_sum_pt"]
 
-    # scale tau energy scale, arbitrary but reasonable value
-    data["PRI_tau_pt"] *= systTauEnergyScale 
+    columns = {name: data[name].to_numpy() for name in TES_INPUTS}
+    results = tau_energy_scale_columns(columns, systTauEnergyScale, missing_value=missing_value,
+                                       backend=backend, n_jobs=n_jobs)
+    for name in TES_OUTPUTS:
+        data[name] = results[name]
 
-    # now recompute the DER quantities which are affected
 
-    # first built 4-vectors
-    vtau = V4() # tau 4-vector
-    vtau.setPtEtaPhiM(data["PRI_tau_pt"], data["PRI_tau_eta"], data["PRI_tau_phi"], 0.8) # tau mass 0.8 like in original
+def tau_energy_scale_columns(columns, systTauEnergyScale, missing_value=-999.0, backend=None, out=None, n_jobs=1):
+    """
+    Array version of tau_energy_scale. Does not modify the given columns.
+
+    Args
+    ----
+        columns: mapping from the names in TES_INPUTS to 1D numpy arrays.
+        systTauEnergyScale : the factor applied : PRI_tau_pt <-- PRI_tau_pt * systTauEnergyScale
+        missing_value : (default=-999.0) the value used to code missing value.
+        backend : (default=None) 'numpy', 'numba' or 'auto'. None means 'numpy'.
+            'numba' computes every output in a single compiled loop over the events.
+            It needs numba and may differ from 'numpy' by one unit in the last (3rd) decimal
+            on a few events because of the different math libraries.
+            'auto' uses numba if it is installed.
+        out : (default=None) preallocated float64 array of shape (len(TES_OUTPUTS), n_events)
+            receiving the results.
+        n_jobs : (default=1) number of processes. The events are split into n_jobs shards
+            processed in a process pool through shared memory buffers.
+            The results are identical to the serial version. -1 means all the CPUs.
+
+    Return
+    ------
+        results: dict from the names in TES_OUTPUTS to the rounded new values (rows of out).
+    """
+    backend = _get_backend(backend)
+    n_events = len(columns["PRI_tau_pt"])
+    if out is None:
+        out = np.empty((len(TES_OUTPUTS), n_events), dtype=np.float64)
+    if n_jobs is not None and n_jobs < 0:
+        n_jobs = os.cpu_count() or 1
+    if n_jobs is not None and n_jobs > 1 and n_events > n_jobs:
+        _tes_parallel(columns, systTauEnergyScale, missing_value, backend, out, n_jobs)
+    elif backend == "numba":
+        kernel = _get_numba_kernel("tes", _tes_loop)
+        kernel(systTauEnergyScale, missing_value, *([np.asarray(columns[name]) for name in TES_INPUTS] + [out]))
+    else:
+        _tes_numpy(columns, systTauEnergyScale, missing_value, out)
+    return dict(zip(TES_OUTPUTS, out))
+
 
-    vlep = V4() # lepton 4-vector
-    vlep.setPtEtaPhiM(data["PRI_lep_pt"], data["PRI_lep_eta"], data["PRI_lep_phi"], 0.) # lep mass 0 (either 0.106 or 0.0005 but info is lost)
+def tau_energy_scale_grid(data, systTauEnergyScales, missing_value=-999.0, backend=None, as_frame=False):
+    """
+    Apply tau_energy_scale for several scale factors at once without modifying the data.
+    The parts which do not depend on the scale (lepton, jets, met direction, eta centrality, ...)
+    are computed only once.
 
-    vmet = V4() # met 4-vector
-    vmet.setPtEtaPhiM(data["PRI_met"], 0., data["PRI_met_phi"], 0.) # met mass zero,
+    Args
+    ----
+        data: the dataset should be a pandas.DataFrame like object.
+        systTauEnergyScales : the factors (1D array like) applied : PRI_tau_pt <-- PRI_tau_pt * systTauEnergyScale
+        missing_value : (default=-999.0) the value used to code missing value.
+        backend : (default=None) see tau_energy_scale_columns.
+        as_frame : (default=False) if True return a DataFrame instead of a numpy array.
 
-    # fix MET according to tau pt change
-    vtauDeltaMinus = vtau.copy()
-    vtauDeltaMinus.scaleFixedM( (1.-systTauEnergyScale)/systTauEnergyScale )
-    vmet += vtauDeltaMinus
-    vmet.pz = 0.
-    vmet.e = vmet.eWithM(0.)
-    data["PRI_met"] = vmet.pt()
-    data["PRI_met_phi"] = vmet.phi()
+    Return
+    ------
+        results: float64 array of shape (n_scales, len(TES_OUTPUTS), n_events)
+            results[i, j] is the column TES_OUTPUTS[j] after applying the scale systTauEnergyScales[i].
+            If as_frame is True : a DataFrame with the TES_OUTPUTS columns
+            and a (tes, index) MultiIndex on the rows.
+    """
+    scales = np.atleast_1d(np.asarray(systTauEnergyScales, dtype=np.float64))
+    columns = {name: data[name].to_numpy() for name in TES_INPUTS}
+    n_events = len(data)
+    results = np.empty((len(scales), len(TES_OUTPUTS), n_events), dtype=np.float64)
+    if _get_backend(backend) == "numba":
+        for scale, out in zip(scales, results):
+            tau_energy_scale_columns(columns, scale, missing_value=missing_value, backend="numba", out=out)
+    elif len(scales):
+        prepared = _tes_prepare(columns, missing_value, results[0])
+        for out in results[1:]:
+            out[_TES_FIXED_ROWS] = results[0, _TES_FIXED_ROWS]
+        for scale, out in zip(scales, results):
+            _tes_apply(prepared, columns, scale, out)
+    if not as_frame:
+        return results
+    index = pd.MultiIndex.from_product([scales, data.index], names=["tes", data.index.name])
+    return pd.DataFrame(results.transpose(0, 2, 1).reshape(-1, len(TES_OUTPUTS)), index=index, columns=TES_OUTPUTS)
+
+
+def _tes_parallel(columns, systTauEnergyScale, missing_value, backend, out, n_jobs):
+    """
+    Run tau_energy_scale_columns on row shards in a process pool.
+    Inputs and outputs are exchanged through shared memory (no pickling of the arrays).
+    The inputs keep their dtypes (float32 columns of compact frames are not converted)
+    so that the shards compute exactly like the serial version.
+    """
+    from multiprocessing import shared_memory
+    from concurrent.futures import ProcessPoolExecutor
+
+    n_events = out.shape[1]
+    arrays = [np.asarray(columns[name]) for name in TES_INPUTS]
+    layout = _tes_layout(arrays, n_events)
+    shm_in = shared_memory.SharedMemory(create=True, size=max(layout[-1][1] + arrays[-1].nbytes, 1))
+    try:
+        shm_out = shared_memory.SharedMemory(create=True, size=8 * len(TES_OUTPUTS) * n_events)
+        try:
+            for arr, (dtype, offset) in zip(arrays, layout):
+                np.ndarray(n_events, dtype=dtype, buffer=shm_in.buf, offset=offset)[:] = arr
+            bounds = np.linspace(0, n_events, n_jobs+1).astype(int)
+            shards = [(shm_in.name, shm_out.name, layout, n_events, start, stop, systTauEnergyScale, missing_value, backend)
+                      for start, stop in zip(bounds[:-1], bounds[1:])]
+            with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+                for _ in pool.map(_tes_shard, shards):
+                    pass
+            out[:] = np.ndarray(out.shape, dtype=np.float64, buffer=shm_out.buf)
+        finally:
+            shm_out.close()
+            shm_out.unlink()
+    finally:
+        shm_in.close()
+        shm_in.unlink()
+
+
+def _tes_layout(arrays, n_events):
+    """The (dtype, offset) of every input array in the shared buffer (offsets aligned on 8 bytes)"""
+    layout = []
+    offset = 0
+    for arr in arrays:
+        layout.append((arr.dtype.str, offset))
+        offset += -(-arr.dtype.itemsize * n_events // 8) * 8
+    return layout
+
+
+def _tes_shard(shard):
+    """Worker of _tes_parallel : process the events [start, stop) of the shared buffers"""
+    from multiprocessing import shared_memory
+
+    in_name, out_name, layout, n_events, start, stop, systTauEnergyScale, missing_value, backend = shard
+    shm_in = shared_memory.SharedMemory(name=in_name)
+    shm_out = shared_memory.SharedMemory(name=out_name)
+    try:
+        columns = {name: np.ndarray(n_events, dtype=dtype, buffer=shm_in.buf, offset=offset)[start:stop]
+                   for name, (dtype, offset) in zip(TES_INPUTS, layout)}
+        outputs = np.ndarray((len(TES_OUTPUTS), n_events), dtype=np.float64, buffer=shm_out.buf)
+        tau_energy_scale_columns(columns, systTauEnergyScale, missing_value=missing_value,
+                                 backend=backend, out=outputs[:, start:stop])
+        del outputs, columns
+    finally:
+        shm_in.close()
+        shm_out.close()
+
+
+def _get_backend(backend):
+    if backend is None:
+        return "numpy"
+    if backend == "auto":
+        return "numpy" if numba is None else "numba"
+    if backend == "numba" and numba is None:
+        raise ImportError("backend='numba' needs the numba package")
+    if backend not in ("numpy", "numba"):
+        raise ValueError("Unknown backend {}, expected 'numpy', 'numba' or 'auto'".format(backend))
+    return backend
+
+
+_NUMBA_KERNELS = {}
+
+def _get_numba_kernel(name, func):
+    """Compile (once) the given python loop with numba"""
+    if name not in _NUMBA_KERNELS:
+        _NUMBA_KERNELS[name] = numba.njit(nogil=True, cache=True, error_model='numpy')(func)
+    return _NUMBA_KERNELS[name]
+
+# Outputs which do not depend on the tau energy scale (only rounded or jets related)
+_TES_FIXED_OUTPUTS = [
+    "DER_deltaeta_jet_jet",
+    "DER_mass_jet_jet",
+    "DER_prodeta_jet_jet",
+    "DER_lep_eta_centrality",
+    "PRI_tau_eta",
+    "PRI_tau_phi",
+    "PRI_lep_pt",
+    "PRI_lep_eta",
+    "PRI_lep_phi",
+    "PRI_met_sumet",
+    "PRI_jet_leading_pt",
+    "PRI_jet_leading_eta",
+    "PRI_jet_leading_phi",
+    "PRI_jet_subleading_pt",
+    "PRI_jet_subleading_eta",
+    "PRI_jet_subleading_phi",
+    "PRI_jet_all_pt",
+    ]
+_TES_FIXED_ROWS = [TES_OUTPUTS.index(name) for name in _TES_FIXED_OUTPUTS]
+_TES_SCALED_OUTPUTS = [name for name in TES_OUTPUTS if name not in _TES_FIXED_OUTPUTS]
+
+
+def _tes_numpy(columns, systTauEnergyScale, missing_value, out):
+    prepared = _tes_prepare(columns, missing_value, out)
+    _tes_apply(prepared, columns, systTauEnergyScale, out)
+
+
+def _tes_prepare(columns, missing_value, out):
+    """
+    Part of the TES computation which does not depend on the scale factor.
+    Writes the _TES_FIXED_OUTPUTS rows of out and returns the intermediate values
+    needed by _tes_apply.
+    """
+    results = dict(zip(TES_OUTPUTS, out))
+    prepared = {}
+
+    jet_num = np.asarray(columns["PRI_jet_num"])
+    has_jet_1 = jet_num > 0
+    has_jet_2 = jet_num > 1
+
+    # tau direction
+    prepared["tau_cos_phi"] = np.cos(columns["PRI_tau_phi"])
+    prepared["tau_sin_phi"] = np.sin(columns["PRI_tau_phi"])
+    prepared["tau_sinh_eta"] = np.sinh(columns["PRI_tau_eta"])
+
+    prepared["vlep"] = vlep = V4Array.fromPtEtaPhiM(columns["PRI_lep_pt"], columns["PRI_lep_eta"], columns["PRI_lep_phi"], 0.) # lep mass 0 (either 0.106 or 0.0005 but info is lost)
+
+    vmet = V4Array.fromPtEtaPhiM(columns["PRI_met"], 0., columns["PRI_met_phi"], 0.) # met mass zero,
+    prepared["met_px"] = vmet.px
+    prepared["met_py"] = vmet.py
+    del vmet
 
     # first jet if it exists
-    vj1 = V4()
-    vj1.setPtEtaPhiM(data["PRI_jet_leading_pt"].where( data["PRI_jet_num"] > 0, other=0 ),
-                         data["PRI_jet_leading_eta"].where( data["PRI_jet_num"] > 0, other=0 ),
-                         data["PRI_jet_leading_phi"].where( data["PRI_jet_num"] > 0, other=0 ),
-                         0.) # zero mass
+    vj1 = V4Array.fromPtEtaPhiM(np.where( has_jet_1, columns["PRI_jet_leading_pt"], 0 ),
+                                np.where( has_jet_1, columns["PRI_jet_leading_eta"], 0 ),
+                                np.where( has_jet_1, columns["PRI_jet_leading_phi"], 0 ),
+                                0.) # zero mass
 
     # second jet if it exists
-    vj2=V4()
-    vj2.setPtEtaPhiM(data["PRI_jet_subleading_pt"].where( data["PRI_jet_num"] > 1, other=0 ),
-                     data["PRI_jet_subleading_eta"].where( data["PRI_jet_num"] > 1, other=0 ),
-                     data["PRI_jet_subleading_phi"].where( data["PRI_jet_num"] > 1, other=0 ),
-                     0.) # zero mass
+    vj2 = V4Array.fromPtEtaPhiM(np.where( has_jet_2, columns["PRI_jet_subleading_pt"], 0 ),
+                                np.where( has_jet_2, columns["PRI_jet_subleading_eta"], 0 ),
+                                np.where( has_jet_2, columns["PRI_jet_subleading_phi"], 0 ),
+                                0.) # zero mass
 
-    vjsum = vj1 + vj2
+    prepared["vjsum"] = vjsum = vj1 + vj2
 
-    data["DER_deltaeta_jet_jet"] = vj1.deltaEta(vj2).where(data["PRI_jet_num"] > 1, other=missing_value)
-    data["DER_mass_jet_jet"] = vjsum.m().where(data["PRI_jet_num"] > 1, other=missing_value)
-    data["DER_prodeta_jet_jet"] = ( vj1.eta() * vj2.eta() ).where(data["PRI_jet_num"] > 1, other=missing_value)
+    np.copyto(results["DER_deltaeta_jet_jet"], np.where(has_jet_2, vj1.deltaEta(vj2), missing_value))
+    np.copyto(results["DER_mass_jet_jet"], np.where(has_jet_2, vjsum.m(), missing_value))
+    np.copyto(results["DER_prodeta_jet_jet"], np.where(has_jet_2, vj1.eta() * vj2.eta(), missing_value))
+    del vj1, vj2
 
-    eta_centrality_tmp = eta_centrality(data["PRI_lep_eta"],
-                                        data["PRI_jet_leading_eta"],
-                                        data["PRI_jet_subleading_eta"])
+    eta_centrality(columns["PRI_lep_eta"], columns["PRI_jet_leading_eta"], columns["PRI_jet_subleading_eta"],
+                   out=results["DER_lep_eta_centrality"])
+    np.copyto(results["DER_lep_eta_centrality"], missing_value, where=~has_jet_2)
+
+    # just the transverse component of the lepton
+    prepared["vlep_transverse"] = V4Array.fromPtEtaPhiM(vlep.pt(), 0., vlep.phi(), 0.)
+
+    # Fix precision to 3 decimals
+    for name in _TES_FIXED_OUTPUTS:
+        if name in columns:
+            # untouched column : only rounded
+            np.round(columns[name], decimals=DECIMALS, out=results[name])
+        else:
+            np.round(results[name], decimals=DECIMALS, out=results[name])
+    return prepared
 
-    data["DER_lep_eta_centrality"] = eta_centrality_tmp.where(data["PRI_jet_num"] > 1, other=missing_value)
+
+def _tes_apply(prepared, columns, systTauEnergyScale, out):
+    """
+    Part of the TES computation which depends on the scale factor.
+    Writes the _TES_SCALED_OUTPUTS rows of out.
+    """
+    results = dict(zip(TES_OUTPUTS, out))
+    vlep = prepared["vlep"]
+
+    # scale tau energy scale, arbitrary but reasonable value
+    tau_pt = np.multiply(columns["PRI_tau_pt"], systTauEnergyScale, out=results["PRI_tau_pt"])
+
+    # now recompute the DER quantities which are affected
+
+    # tau 4-vector
+    vtau = V4Array.empty(len(tau_pt))
+    np.multiply(tau_pt, prepared["tau_cos_phi"], out=vtau.px)
+    np.multiply(tau_pt, prepared["tau_sin_phi"], out=vtau.py)
+    np.multiply(tau_pt, prepared["tau_sinh_eta"], out=vtau.pz)
+    vtau.invalidate()
+    vtau.e = vtau.eWithM(0.8) # tau mass 0.8 like in original
+
+    # fix MET according to tau pt change
+    vtauDeltaMinus = vtau.copy()
+    vtauDeltaMinus.scaleFixedM( (1.-systTauEnergyScale)/systTauEnergyScale )
+    vmet = vtauDeltaMinus # reuse memory
+    vmet.px += prepared["met_px"]
+    vmet.py += prepared["met_py"]
+    vmet.pz = 0.
+    vmet.e = vmet.eWithM(0.)
+    results["PRI_met"][:] = vmet.pt()
+    results["PRI_met_phi"][:] = vmet.phi()
 
     # compute many vector sum
-    vtransverse = V4()
-    vtransverse.setPtEtaPhiM(vlep.pt(), 0., vlep.phi(), 0.) # just the transverse component of the lepton
+    vtransverse = prepared["vlep_transverse"].copy()
     vtransverse += vmet
-    data["DER_mass_transverse_met_lep"] = vtransverse.m()
+    results["DER_mass_transverse_met_lep"][:] = vtransverse.m()
+    del vtransverse
 
     vltau = vlep + vtau # lep + tau
-    data["DER_mass_vis"] = vltau.m()
+    results["DER_mass_vis"][:] = vltau.m()
 
-    vlmet = vlep + vmet # lep + met # Seems to be unused ?
-    vltaumet = vltau + vmet # lep + tau + met
+    vltaumet = vltau # lep + tau + met (reuse vltau memory, it is not needed anymore)
+    vltaumet += vmet
 
-    data["DER_pt_h"] = vltaumet.pt()
+    results["DER_pt_h"][:] = vltaumet.pt()
 
-    data["DER_deltar_tau_lep"] = vtau.deltaR(vlep)
+    results["DER_deltar_tau_lep"][:] = vtau.deltaR(vlep)
 
-    vtot = vltaumet + vjsum
-    data["DER_pt_tot"] = vtot.pt()
+    vtot = vltaumet # lep + tau + met + jets
+    vtot += prepared["vjsum"]
+    results["DER_pt_tot"][:] = vtot.pt()
 
-    data["DER_sum_pt"] = vlep.pt() + vtau.pt() + data["PRI_jet_all_pt"] # sum_pt is the scalar sum
-    data["DER_pt_ratio_lep_tau"] = vlep.pt()/vtau.pt()
+    sum_pt = results["DER_sum_pt"]
+    np.add(vlep.pt(), vtau.pt(), out=sum_pt)
+    sum_pt += columns["PRI_jet_all_pt"] # sum_pt is the scalar sum
+    np.divide(vlep.pt(), vtau.pt(), out=results["DER_pt_ratio_lep_tau"])
 
 
-    data["DER_met_phi_centrality"] = METphi_centrality(data["PRI_lep_phi"], data["PRI_tau_phi"], data["PRI_met_phi"])
+    METphi_centrality(columns["PRI_lep_phi"], columns["PRI_tau_phi"], results["PRI_met_phi"],
+                      out=results["DER_met_phi_centrality"])
 
     # FIXME do not really recompute MMC, apply a simple scaling, better than nothing (but not MET dependence)
-    rescaled_mass_MMC = data["ORIG_mass_MMC"] * data["DER_sum_pt"] / data["ORIG_sum_pt"]
-    data["DER_mass_MMC"] = data["ORIG_mass_MMC"].where(data["ORIG_mass_MMC"] < 0, other=rescaled_mass_MMC)
-
-    # delete non trivial objects to save memory (useful?)
-    # del vtau, vlep, vmet, vlmet, vltau, vltaumet
+    orig_mass_MMC = np.asarray(columns["DER_mass_MMC"])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rescaled_mass_MMC = orig_mass_MMC * sum_pt / columns["DER_sum_pt"]
+    np.copyto(results["DER_mass_MMC"], np.where(orig_mass_MMC < 0, orig_mass_MMC, rescaled_mass_MMC))
 
     # Fix precision to 3 decimals
-    DECIMALS = 3
-
-    data["DER_mass_MMC"] = data["DER_mass_MMC"].round(decimals=DECIMALS)
-    data["DER_mass_transverse_met_lep"] = data["DER_mass_transverse_met_lep"].round(decimals=DECIMALS)
-    data["DER_mass_vis"] = data["DER_mass_vis"].round(decimals=DECIMALS)
-    data["DER_pt_h"] = data["DER_pt_h"].round(decimals=DECIMALS)
-    data["DER_deltaeta_jet_jet"] = data["DER_deltaeta_jet_jet"].round(decimals=DECIMALS)
-    data["DER_mass_jet_jet"] = data["DER_mass_jet_jet"].round(decimals=DECIMALS)
-    data["DER_prodeta_jet_jet"] = data["DER_prodeta_jet_jet"].round(decimals=DECIMALS)
-    data["DER_deltar_tau_lep"] = data["DER_deltar_tau_lep"].round(decimals=DECIMALS)
-    data["DER_pt_tot"] = data["DER_pt_tot"].round(decimals=DECIMALS)
-    data["DER_sum_pt"] = data["DER_sum_pt"].round(decimals=DECIMALS)
-    data["DER_pt_ratio_lep_tau"] = data["DER_pt_ratio_lep_tau"].round(decimals=DECIMALS)
-    data["DER_met_phi_centrality"] = data["DER_met_phi_centrality"].round(decimals=DECIMALS)
-    data["DER_lep_eta_centrality"] = data["DER_lep_eta_centrality"].round(decimals=DECIMALS)
-    data["PRI_tau_pt"] = data["PRI_tau_pt"].round(decimals=DECIMALS)
-    data["PRI_tau_eta"] = data["PRI_tau_eta"].round(decimals=DECIMALS)
-    data["PRI_tau_phi"] = data["PRI_tau_phi"].round(decimals=DECIMALS)
-    data["PRI_lep_pt"] = data["PRI_lep_pt"].round(decimals=DECIMALS)
-    data["PRI_lep_eta"] = data["PRI_lep_eta"].round(decimals=DECIMALS)
-    data["PRI_lep_phi"] = data["PRI_lep_phi"].round(decimals=DECIMALS)
-    data["PRI_met"] = data["PRI_met"].round(decimals=DECIMALS)
-    data["PRI_met_phi"] = data["PRI_met_phi"].round(decimals=DECIMALS)
-    data["PRI_met_sumet"] = data["PRI_met_sumet"].round(decimals=DECIMALS)
-    data["PRI_jet_leading_pt"] = data["PRI_jet_leading_pt"].round(decimals=DECIMALS)
-    data["PRI_jet_leading_eta"] = data["PRI_jet_leading_eta"].round(decimals=DECIMALS)
-    data["PRI_jet_leading_phi"] = data["PRI_jet_leading_phi"].round(decimals=DECIMALS)
-    data["PRI_jet_subleading_pt"] = data["PRI_jet_subleading_pt"].round(decimals=DECIMALS)
-    data["PRI_jet_subleading_eta"] = data["PRI_jet_subleading_eta"].round(decimals=DECIMALS)
-    data["PRI_jet_subleading_phi"] = data["PRI_jet_subleading_phi"].round(decimals=DECIMALS)
-    data["PRI_jet_all_pt"] = data["PRI_jet_all_pt"].round(decimals=DECIMALS)
+    for name in _TES_SCALED_OUTPUTS:
+        np.round(results[name], decimals=DECIMALS, out=results[name])
+
+
+def _tes_loop(systTauEnergyScale, missing_value,
+              tau_pt, tau_eta, tau_phi, lep_pt, lep_eta, lep_phi, met, met_phi, met_sumet,
+              jet_num, jet_leading_pt, jet_leading_eta, jet_leading_phi,
+              jet_subleading_pt, jet_subleading_eta, jet_subleading_phi, jet_all_pt,
+              mass_MMC, sum_pt, out):
+    """
+    Fused TES kernel (compiled by numba) : one pass over the events computing every output.
+    Mirrors exactly the operations of _tes_numpy, event by event.
+    The rows of out follow TES_OUTPUTS.
+    """
+    factor = (1.-systTauEnergyScale)/systTauEnergyScale
+    tau_m2 = 0.8**2
+    zero_sinh = np.sinh(0.)
+    huge = np.finfo(np.float64).max
+    scale_round = 10.0**DECIMALS
+    for i in range(tau_pt.shape[0]):
+        # tau 4-vector (mass 0.8)
+        t_pt = tau_pt[i] * systTauEnergyScale
+        tpx = t_pt * np.cos(tau_phi[i])
+        tpy = t_pt * np.sin(tau_phi[i])
+        tpz = t_pt * np.sinh(tau_eta[i])
+        tp2 = tpx*tpx + tpy*tpy + tpz*tpz
+        te = np.sqrt(tp2 + tau_m2)
+        tpt = np.sqrt(tpx*tpx + tpy*tpy)
+        # lepton 4-vector (mass 0)
+        lpx = lep_pt[i] * np.cos(lep_phi[i])
+        lpy = lep_pt[i] * np.sin(lep_phi[i])
+        lpz = lep_pt[i] * np.sinh(lep_eta[i])
+        le = np.sqrt(lpx*lpx + lpy*lpy + lpz*lpz + 0.)
+        lpt = np.sqrt(lpx*lpx + lpy*lpy)
+        lphi = np.arctan2(lpy, lpx)
+        # met 4-vector fixed according to tau pt change
+        mpx = met[i] * np.cos(met_phi[i]) + tpx * factor
+        mpy = met[i] * np.sin(met_phi[i]) + tpy * factor
+        me = np.sqrt(mpx*mpx + mpy*mpy + 0.*0. + 0.)
+        new_met = np.sqrt(mpx*mpx + mpy*mpy)
+        new_met_phi = np.arctan2(mpy, mpx)
+        # jets
+        n_jet = jet_num[i]
+        j1pt = jet_leading_pt[i] if n_jet > 0 else 0.
+        j1eta = jet_leading_eta[i] if n_jet > 0 else 0.
+        j1phi = jet_leading_phi[i] if n_jet > 0 else 0.
+        j2pt = jet_subleading_pt[i] if n_jet > 1 else 0.
+        j2eta = jet_subleading_eta[i] if n_jet > 1 else 0.
+        j2phi = jet_subleading_phi[i] if n_jet > 1 else 0.
+        j1px = j1pt * np.cos(j1phi)
+        j1py = j1pt * np.sin(j1phi)
+        j1pz = j1pt * np.sinh(j1eta)
+        j1e = np.sqrt(j1px*j1px + j1py*j1py + j1pz*j1pz + 0.)
+        j2px = j2pt * np.cos(j2phi)
+        j2py = j2pt * np.sin(j2phi)
+        j2pz = j2pt * np.sinh(j2eta)
+        j2e = np.sqrt(j2px*j2px + j2py*j2py + j2pz*j2pz + 0.)
+        jpx = j1px + j2px
+        jpy = j1py + j2py
+        jpz = j1pz + j2pz
+        je = j1e + j2e
+        if n_jet > 1:
+            eta1 = np.arcsinh(j1pz / np.sqrt(j1px*j1px + j1py*j1py))
+            eta2 = np.arcsinh(j2pz / np.sqrt(j2px*j2px + j2py*j2py))
+            deltaeta_jet_jet = eta1 - eta2
+            mass_jet_jet = np.sqrt(np.abs(je*je - (jpx*jpx + jpy*jpy + jpz*jpz)))
+            prodeta_jet_jet = eta1 * eta2
+            center = (jet_leading_eta[i] + jet_subleading_eta[i]) / 2.
+            width = 1. / (jet_leading_eta[i] - center)**2
+            if width == np.inf or np.isnan(width):
+                width = 0.
+            lep_eta_centrality = np.exp(-width * (lep_eta[i] - center)**2)
+        else:
+            deltaeta_jet_jet = missing_value
+            mass_jet_jet = missing_value
+            prodeta_jet_jet = missing_value
+            lep_eta_centrality = missing_value
+        # transverse lepton + met
+        trpx = lpt * np.cos(lphi)
+        trpy = lpt * np.sin(lphi)
+        trpz = lpt * zero_sinh
+        tre = np.sqrt(trpx*trpx + trpy*trpy + trpz*trpz + 0.)
+        trpx = trpx + mpx
+        trpy = trpy + mpy
+        trpz = trpz + 0.
+        tre = tre + me
+        mass_transverse_met_lep = np.sqrt(np.abs(tre*tre - (trpx*trpx + trpy*trpy + trpz*trpz)))
+        # lep + tau
+        apx = lpx + tpx
+        apy = lpy + tpy
+        apz = lpz + tpz
+        ae = le + te
+        mass_vis = np.sqrt(np.abs(ae*ae - (apx*apx + apy*apy + apz*apz)))
+        # lep + tau + met
+        bpx = apx + mpx
+        bpy = apy + mpy
+        pt_h = np.sqrt(bpx*bpx + bpy*bpy)
+        # delta R tau lep
+        tphi = np.arctan2(tpy, tpx)
+        delta_phi = (tphi - lphi + 3*np.pi) % (2*np.pi) - np.pi
+        delta_eta = np.arcsinh(tpz/tpt) - np.arcsinh(lpz/lpt)
+        deltar_tau_lep = np.sqrt(delta_phi*delta_phi + delta_eta*delta_eta)
+        # lep + tau + met + jets
+        cpx = bpx + jpx
+        cpy = bpy + jpy
+        pt_tot = np.sqrt(cpx*cpx + cpy*cpy)
+        new_sum_pt = lpt + tpt + jet_all_pt[i]
+        pt_ratio_lep_tau = lpt / tpt
+        # met phi centrality
+        d = np.sin(tau_phi[i] - lep_phi[i])
+        A = np.sin(new_met_phi - lep_phi[i]) / d
+        if A == np.inf or np.isnan(A):
+            A = 0.
+        elif A == -np.inf:
+            A = -huge
+        B = np.sin(tau_phi[i] - new_met_phi) / d
+        if B == np.inf or np.isnan(B):
+            B = 0.
+        elif B == -np.inf:
+            B = -huge
+        met_phi_centrality = (A+B) / np.sqrt(A*A + B*B)
+        if met_phi_centrality == np.inf or np.isnan(met_phi_centrality):
+            met_phi_centrality = 0.
+        elif met_phi_centrality == -np.inf:
+            met_phi_centrality = -huge
+        # MMC rescaling
+        mmc = mass_MMC[i]
+        new_mass_MMC = mmc if mmc < 0 else mmc * new_sum_pt / sum_pt[i]
+
+        # write in TES_OUTPUTS order with precision fixed to 3 decimals
+        out[0, i] = np.rint(new_mass_MMC * scale_round) / scale_round
+        out[1, i] = np.rint(mass_transverse_met_lep * scale_round) / scale_round
+        out[2, i] = np.rint(mass_vis * scale_round) / scale_round
+        out[3, i] = np.rint(pt_h * scale_round) / scale_round
+        out[4, i] = np.rint(deltaeta_jet_jet * scale_round) / scale_round
+        out[5, i] = np.rint(mass_jet_jet * scale_round) / scale_round
+        out[6, i] = np.rint(prodeta_jet_jet * scale_round) / scale_round
+        out[7, i] = np.rint(deltar_tau_lep * scale_round) / scale_round
+        out[8, i] = np.rint(pt_tot * scale_round) / scale_round
+        out[9, i] = np.rint(new_sum_pt * scale_round) / scale_round
+        out[10, i] = np.rint(pt_ratio_lep_tau * scale_round) / scale_round
+        out[11, i] = np.rint(met_phi_centrality * scale_round) / scale_round
+        out[12, i] = np.rint(lep_eta_centrality * scale_round) / scale_round
+        out[13, i] = np.rint(t_pt * scale_round) / scale_round
+        out[14, i] = np.rint(tau_eta[i] * scale_round) / scale_round
+        out[15, i] = np.rint(tau_phi[i] * scale_round) / scale_round
+        out[16, i] = np.rint(lep_pt[i] * scale_round) / scale_round
+        out[17, i] = np.rint(lep_eta[i] * scale_round) / scale_round
+        out[18, i] = np.rint(lep_phi[i] * scale_round) / scale_round
+        out[19, i] = np.rint(new_met * scale_round) / scale_round
+        out[20, i] = np.rint(new_met_phi * scale_round) / scale_round
+        out[21, i] = np.rint(met_sumet[i] * scale_round) / scale_round
+        out[22, i] = np.rint(jet_leading_pt[i] * scale_round) / scale_round
+        out[23, i] = np.rint(jet_leading_eta[i] * scale_round) / scale_round
+        out[24, i] = np.rint(jet_leading_phi[i] * scale_round) / scale_round
+        out[25, i] = np.rint(jet_subleading_pt[i] * scale_round) / scale_round
+        out[26, i] = np.rint(jet_subleading_eta[i] * scale_round) / scale_round
+        out[27, i] = np.rint(jet_subleading_phi[i] * scale_round) / scale_round
+        out[28, i] = np.rint(jet_all_pt[i] * scale_round) / scale_round
+
+
+# ==================================================================================
+#  PIPELINE : non mutating systematics
+# ==================================================================================
+
+class SystematicPipeline(object):
+    """
+    Lazy and non mutating version of label_to_float, bkg_weight_norm and tau_energy_scale.
+
+    Building the pipeline computes nothing. apply() returns a new DataFrame
+    sharing the unchanged columns with the input (no copy with pandas copy-on-write,
+    which is the default since pandas 3) and holding new arrays only for the columns
+    whose values actually change. The input data is never modified.
+
+    Example
+    -------
+        >>> pipeline = SystematicPipeline().label_to_float().bkg_weight_norm(1.05).tau_energy_scale(1.03)
+        >>> new_data = pipeline.apply(data)
+    """
+    def __init__(self, steps=()):
+        self.steps = tuple(steps)
+
+    def __repr__(self):
+        return "SystematicPipeline({})".format(", ".join("{}{}".format(name, args) for name, args in self.steps))
+
+    def _add(self, name, *args):
+        return SystematicPipeline(self.steps + ((name, args),))
+
+    def label_to_float(self):
+        """Returns a new pipeline with label_to_float appended"""
+        return self._add("label_to_float")
+
+    def bkg_weight_norm(self, systBkgNorm):
+        """Returns a new pipeline with bkg_weight_norm appended"""
+        return self._add("bkg_weight_norm", systBkgNorm)
+
+    def tau_energy_scale(self, systTauEnergyScale, missing_value=-999.0, backend=None):
+        """Returns a new pipeline with tau_energy_scale appended"""
+        return self._add("tau_energy_scale", systTauEnergyScale, missing_value, backend)
+
+    def changes(self, data):
+        """
+        Run the pipeline on the given data.
+
+        Return
+        ------
+            changed: dict from column name to the new values (pandas.Series sharing the input data
+                when a column is only copied, like origWeight) in the order the columns
+                are created or modified.
+        """
+        changed = _ColumnOverlay(data)
+        for name, args in self.steps:
+            getattr(self, "_" + name)(changed, *args)
+        return changed.changed
+
+    def apply(self, data):
+        """
+        Run the pipeline on the given data.
+
+        Return
+        ------
+            new_data: a new DataFrame with the changes applied. The input data is not modified.
+        """
+        changed = self.changes(data)
+        new_data = data.copy(deep=False)
+        for name, values in changed.items():
+            if not isinstance(values, pd.Series):
+                values = pd.Series(values, index=data.index, copy=False)
+            new_data[name] = values
+        return new_data
+
+    def _label_to_float(self, changed):
+        label = changed.get("Label")
+        if label.dtype.kind not in "biuf":
+            changed["Label"] = (label == 's').astype("float")
+
+    def _bkg_weight_norm(self, changed, systBkgNorm):
+        changed["origWeight"] = changed.series("Weight")
+        weight = changed.get("Weight")
+        if "detailLabel" in changed:
+            is_W = changed.get("detailLabel") == "W"
+        else:
+            detailLabel = detail_label(weight, changed.get("Label"))
+            changed["detailLabel"] = detailLabel
+            is_W = detailLabel == "W"
+        changed["Weight"] = np.where(is_W, weight*systBkgNorm, weight)
+
+    def _tau_energy_scale(self, changed, systTauEnergyScale, missing_value, backend):
+        changed["ORIG_mass_MMC"] = changed.series("DER_mass_MMC")
+        changed["ORIG_sum_pt"] = changed.series("DER_sum_pt")
+        columns = {name: changed.get(name) for name in TES_INPUTS}
+        results = tau_energy_scale_columns(columns, systTauEnergyScale, missing_value=missing_value, backend=backend)
+        for name in TES_OUTPUTS:
+            values = results[name]
+            if not np.array_equal(values, changed.get(name), equal_nan=True):
+                # copy to release the full result array once the loop is done
+                changed[name] = values.copy()
+        del results
+
+
+class _ColumnOverlay(object):
+    """
+    Read the current value of a column : the changed value if any else the original data.
+    """
+    def __init__(self, data):
+        self.data = data
+        self.changed = {}
+
+    def __contains__(self, name):
+        return name in self.changed or name in self.data.columns
+
+    def __setitem__(self, name, values):
+        self.changed[name] = values
+
+    def series(self, name):
+        values = self.changed.get(name)
+        if values is None:
+            return self.data[name]
+        if isinstance(values, pd.Series):
+            return values
+        return pd.Series(values, index=self.data.index, copy=False)
+
+    def get(self, name):
+        values = self.changed.get(name)
+        if values is None:
+            return self.data[name].to_numpy()
+        if isinstance(values, pd.Series):
+            return values.to_numpy()
+        return values
 
 
 # ==================================================================================
 #  NEW FEATURES : 
 # ==================================================================================
 
-def add_radian_1(data, inplace=True):
+# Wrapped phi differences computed by phi_differences (columns of the (N, 3) array)
+TAU_LEP, TAU_MET, LEP_MET = 0, 1, 2
+# The radian features as the minimum of some of the phi differences
+RADIANS = {'radian_1': (TAU_LEP, TAU_MET, LEP_MET),
+           'radian_2': (TAU_MET, LEP_MET),
+           'radian_3': (TAU_LEP, TAU_MET),
+           'radian_4': (TAU_LEP, LEP_MET),
+           }
+_PHI_DIFFERENCES = {TAU_LEP: ('PRI_tau_phi', 'PRI_lep_phi'),
+                    TAU_MET: ('PRI_tau_phi', 'PRI_met_phi'),
+                    LEP_MET: ('PRI_lep_phi', 'PRI_met_phi'),
+                    }
+
+def phi_differences(data, dtype=np.float64, out=None, which=(TAU_LEP, TAU_MET, LEP_MET)):
     """
-    $ \min(\phi_{tau} - \phi_{lep}, \phi_{tau} - \phi_{met}, \phi_{lep} - \phi_{met}) $ (radian 1)
+    The wrapped phi differences tau - lep, tau - met and lep - met in [-pi, pi[
+    computed in place into one (N, 3) array (columns TAU_LEP, TAU_MET, LEP_MET).
+
+    Args
+    ----
+        data: the dataset should be a pandas.DataFrame like object (or a dict of columns).
+        dtype: (default=numpy.float64) the dtype of the result.
+        out: (default=None) a (N, 3) array to fill. None means a new (Fortran ordered) array.
+        which: (default=all) the differences to compute, the other columns are left untouched.
+
+    Return
+    ------
+        diff: the (N, 3) array of phi differences
+    """
+    if out is None:
+        out = np.empty((len(data['PRI_tau_phi']), 3), dtype=dtype, order='F')
+    for i in which:
+        a, b = _PHI_DIFFERENCES[i]
+        col = out[:, i]
+        np.subtract(data[a], data[b], out=col, casting='same_kind')
+        col += np.pi
+        np.mod(col, 2*np.pi, out=col)
+        col -= np.pi
+    return out
+
+def radian_features(data, names=None, dtype=np.float64):
+    """
+    Compute the radian features sharing the phi differences.
+    The minimum ignores NaN values (like pandas.DataFrame.min).
+
+    Args
+    ----
+        data: the dataset should be a pandas.DataFrame like object.
+        names: (default=None) the features to compute (keys of RADIANS). None means all of them.
+        dtype: (default=numpy.float64) the dtype of the features (use numpy.float32 to save memory).
+
+    Return
+    ------
+        features: dict name -> numpy array
+    """
+    if names is None:
+        names = sorted(RADIANS)
+    which = sorted(set(i for name in names for i in RADIANS[name]))
+    diff = phi_differences(data, dtype=dtype, which=which)
+    return {name: radian_from_differences(diff, name) for name in names}
+
+def radian_from_differences(diff, name):
+    """
+    The radian feature name (key of RADIANS) from the (N, 3) phi differences.
+    The minimum ignores NaN values (like pandas.DataFrame.min).
     """
+    which = RADIANS[name]
+    radian = np.fmin(diff[:, which[0]], diff[:, which[1]])
+    for i in which[2:]:
+        np.fmin(radian, diff[:, i], out=radian)
+    return radian
+
+def _add_radians(data, names, inplace, dtype):
     if not inplace:
         data = data.copy()
-    tau_lep = (data['PRI_tau_phi'] - data['PRI_lep_phi'] + np.pi) % (2*np.pi) - np.pi
-    tau_met = (data['PRI_tau_phi'] - data['PRI_met_phi'] + np.pi) % (2*np.pi) - np.pi
-    lep_met = (data['PRI_lep_phi'] - data['PRI_met_phi'] + np.pi) % (2*np.pi) - np.pi
-    all_ = pd.concat([tau_lep, tau_met, lep_met], axis=1)
-    radian_1 = all_.min(axis=1)
-    data['radian_1'] = radian_1
+    for name, values in radian_features(data, names, dtype=dtype).items():
+        data[name] = pd.Series(values, index=data.index, copy=False)
     return data
 
-def add_radian_2(data, inplace=True):
+def add_radian_1(data, inplace=True, dtype=np.float64):
+    """
+    $ \min(\phi_{tau} - \phi_{lep}, \phi_{tau} - \phi_{met}, \phi_{lep} - \phi_{met}) $ (radian 1)
+    """
+    return _add_radians(data, ['radian_1'], inplace, dtype)
+
+def add_radian_2(data, inplace=True, dtype=np.float64):
     """
     $ \min(\phi_{tau} - \phi_{met}, \phi_{lep} - \phi_{met}) $ (radian 2)
     """
-    if not inplace:
-        data = data.copy()
-    tau_met = (data['PRI_tau_phi'] - data['PRI_met_phi'] + np.pi) % (2*np.pi) - np.pi
-    lep_met = (data['PRI_lep_phi'] - data['PRI_met_phi'] + np.pi) % (2*np.pi) - np.pi
-    all_ = pd.concat([tau_met, lep_met], axis=1)
-    radian_2 = all_.min(axis=1)
-    data['radian_2'] = radian_2
-    return data
+    return _add_radians(data, ['radian_2'], inplace, dtype)
 
-def add_radian_3(data, inplace=True):
+def add_radian_3(data, inplace=True, dtype=np.float64):
     """
     $ \min(\phi_{tau} - \phi_{lep}, \phi_{tau} - \phi_{met}) $ (radian 3)
     """
-    if not inplace:
-        data = data.copy()
-    tau_lep = (data['PRI_tau_phi'] - data['PRI_lep_phi'] + np.pi) % (2*np.pi) - np.pi
-    tau_met = (data['PRI_tau_phi'] - data['PRI_met_phi'] + np.pi) % (2*np.pi) - np.pi
-    all_ = pd.concat([tau_lep, tau_met], axis=1)
-    radian_3 = all_.min(axis=1)
-    data['radian_3'] = radian_3
-    return data
+    return _add_radians(data, ['radian_3'], inplace, dtype)
 
-def add_radian_4(data, inplace=True):
+def add_radian_4(data, inplace=True, dtype=np.float64):
     """
     $ \min(\phi_{tau} - \phi_{lep}, \phi_{lep} - \phi_{met}) $ (radian 4)
     """
-    if not inplace:
-        data = data.copy()
-    tau_lep = (data['PRI_tau_phi'] - data['PRI_lep_phi'] + np.pi) % (2*np.pi) - np.pi
-    lep_met = (data['PRI_lep_phi'] - data['PRI_met_phi'] + np.pi) % (2*np.pi) - np.pi
-    all_ = pd.concat([tau_lep, lep_met], axis=1)
-    radian_1 = all_.min(axis=1)
-    data['radian_1'] = radian_1
-    return data
+    return _add_radians(data, ['radian_4'], inplace, dtype)
 
-def add_radians(data, inplace=True):
+def add_radians(data, inplace=True, dtype=np.float64):
     """
     $ \min(\phi_{tau} - \phi_{lep}, \phi_{tau} - \phi_{met}, \phi_{lep} - \phi_{met}) $ (radian 1)
     $ \min(\phi_{tau} - \phi_{met}, \phi_{lep} - \phi_{met}) $ (radian 2)
     $ \min(\phi_{tau} - \phi_{lep}, \phi_{tau} - \phi_{met}) $ (radian 3)
     $ \min(\phi_{tau} - \phi_{lep}, \phi_{lep} - \phi_{met}) $ (radian 4)
     """
-    if not inplace:
-        data = data.copy()
-    tau_lep = (data['PRI_tau_phi'] - data['PRI_lep_phi'] + np.pi) % (2*np.pi) - np.pi
-    tau_met = (data['PRI_tau_phi'] - data['PRI_met_phi'] + np.pi) % (2*np.pi) - np.pi
-    lep_met = (data['PRI_lep_phi'] - data['PRI_met_phi'] + np.pi) % (2*np.pi) - np.pi
-    data['radian_1'] = pd.concat([tau_lep, tau_met, lep_met], axis=1).min(axis=1)
-    data['radian_2'] = pd.concat([tau_met, lep_met], axis=1).min(axis=1)
-    data['radian_3'] = pd.concat([tau_lep, tau_met], axis=1).min(axis=1)
-    data['radian_4'] = pd.concat([tau_lep, lep_met], axis=1).min(axis=1)
-    return data
+    return _add_radians(data, ['radian_1', 'radian_2', 'radian_3', 'radian_4'], inplace, dtype)
 
 # ==================================================================================
 #  MAIN : here is defined the behaviour of this module as a main script
 # ==================================================================================
 import argparse
 
+# Restricted output columns (for compatibility with previous version)
+RESTRICTED_COLUMNS = [
+    "EventId",
+    "DER_mass_MMC",
+    "DER_mass_transverse_met_lep",
+    "DER_mass_vis",
+    "DER_pt_h",
+    "DER_deltaeta_jet_jet",
+    "DER_mass_jet_jet",
+    "DER_prodeta_jet_jet",
+    "DER_deltar_tau_lep",
+    "DER_pt_tot",
+    "DER_sum_pt",
+    "DER_pt_ratio_lep_tau",
+    "DER_met_phi_centrality",
+    "DER_lep_eta_centrality",
+    "PRI_tau_pt",
+    "PRI_tau_eta",
+    "PRI_tau_phi",
+    "PRI_lep_pt",
+    "PRI_lep_eta",
+    "PRI_lep_phi",
+    "PRI_met",
+    "PRI_met_phi",
+    "PRI_met_sumet",
+    "PRI_jet_num",
+    "PRI_jet_leading_pt",
+    "PRI_jet_leading_eta",
+    "PRI_jet_leading_phi",
+    "PRI_jet_subleading_pt",
+    "PRI_jet_subleading_eta",
+    "PRI_jet_subleading_phi",
+    "PRI_jet_all_pt",
+    "Weight",
+    "Label",
+    "origWeight",
+    "detailLabel",
+    ]
+
 def parse_args():
     """
     ArgumentParser.
@@ -625,6 +1541,7 @@ def parse_args():
     parser = argparse.ArgumentParser(
         description="Higgs manipulation script. Can be used to produce new dataset with skewed features."
                     "Handle : Backgroung Weight norm (--Wnorm) and Tau energy scaling (--tes).\n"
+                    "The data is processed chunk by chunk so the memory does not depend on the dataset size.\n"
                     "To get the behaviour of the previous version use :\n"
                     "--Wnorm 1 --tes 1.05 -r --csv -o atlas-higgs-challenge-2014-v2_v2.5_manip.csv")
 
@@ -643,14 +1560,93 @@ def parse_args():
         action="store_true", dest='float_label')
     parser.add_argument('--Wnorm', help='Backgroung Weight norm scale factor', type=float, dest='w_scale')
     parser.add_argument('--tes', help='Tau energy scale factor. Reasonable value [0.9, 1.1]', type=float, dest='tes')
-    parser.add_argument('-i', help='the name of the input file', dest="in_file")
+    parser.add_argument('-i', help='the name of the input file (csv file or columnar cache directory).'
+        ' Default is the HiggsML dataset (downloaded if needed)', dest="in_file")
     parser.add_argument('-o', default="data/Higgs_output.csv", help='the name of the output file', dest="out_file")
+    parser.add_argument('--format', default="csv", choices=["csv", "parquet", "npy"], dest="fmt",
+        help='the output format : csv, parquet (needs pyarrow) or npy (uncompressed columnar directory)')
+    parser.add_argument('--compression', default=None, choices=["gzip", "zstd"], dest="compression",
+        help='the csv compression (default gzip unless --csv) or the parquet codec')
+    parser.add_argument('--threads', default=None, type=int, dest="threads",
+        help='the number of compression threads (default : number of cpus)')
+    parser.add_argument('--chunksize', default=100000, type=int, dest="chunksize",
+        help='the number of rows processed at once')
 
     # Now do your job and parse my command line !
     args = parser.parse_args()
     return args
 
+def iter_input(in_file=None, chunksize=100000):
+    """
+    Iterates over the input of the script by chunks of rows.
+
+    Args
+    ----
+        in_file: (default=None) a csv file or a columnar cache directory.
+            None means the HiggsML dataset (see iter_higgs).
+        chunksize: (default=100000) the number of rows per chunk.
+
+    Yield
+    -----
+        data : a chunk of the dataset as a pandas.DataFrame
+    """
+    if in_file is None:
+        chunks = iter_higgs(chunksize=chunksize)
+    elif os.path.isdir(in_file):
+        chunks = iter_cache(in_file, chunksize=chunksize)
+    else:
+        chunks = pd.read_csv(in_file, chunksize=chunksize)
+    for data in chunks:
+        yield data
+
+def iter_manipulation(chunks, w_scale=None, tes=None, float_label=False, detail_label=False, orig_weight=False):
+    """
+    Apply the manipulations to every chunk (they all work row by row).
+
+    Args
+    ----
+        chunks: iterable of pandas.DataFrame.
+        w_scale: (default=None) the background weight norm scale factor (see bkg_weight_norm).
+        tes: (default=None) the tau energy scale factor (see tau_energy_scale).
+        float_label: (default=False) if True convert the labels to float (see label_to_float).
+        detail_label: (default=False) if True add the detail labels (see add_detail_label).
+        orig_weight: (default=False) if True add the 'origWeight' column (copy of the weights)
+            when bkg_weight_norm does not add it.
+
+    Yield
+    -----
+        data : the manipulated chunks
+    """
+    for data in chunks:
+        if float_label:
+            label_to_float(data)
+        if w_scale is not None:
+            bkg_weight_norm(data, w_scale)
+        if tes is not None:
+            tau_energy_scale(data, tes)
+        if detail_label and "detailLabel" not in data.columns:
+            add_detail_label(data)
+        if orig_weight and "origWeight" not in data.columns:
+            data["origWeight"] = data["Weight"]
+        yield data
+
+def output_file_name(out_file, fmt="csv", compression=None):
+    """Add the extension of the format and the compression if missing"""
+    if fmt == "csv":
+        ext = ".csv" + {None: "", "gzip": ".gz", "zstd": ".zst"}[compression]
+    elif fmt == "parquet":
+        ext = ".parquet"
+    else:
+        return out_file
+    if out_file.endswith(ext):
+        return out_file
+    if ext.startswith(".csv.") and out_file.endswith(".csv"):
+        return out_file + ext[len(".csv"):]
+    return out_file + ext
+
 if __name__ == '__main__':
+    from .writers import write_chunks
+
     args = parse_args()
     
     quiet = args.quiet # quiet flag
@@ -661,71 +1657,27 @@ if __name__ == '__main__':
     tes = args.tes # Tau energy scale factor
     in_file = args.in_file # input file
     out_file = args.out_file # output file
+    fmt = args.fmt # output format
 
-
-    # Restrict the column output (for compatibility with previous version)
-    columns = [ "EventId",
-                "DER_mass_MMC",
-                "DER_mass_transverse_met_lep",
-                "DER_mass_vis",
-                "DER_pt_h",
-                "DER_deltaeta_jet_jet",
-                "DER_mass_jet_jet",
-                "DER_prodeta_jet_jet",
-                "DER_deltar_tau_lep",
-                "DER_pt_tot",
-                "DER_sum_pt",
-                "DER_pt_ratio_lep_tau",
-                "DER_met_phi_centrality",
-                "DER_lep_eta_centrality",
-                "PRI_tau_pt",
-                "PRI_tau_eta",
-                "PRI_tau_phi",
-                "PRI_lep_pt",
-                "PRI_lep_eta",
-                "PRI_lep_phi",
-                "PRI_met",
-                "PRI_met_phi",
-                "PRI_met_sumet",
-                "PRI_jet_num",
-                "PRI_jet_leading_pt",
-                "PRI_jet_leading_eta",
-                "PRI_jet_leading_phi",
-                "PRI_jet_subleading_pt",
-                "PRI_jet_subleading_eta",
-                "PRI_jet_subleading_phi",
-                "PRI_jet_all_pt",
-                "Weight",
-                "Label",
-                "origWeight",
-                "detailLabel",
-                ] if restricted else None
+    columns = RESTRICTED_COLUMNS if restricted else None
+    compression = args.compression
+    if fmt == "csv" and compression is None and not csv:
+        compression = "gzip"
+    out_file = output_file_name(out_file, fmt, compression)
 
     if not quiet:
-        print("Loading the dataset")
-
-    data = load_higgs(in_file)
-
-    if float_label:
-        if not quiet:
-            print("Label convertion to float")
-        label_to_float(data)
-    if w_scale is not None:
-        if not quiet:
+        print("Streaming the dataset by chunks of", args.chunksize, "rows")
+        if w_scale is not None:
             print("Weight rescaling :", w_scale)
-        bkg_weight_norm(data, w_scale)
-    if tes is not None:
-        if not quiet:
+        if tes is not None:
             print("Tau energy rescaling :", tes)
-        tau_energy_scale(data, tes)
-
-    compression = None if csv else "gzip"
-    _, ext = os.path.splitext(out_file)
-    if csv and ext != ".csv":
-        out_file += ".csv"
-    elif not csv and ext != ".gz":
-        out_file += ".gz"
-    if not quiet:
         print("Writting results to :", out_file)
-    data.to_csv(out_file, index=False, compression=compression, columns=columns)
+
+    chunks = iter_input(in_file, chunksize=args.chunksize)
+    chunks = iter_manipulation(chunks, w_scale=w_scale, tes=tes, float_label=float_label,
+                               detail_label=restricted, orig_weight=restricted)
+    n_rows = write_chunks(chunks, out_file, fmt=fmt, compression=compression,
+                          threads=args.threads, columns=columns)
+    if not quiet:
+        print(n_rows, "rows written")
     print("Done.")
@@ -51,6 +51,13 @@ import numpy as np
 
 from .download import maybe_download
 from .download import get_data_dir
+from .fourvector import V4Array
+from .higgsml import getDetailLabel # detail labels are shared with HiggsML
+from .higgsml import detail_label
+from .higgsml import add_detail_label
+from .higgsml import compact_dtypes
+from .higgsml import METphi_centrality # centralities are shared with HiggsML
+from .higgsml import eta_centrality
 
 COLUMN_NAMES = {
     0: 'PRI_lep_1_pt',
@@ -82,6 +89,17 @@ COLUMN_NAMES = {
 
 RESTRICTED_COLUMNS = [0,1,2,3,4,5,6,7]
 
+# Declared schema of the tautau files (used with compact=True) : every column is a float feature.
+# Label and Weight are added by load_higgstautau.
+TAUTAU_SCHEMA = dict([(name, 'float32') for name in COLUMN_NAMES.values()],
+                     Label='int8',
+                     Weight='float64',
+                     )
+
+# Weights of the signal (htautau) and background (ztautau) events
+HTAUTAU_WEIGHT = 1. / 200
+ZTAUTAU_WEIGHT = 1.
+
 COLUMN_RENAME_FOR_SKEWING = {
     'PRI_lep_1_pt': 'PRI_tau_pt',
     'PRI_lep_1_eta': 'PRI_tau_eta',
@@ -91,44 +109,157 @@ COLUMN_RENAME_FOR_SKEWING = {
     'PRI_lep_2_phi': 'PRI_lep_phi',
     }
 
-def load_htautau(nrows=None, restricted_cols=True):
+def load_htautau(nrows=None, restricted_cols=True, compact=False):
+    """
+    Loads the htautau dataset, and downloads it if necessary.
+
+    Args
+    ----
+        nrows: (default=None) the number of rows to read. None means every row.
+        restricted_cols: (default=True) if True only read the lepton and met columns.
+        compact: (default=False) if True use the float32 dtypes of TAUTAU_SCHEMA.
+
+    Return
+    ------
+        data : the dataset as a pandas.DataFrame
+    """
     url = "http://mlphysics.ics.uci.edu/data/htautau/htautau.txt.gz"
     filename = os.path.join(get_data_dir(), "htautau.txt.gz")
     maybe_download(filename, url)
-    if restricted_cols :
-        data = pd.read_csv(filename, sep='\t', nrows=nrows, header=None, usecols=RESTRICTED_COLUMNS)
-    else:
-        data = pd.read_csv(filename, sep='\t', nrows=nrows, header=None)
-    data.rename(columns=COLUMN_NAMES, inplace=True)
+    data = _read_tautau(filename, nrows=nrows, restricted_cols=restricted_cols, compact=compact)
     return data
 
-def load_ztautau(nrows=None, restricted_cols=True):
+def load_ztautau(nrows=None, restricted_cols=True, compact=False):
+    """
+    Loads the ztautau dataset, and downloads it if necessary.
+
+    Args
+    ----
+        nrows: (default=None) the number of rows to read. None means every row.
+        restricted_cols: (default=True) if True only read the lepton and met columns.
+        compact: (default=False) if True use the float32 dtypes of TAUTAU_SCHEMA.
+
+    Return
+    ------
+        data : the dataset as a pandas.DataFrame
+    """
     url = "http://mlphysics.ics.uci.edu/data/htautau/ztautau.txt.gz"
     filename = os.path.join(get_data_dir(), "ztautau.txt.gz")
     maybe_download(filename, url)
-    if restricted_cols :
-        data = pd.read_csv(filename, sep='\t', nrows=nrows, header=None, usecols=RESTRICTED_COLUMNS)
-    else:
-        data = pd.read_csv(filename, sep='\t', nrows=nrows, header=None)
-    data.rename(columns=COLUMN_NAMES, inplace=True)
+    data = _read_tautau(filename, nrows=nrows, restricted_cols=restricted_cols, compact=compact)
     return data
 
+def iter_htautau(chunksize=100000, nrows=None, restricted_cols=True, compact=False):
+    """
+    Iterates over the htautau dataset by chunks of rows, and downloads it if necessary.
+    Only one chunk at a time is held in memory.
+
+    Yield
+    -----
+        data : a chunk of the dataset as a pandas.DataFrame
+    """
+    url = "http://mlphysics.ics.uci.edu/data/htautau/htautau.txt.gz"
+    filename = os.path.join(get_data_dir(), "htautau.txt.gz")
+    maybe_download(filename, url)
+    for data in _read_tautau(filename, nrows=nrows, restricted_cols=restricted_cols, chunksize=chunksize, compact=compact):
+        yield data
 
-def load_higgstautau(n_samples=None):
+def iter_ztautau(chunksize=100000, nrows=None, restricted_cols=True, compact=False):
+    """
+    Iterates over the ztautau dataset by chunks of rows, and downloads it if necessary.
+    Only one chunk at a time is held in memory.
+
+    Yield
+    -----
+        data : a chunk of the dataset as a pandas.DataFrame
+    """
+    url = "http://mlphysics.ics.uci.edu/data/htautau/ztautau.txt.gz"
+    filename = os.path.join(get_data_dir(), "ztautau.txt.gz")
+    maybe_download(filename, url)
+    for data in _read_tautau(filename, nrows=nrows, restricted_cols=restricted_cols, chunksize=chunksize, compact=compact):
+        yield data
+
+def _read_tautau(filename, nrows=None, restricted_cols=True, chunksize=None, compact=False):
+    """
+    Read one of the tab separated tautau files.
+    Returns a DataFrame or, if chunksize is given, a generator of DataFrames.
+    With compact=True the columns are parsed directly as float32.
+    """
+    usecols = RESTRICTED_COLUMNS if restricted_cols else None
+    dtype = np.float32 if compact else None
+    reader = pd.read_csv(filename, sep='\t', nrows=nrows, header=None, usecols=usecols,
+                         chunksize=chunksize, dtype=dtype)
+    if chunksize is None:
+        return reader.rename(columns=COLUMN_NAMES)
+    return (data.rename(columns=COLUMN_NAMES) for data in reader)
+
+
+def load_higgstautau(n_samples=None, compact=False):
     if n_samples is None:
-        data_h = load_htautau()
-        data_z = load_ztautau()
+        data_h = load_htautau(compact=compact)
+        data_z = load_ztautau(compact=compact)
     else:
-        data_h = load_htautau(nrows=n_samples//2)
-        data_z = load_ztautau(nrows=n_samples//2)
+        data_h = load_htautau(nrows=n_samples//2, compact=compact)
+        data_z = load_ztautau(nrows=n_samples//2, compact=compact)
 
-    data_h["Label"] = np.ones(data_h.shape[0])
-    data_z["Label"] = np.zeros(data_z.shape[0])
-    data_h["Weight"] = np.ones(data_h.shape[0])/200
-    data_z["Weight"] = np.ones(data_z.shape[0])
+    add_label_weight(data_h, 1.)
+    add_label_weight(data_z, 0.)
     data = pd.concat([data_h, data_z])
+    if compact:
+        data = compact_dtypes(data, TAUTAU_SCHEMA, inplace=True)
     return data
 
+def iter_higgstautau(chunksize=100000, nrows=None, restricted_cols=True, htautau_file=None, ztautau_file=None):
+    """
+    Iterates over the merged htautau (Label=1) and ztautau (Label=0) datasets by chunks of rows,
+    alternating one chunk of each. Downloads the datasets if necessary.
+    Only one chunk at a time is held in memory.
+
+    Args
+    ----
+        chunksize: (default=100000) the number of rows per chunk.
+        nrows: (default=None) the number of rows to read from each file. None means every row.
+        restricted_cols: (default=True) if True only read the lepton and met columns.
+        htautau_file: (default=None) the htautau file. None means the downloaded dataset.
+        ztautau_file: (default=None) the ztautau file. None means the downloaded dataset.
+
+    Yield
+    -----
+        data : a chunk of the dataset as a pandas.DataFrame (with Label and Weight columns)
+    """
+    if htautau_file is None:
+        chunks_h = iter_htautau(chunksize=chunksize, nrows=nrows, restricted_cols=restricted_cols)
+    else:
+        chunks_h = _read_tautau(htautau_file, nrows=nrows, restricted_cols=restricted_cols, chunksize=chunksize)
+    if ztautau_file is None:
+        chunks_z = iter_ztautau(chunksize=chunksize, nrows=nrows, restricted_cols=restricted_cols)
+    else:
+        chunks_z = _read_tautau(ztautau_file, nrows=nrows, restricted_cols=restricted_cols, chunksize=chunksize)
+    streams = [(chunks_h, 1.), (chunks_z, 0.)]
+    while streams:
+        for stream in list(streams):
+            chunks, label = stream
+            data = next(chunks, None)
+            if data is None:
+                streams.remove(stream)
+                continue
+            add_label_weight(data, label)
+            yield data
+
+def add_label_weight(data, label):
+    """
+    Add the Label column (1 for htautau, 0 for ztautau) and the Weight column
+    (HTAUTAU_WEIGHT or ZTAUTAU_WEIGHT) to one of the tautau datasets.
+
+    Args
+    ----
+        data: the dataset should be a pandas.DataFrame like object.
+            This function will modify the given data inplace.
+        label: 1. for the htautau dataset, 0. for the ztautau dataset.
+    """
+    data["Label"] = np.full(data.shape[0], label)
+    data["Weight"] = np.full(data.shape[0], HTAUTAU_WEIGHT if label == 1 else ZTAUTAU_WEIGHT)
+
 
 
 # ==================================================================================
@@ -138,6 +269,7 @@ def load_higgstautau(n_samples=None):
 class V4:
     """
     A simple 4-vector class to ease calculation
+    For whole columns prefer fourvector.V4Array which avoids the deep copies.
     """
     px=0
     py=0
@@ -252,49 +384,6 @@ class V4:
             return NotImplemented
         return copy
 
-# magic variable
-# FIXME : does it really returns sqrt(2) if in dead center ?
-def METphi_centrality(aPhi, bPhi, cPhi):
-    """
-    Calculate the phi centrality score for an object to be between two other objects in phi
-    Returns sqrt(2) if in dead center
-    Returns smaller than 1 if an object is not between
-    a and b are the bounds, c is the vector to be tested
-    """
-    # Safely compute and set to zeros results of zero divisions
-    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
-        
-        A = np.true_divide(np.sin(cPhi - aPhi), np.sin(bPhi - aPhi))
-        A[A == np.inf] = 0
-        A = np.nan_to_num(A)
-        
-        B = np.true_divide(np.sin(bPhi - cPhi), np.sin(bPhi - aPhi))
-        B[B == np.inf] = 0
-        B = np.nan_to_num(B)
-        
-        res = (A+B)/np.sqrt(A**2 + B**2)
-        res[res == np.inf] = 0
-        res = np.nan_to_num(res)
-    return res
-
-
-# another magic variable
-def eta_centrality(eta, etaJ1, etaJ2):
-    """
-    Calculate the eta centrality score for an object to be between two other objects in eta
-    Returns 1 if in dead center
-    Returns value smaller than 1/e if object is not between
-    """
-    center = (etaJ1 + etaJ2) / 2.
-    
-    # Safely compute and set to zeros results of zero divisions
-    with np.errstate(divide='ignore', invalid='ignore'):
-        width  = 1. / (etaJ1 - center)**2
-        width[width == np.inf] = 0
-        width = np.nan_to_num(width)
-        
-    return np.exp(-width * (eta - center)**2)
-
 
 # ==================================================================================
 #  Now we enter in the manipulation procedures (everything works on data inplace)
@@ -313,103 +402,12 @@ def label_to_float(data):
         data: the dataset should be a pandas.DataFrame like object.
             This function will modify the given data inplace.
     """
-    if data['Label'].dtype == object:
+    if data['Label'].dtype.kind not in "biuf":
         #copy entry in human usable form
         data["Label"] = (data["Label"] == 's').astype("float")
     else:
         pass
 
-# ==================================================================================
-def getDetailLabel(origWeight, Label, num=True):
-    """
-    Given original weight and label, 
-    return more precise label specifying the original simulation type.
-    
-    Args
-    ----
-        origWeight: the original weight of the event
-        Label : the label of the event (can be {"b", "s"} or {0,1})
-        num: (default=True) if True use the numeric detail labels
-                else use the string detail labels. You should prefer numeric labels.
-
-    Return
-    ------
-        detailLabel: the corresponding detail label ("W" is the default if not found)
-
-    Note : Could be better optimized but this is fast enough.
-    """
-    # prefer numeric detail label
-    detail_label_num={
-        57207:0, # Signal
-        4613:1,
-        8145:2,
-        4610:3,
-        917703: 105, #Z
-        5127399:111,
-        4435976:112,
-        4187604:113,
-        2407146:114,
-        1307751:115,
-        944596:122,
-        936590:123,
-        1093224:124,
-        225326:132,
-        217575:133,
-        195328:134,
-        254338:135,
-        2268701:300 #T
-        }
-    # complementary for W detaillabeldict=200
-    #previous alphanumeric detail label    
-    detail_lable_str={
-       57207:"S0",
-       4613:"S1",
-       8145:"S2",
-       4610:"S3",
-       917703:"Z05",
-       5127399:"Z11",
-       4435976:"Z12",
-       4187604:"Z13",
-       2407146:"Z14",
-       1307751:"Z15",
-       944596:"Z22",
-       936590:"Z23",
-       1093224:"Z24",
-       225326:"Z32",
-       217575:"Z33",
-       195328:"Z34",
-       254338:"Z35",
-       2268701:"T"
-    }
-
-    if num:
-        detailLabelDict = detail_label_num
-    else:
-        detailLabelDict = detail_label_str
-
-    iWeight=int(1e7*origWeight+0.5)
-    detailLabel = detailLabelDict.get(iWeight, "W") # "W" is the default value if not found
-    if detailLabel == "W" and (Label != 0 and Label != 'b') :
-        raise ValueError("ERROR! if not in detailLabelDict sould have Label==1 ({}, {})".format(iWeight,Label))
-    return detailLabel
-
-def add_detail_label(data, num=True):
-    """
-    Add a 'detailLabel' column with the detailed labels.
-
-    Args
-    ----
-        data: the dataset should be a pandas.DataFrame like object.
-            This function will modify the given data inplace.
-        num: (default=True) if True use the numeric detail labels
-                else use the string detail labels. You should prefer numeric labels.
-    """
-    if "origWeight" in data.columns:
-        detailLabel = [getDetailLabel(w, label, num=num) for w, label in zip(data["origWeight"], data["Label"])]
-    else:
-        detailLabel = [getDetailLabel(w, label, num=num) for w, label in zip(data["Weight"], data["Label"])]
-    data["detailLabel"] = detailLabel
-
 # ==================================================================================
 
 def bkg_weight_norm(data, systBkgNorm):
@@ -467,35 +465,33 @@ def tau_energy_scale(data, systTauEnergyScale):
     # now recompute the DER quantities which are affected
 
     # first built 4-vectors
-    vtau = V4() # tau 4-vector
-    vtau.setPtEtaPhiM(data["PRI_tau_pt"], data["PRI_tau_eta"], data["PRI_tau_phi"], 0.8) # tau mass 0.8 like in original
+    vtau = V4Array.fromPtEtaPhiM(data["PRI_tau_pt"], data["PRI_tau_eta"], data["PRI_tau_phi"], 0.8) # tau mass 0.8 like in original
 
-    vlep = V4() # lepton 4-vector
-    vlep.setPtEtaPhiM(data["PRI_lep_pt"], data["PRI_lep_eta"], data["PRI_lep_phi"], 0.) # lep mass 0 (either 0.106 or 0.0005 but info is lost)
+    vlep = V4Array.fromPtEtaPhiM(data["PRI_lep_pt"], data["PRI_lep_eta"], data["PRI_lep_phi"], 0.) # lep mass 0 (either 0.106 or 0.0005 but info is lost)
 
-    vmet = V4() # met 4-vector
-    vmet.setPtEtaPhiM(data["PRI_met"], 0., data["PRI_met_phi"], 0.) # met mass zero,
+    vmet = V4Array.fromPtEtaPhiM(data["PRI_met"], 0., data["PRI_met_phi"], 0.) # met mass zero,
 
     # fix MET according to tau pt change
     vtauDeltaMinus = vtau.copy()
     vtauDeltaMinus.scaleFixedM( (1.-systTauEnergyScale)/systTauEnergyScale )
     vmet += vtauDeltaMinus
+    del vtauDeltaMinus
     vmet.pz = 0.
     vmet.e = vmet.eWithM(0.)
     data["PRI_met"] = vmet.pt()
     data["PRI_met_phi"] = vmet.phi()
  
     # compute many vector sum
-    vtransverse = V4()
-    vtransverse.setPtEtaPhiM(vlep.pt(), 0., vlep.phi(), 0.) # just the transverse component of the lepton
+    vtransverse = V4Array.fromPtEtaPhiM(vlep.pt(), 0., vlep.phi(), 0.) # just the transverse component of the lepton
     vtransverse += vmet
     data["DER_mass_transverse_met_lep"] = vtransverse.m()
+    del vtransverse
 
     vltau = vlep + vtau # lep + tau
     data["DER_mass_vis"] = vltau.m()
 
-    vlmet = vlep + vmet # lep + met # Seems to be unused ?
-    vltaumet = vltau + vmet # lep + tau + met
+    vltaumet = vltau # lep + tau + met (reuse vltau memory, it is not needed anymore)
+    vltaumet += vmet
 
     data["DER_pt_h"] = vltaumet.pt()
 
@@ -506,9 +502,6 @@ def tau_energy_scale(data, systTauEnergyScale):
 
     data["DER_met_phi_centrality"] = METphi_centrality(data["PRI_lep_phi"], data["PRI_tau_phi"], data["PRI_met_phi"])
 
-    # delete non trivial objects to save memory (useful?)
-    # del vtau, vlep, vmet, vlmet, vltau, vltaumet
-
     # Fix precision to 3 decimals
     DECIMALS = 3
     
@@ -533,6 +526,26 @@ def tau_energy_scale(data, systTauEnergyScale):
 # ==================================================================================
 import argparse
 
+# Restricted output columns (for compatibility with previous version)
+RESTRICTED_OUTPUT_COLUMNS = [
+    "EventId",
+    "Label",
+    "Weight",
+    "PRI_tau_pt",
+    "PRI_tau_eta",
+    "PRI_tau_phi",
+    "PRI_lep_pt",
+    "PRI_lep_eta",
+    "PRI_lep_phi",
+    "PRI_met",
+    "PRI_met_phi",
+    "DER_mass_transverse_met_lep",
+    "DER_mass_vis",
+    "DER_pt_h",
+    "DER_pt_ratio_lep_tau",
+    "DER_met_phi_centrality",
+    ]
+
 def parse_args():
     """
     ArgumentParser.
@@ -544,10 +557,11 @@ def parse_args():
     # First create a parser with a short description of the program.
     # The parser will automatically handle the usual stuff like the --help messages.
     parser = argparse.ArgumentParser(
-        description="Higgs manipulation script. Can be used to produce new dataset with skewed features."
-                    "Handle : Backgroung Weight norm (--Wnorm) and Tau energy scaling (--tes).\n"
-                    "To get the behaviour of the previous version use :\n"
-                    "--Wnorm 1 --tes 1.05 -r --csv -o atlas-higgs-challenge-2014-v2_v2.5_manip.csv")
+        description="Higgs tautau manipulation script. Merges the htautau (signal) and ztautau (background)"
+                    " datasets into one shuffled dataset with skewed features.\n"
+                    "Handle : Tau energy scaling (--tes).\n"
+                    "The data is processed chunk by chunk and shuffled with temporary files"
+                    " so the memory does not depend on the dataset size.")
 
     # ====================================================================================
     # Real things here
@@ -555,136 +569,114 @@ def parse_args():
 
     parser.add_argument("--quiet", "-q", help="Verbosity level", action="store_true", dest='quiet')
     parser.add_argument("-r", "--restricted", 
-        help="Option flag to write only the needed columns instead of keeping all the information."
+        help="Option flag to read and write only the needed columns instead of keeping all the information."
         "Same behavior as previous version.",
         action="store_true", dest='restricted')
     parser.add_argument("--csv", help="Option flag to prevent compression into gzip file.",
         action="store_true", dest='csv')
-    parser.add_argument("--float-label", help="Option flag to convert labels to float.",
-        action="store_true", dest='float_label')
-   # parser.add_argument('--Wnorm', help='Backgroung Weight norm scale factor', type=float, dest='w_scale')
     parser.add_argument('--tes', help='Tau energy scale factor. Reasonable value [0.9, 1.1]', type=float, dest='tes')
     parser.add_argument('-i1',
-        help='the name of the first input file', dest="in_file1")
+        help='the name of the htautau input file. Default is the htautau dataset (downloaded if needed)',
+        dest="in_file1")
     parser.add_argument('-i2',
-        help='the name of the second input file', dest="in_file2")
+        help='the name of the ztautau input file. Default is the ztautau dataset (downloaded if needed)',
+        dest="in_file2")
+    parser.add_argument('-n', '--nrows', default=None, type=int, dest="nrows",
+        help='the number of rows to read from each input file (default : every row)')
     parser.add_argument('-o', default="data/Higgs_output.csv",
         help='the name of the output file', dest="out_file")
+    parser.add_argument('--format', default="csv", choices=["csv", "parquet", "npy"], dest="fmt",
+        help='the output format : csv, parquet (needs pyarrow) or npy (uncompressed columnar directory)')
+    parser.add_argument('--compression', default=None, choices=["gzip", "zstd"], dest="compression",
+        help='the csv compression (default gzip unless --csv) or the parquet codec')
+    parser.add_argument('--threads', default=None, type=int, dest="threads",
+        help='the number of compression threads (default : number of cpus)')
+    parser.add_argument('--chunksize', default=100000, type=int, dest="chunksize",
+        help='the number of rows read at once from each input file')
+    parser.add_argument('--seed', default=3141526, type=int, dest="seed",
+        help='the seed of the shuffle')
+    parser.add_argument('--buckets', default=16, type=int, dest="n_buckets",
+        help='the number of shuffle buckets. Each bucket (about 1 / buckets of the data) must fit in memory')
+    parser.add_argument('--tmp-dir', default=None, dest="tmp_dir",
+        help='the directory of the temporary shuffle files (default : the system temporary directory)')
 
     # Now do your job and parse my command line !
     args = parser.parse_args()
     return args
 
+def iter_manipulation(chunks, tes=None):
+    """
+    Prepare the merged chunks for the skewing and apply the manipulations to every chunk
+    (they all work row by row).
+
+    Args
+    ----
+        chunks: iterable of pandas.DataFrame (see iter_higgstautau).
+        tes: (default=None) the tau energy scale factor (see tau_energy_scale).
+
+    Yield
+    -----
+        data : the manipulated chunks
+    """
+    for data in chunks:
+        data = data.rename(columns=COLUMN_RENAME_FOR_SKEWING)
+        if tes is not None:
+            tau_energy_scale(data, tes)
+        yield data
+
+def add_event_id(chunks):
+    """
+    Number the events of the given chunks in their order (EventId as first column).
+
+    Yield
+    -----
+        data : the chunks with the EventId column
+    """
+    start = 0
+    for data in chunks:
+        data.insert(0, "EventId", np.arange(start, start + len(data)))
+        start += len(data)
+        yield data
+
 if __name__ == '__main__':
+    from .higgsml import output_file_name
+    from .shuffle import external_shuffle
+    from .writers import write_chunks
+
     args = parse_args()
     
     quiet = args.quiet # quiet flag
     restricted = args.restricted # restricted flag
-    float_label = args.float_label # label to float flag
     csv = args.csv # csv flag
-    #w_scale = args.w_scale # Weight scaling factor
     tes = args.tes # Tau energy scale factor
     in_file1 = args.in_file1 # first input file
     in_file2 = args.in_file2 # second input file
     out_file = args.out_file # output file
+    fmt = args.fmt # output format
 
-
-    # Restrict the column output (for compatibility with previous version)
-    columns = [ "EventId",
-                "Label",
-                "Weight",
-                "PRI_tau_pt",
-                "PRI_tau_eta",
-                "PRI_tau_phi",
-                "PRI_lep_pt",
-                "PRI_lep_eta",
-                "PRI_lep_phi",
-                "PRI_met",
-                "PRI_met_phi",
-                #"DER_mass_MMC",
-                "DER_mass_transverse_met_lep",
-                "DER_mass_vis",
-                "DER_pt_h",
-                #"DER_deltaeta_jet_jet",
-                #"DER_mass_jet_jet",
-                #"DER_prodeta_jet_jet",
-                #"DER_deltar_tau_lep",
-                #"DER_pt_tot",
-                #"DER_sum_pt",
-                "DER_pt_ratio_lep_tau",
-                "DER_met_phi_centrality",
-                #"DER_lep_eta_centrality",
-                #"PRI_met_sumet",
-                #"PRI_jet_num",
-                #"PRI_jet_leading_pt",
-                #"PRI_jet_leading_eta",
-                #"PRI_jet_leading_phi",
-                #"PRI_jet_subleading_pt",
-                #"PRI_jet_subleading_eta",
-                #"PRI_jet_subleading_phi",
-                #"PRI_jet_all_pt",
-                #"Weight",
-                #"origWeight",
-                #"detailLabel",
-                ] if restricted else None
+    columns = None
+    if restricted:
+        # the DER features are only computed by the tau energy scale
+        columns = [name for name in RESTRICTED_OUTPUT_COLUMNS if tes is not None or not name.startswith("DER_")]
+    compression = args.compression
+    if fmt == "csv" and compression is None and not csv:
+        compression = "gzip"
+    out_file = output_file_name(out_file, fmt, compression)
 
     if not quiet:
-        print("Loading the dataset")
-
-    data1 = load_higgs(in_file1)
-    #print ("DATA 1 lecture")
-    print (data1)
-    data2 = load_higgs(in_file2)
-    data1["Label"] = add_Label1(data1)
-    #print ("DATA 1 après")
-    #print (data1)
-    data2["Label"] = add_Label2(data2)
-    data1["Weight"] = add_Weight1(data1)
-    data2["Weight"] = add_Weight2(data2)
-
-    if float_label:
-        if not quiet:
-            print("Label convertion to float")
-        label_to_float(data1)
-        label_to_float(data2)
-    #if w_scale is not None:
-     #   if not quiet:
-     #       print("Weight rescaling :", w_scale)
-     #   bkg_weight_norm(data, w_scale)
-    if tes is not None:
-        if not quiet:
+        print("Streaming the datasets by chunks of", args.chunksize, "rows")
+        if tes is not None:
             print("Tau energy rescaling :", tes)
-        tau_energy_scale(data1, tes)
-        tau_energy_scale(data2, tes)
-    
-    #print ("DATA 1")
-    #print (data1)
-    #print ("DATA 2")
-    #print (data2)
-    
-    frames = [data1,data2]
-    data = pd.concat(frames)
-    #print (data)
-    from random import sample
-    # given data frame data, create random index
-    import random
-    random.seed(3141526)
-    rindex =  np.array(sample(xrange(len(data1)), len(data1)))
-    #print (rindex)
-    print (len(rindex))
-    data_randomised = data.ix[rindex]
-    data_randomised["EventId"] = add_EventId(data_randomised)
-
-
-
-    compression = None if csv else "gzip"
-    _, ext = os.path.splitext(out_file)
-    if csv and ext != ".csv":
-        out_file += ".csv"
-    elif not csv and ext != ".gz":
-        out_file += ".gz"
-    if not quiet:
+        print("Shuffling with seed", args.seed, "into", args.n_buckets, "buckets")
         print("Writting results to :", out_file)
-    #data.to_csv(out_file, index=False, compression=compression, columns=columns)
-    data_randomised.to_csv(out_file, index=False, compression=compression, columns=columns)
+
+    chunks = iter_higgstautau(chunksize=args.chunksize, nrows=args.nrows, restricted_cols=restricted,
+                              htautau_file=in_file1, ztautau_file=in_file2)
+    chunks = iter_manipulation(chunks, tes=tes)
+    chunks = external_shuffle(chunks, n_buckets=args.n_buckets, seed=args.seed, tmp_dir=args.tmp_dir)
+    chunks = add_event_id(chunks)
+    n_rows = write_chunks(chunks, out_file, fmt=fmt, compression=compression,
+                          threads=args.threads, columns=columns)
+    if not quiet:
+        print(n_rows, "rows written")
     print("Done.")
@@ -0,0 +1,159 @@
+# coding: utf-8
+"""
+Mini-batch loader for the in-memory (or memory mapped) datasets returned by the load functions.
+
+The data is converted to numpy arrays once. Every epoch draws a new permutation of the row
+indices from (seed, epoch) so that the shuffling is deterministic and nothing but the indices
+is copied. A background thread gathers the next batches while the current one is consumed
+(numpy releases the GIL while copying).
+
+Example
+-------
+    X, y = load_mnist(scaled=False)
+    loader = BatchLoader(X, y, batch_size=128, seed=42, transform=scale_mnist)
+    for epoch in range(10):
+        for X_batch, y_batch in loader:
+            ...
+"""
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import queue
+import threading
+
+import numpy as np
+
+
+class BatchLoader(object):
+    """
+    Iterates over shuffled mini-batches of X, y (and W) as contiguous numpy arrays.
+    Each iteration over the loader is one epoch.
+    """
+    def __init__(self, X, y=None, W=None, batch_size=128, shuffle=True, seed=None, drop_last=False,
+                 prefetch=2, transform=None):
+        """
+        Args
+        ----
+            X: the features (numpy array, numpy memory map, pandas.DataFrame, ...).
+            y: (default=None) the labels, same first dimension as X.
+            W: (default=None) the weights, same first dimension as X.
+            batch_size: (default=128) the number of rows per batch.
+            shuffle: (default=True) if False the batches follow the order of the data.
+            seed: (default=None) the seed (int) of the shuffling. None means random
+                (but every epoch of this loader is still reproducible with loader.seed).
+            drop_last: (default=False) if True drop the last incomplete batch.
+            prefetch: (default=2) the number of batches prepared in advance by the background thread.
+                0 means no background thread.
+            transform: (default=None) function applied to every X batch (ex: mnist.scale_mnist)
+                in the background thread.
+        """
+        self.arrays = [_as_array(arr) for arr in (X, y, W) if arr is not None]
+        length = len(self.arrays[0])
+        for i, arr in enumerate(self.arrays):
+            if len(arr) != length:
+                raise ValueError("Every array should have the same length : array {} length = {}"
+                                 " array 1 length = {}".format(i+1, len(arr), length))
+        self.n_samples = length
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.seed = np.random.SeedSequence().entropy if seed is None else seed
+        self.drop_last = drop_last
+        self.prefetch = prefetch
+        self.transform = transform
+        self.epoch = 0
+
+    def __len__(self):
+        if self.drop_last:
+            return self.n_samples // self.batch_size
+        return -(-self.n_samples // self.batch_size)
+
+    def __iter__(self):
+        epoch = self.epoch
+        self.epoch += 1
+        return self.iter_epoch(epoch)
+
+    def permutation(self, epoch):
+        """The order of the rows for the given epoch (None if shuffle is False)"""
+        if not self.shuffle:
+            return None
+        rng = np.random.default_rng(np.random.SeedSequence(self.seed, spawn_key=(epoch,)))
+        return rng.permutation(self.n_samples)
+
+    def iter_epoch(self, epoch):
+        """
+        Iterates over the batches of the given epoch (the same epoch always gives the same batches).
+
+        Yield
+        -----
+            batch : tuple of the batches of X, y and W (only those given to the loader)
+        """
+        order = self.permutation(epoch)
+        batches = (self._batch(order, start) for start in range(0, len(self) * self.batch_size, self.batch_size))
+        if self.prefetch > 0:
+            batches = _prefetch(batches, self.prefetch)
+        for batch in batches:
+            yield batch
+
+    def _batch(self, order, start):
+        stop = min(start + self.batch_size, self.n_samples)
+        if order is None:
+            batch = [np.ascontiguousarray(arr[start:stop]) for arr in self.arrays]
+        else:
+            # sorted indices : better memory locality (the rows of a batch are already random)
+            indices = np.sort(order[start:stop])
+            batch = [np.take(arr, indices, axis=0) for arr in self.arrays]
+        if self.transform is not None:
+            batch[0] = self.transform(batch[0])
+        return tuple(batch)
+
+
+def _as_array(arr):
+    """pandas objects to numpy arrays (numpy arrays and memory maps are not copied)"""
+    if hasattr(arr, "to_numpy"):
+        return arr.to_numpy()
+    return np.asarray(arr)
+
+
+def _prefetch(iterator, size):
+    """
+    Consume the iterator in a background thread, at most size items in advance.
+    The thread stops when the returned generator is closed or garbage collected.
+    """
+    items = queue.Queue(maxsize=size)
+    stop = threading.Event()
+    done = object()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def worker():
+        try:
+            for item in iterator:
+                if not put((item, None)):
+                    return
+        except BaseException as e:
+            put((None, e))
+            return
+        put((done, None))
+
+    thread = threading.Thread(target=worker)
+    thread.daemon = True
+    thread.start()
+    try:
+        while True:
+            item, error = items.get()
+            if error is not None:
+                raise error
+            if item is done:
+                return
+            yield item
+    finally:
+        stop.set()
+        thread.join()
@@ -5,6 +5,9 @@ import pandas as pd
 from .download import maybe_download
 from .download import get_data_dir
 
+COLUMNS = ['fLength', 'fWidth', 'fSize', 'fConc', 
+            'fConc1', 'fAsym', 'fM3Long', 'fM3Trans', 'fAlpha', 
+            'fDist', 'class']
 
 
 def load_gamma_telescope():
@@ -13,10 +16,27 @@ def load_gamma_telescope():
     filepath = os.path.join(get_data_dir(), "magic04.data")
     maybe_download(filepath, url)
     data = pd.read_csv(filepath)
-    data.columns = ['fLength', 'fWidth', 'fSize', 'fConc', 
-                'fConc1', 'fAsym', 'fM3Long', 'fM3Trans', 'fAlpha', 
-                'fDist', 'class']
+    data.columns = COLUMNS
     X = data.drop(['class'], axis=1)
     y = data['class']
     return X, y
+
+
+def iter_gamma_telescope(chunksize=10000):
+    """
+    Iterates over the MAGIC Gamma Telescope dataset by chunks of rows.
+    Only one chunk at a time is held in memory.
+
+    Yield
+    -----
+        X, y : a chunk of the data and the corresponding labels
+    """
+    url='https://archive.ics.uci.edu/ml/machine-learning-databases/magic/magic04.data'
+    filepath = os.path.join(get_data_dir(), "magic04.data")
+    maybe_download(filepath, url)
+    for data in pd.read_csv(filepath, chunksize=chunksize):
+        data.columns = COLUMNS
+        X = data.drop(['class'], axis=1)
+        y = data['class']
+        yield X, y
  
\ No newline at end of file
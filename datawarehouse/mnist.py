@@ -2,52 +2,201 @@
 import sys
 import os
 import gzip
+import json
+import tempfile
+import warnings
 
 import pandas as pd
 import numpy as np
 
-from .download import maybe_download
+from .download import maybe_download_all
 from .download import get_data_dir
+from .cache import source_info
 
-def _load_mnist_images(filename):
-    # Read the inputs in Yann LeCun's binary format.
+SOURCE_URL = 'http://yann.lecun.com/exdb/mnist/'
+FNAME_TRAIN_IMAGES = 'train-images-idx3-ubyte.gz'
+FNAME_TRAIN_LABELS = 'train-labels-idx1-ubyte.gz'
+FNAME_TEST_IMAGES = 't10k-images-idx3-ubyte.gz'
+FNAME_TEST_LABELS = 't10k-labels-idx1-ubyte.gz'
+
+def _maybe_download_mnist():
+    data_dir = get_data_dir()
+    maybe_download_all([(os.path.join(data_dir, fname), SOURCE_URL+fname)
+                        for fname in [FNAME_TRAIN_IMAGES, FNAME_TRAIN_LABELS, FNAME_TEST_IMAGES, FNAME_TEST_LABELS]])
+    return data_dir
+
+# Decoded cache : the uint8 images and labels, train set followed by test set
+CACHE_IMAGES = 'mnist-images-uint8.npy'
+CACHE_LABELS = 'mnist-labels-uint8.npy'
+# Size and modification time of the IDX files the cache was decoded from
+CACHE_SOURCES = 'mnist-cache.json'
+
+def load_mnist(scaled=True):
+    """
+    Loads MNIST (train set followed by test set), and downloads it if necessary.
+
+    The IDX files are decoded once into uncompressed .npy files of the data directory
+    which are then memory mapped. If the data directory is not writable, a RuntimeWarning
+    is issued and the IDX files are decoded in memory at every call.
+
+    Args
+    ----
+        scaled: (default=True) if True the images are converted to float32 in range [0, 255/256]
+            and the labels are copied : both are writable arrays held in memory.
+            If False the images and labels are the READ-ONLY uint8 memory maps
+            (use scale_mnist on every batch and copy before modifying them).
+
+    Return
+    ------
+        X, y : the images (shape (70000, 28, 28, 1)) and the labels (uint8)
+    """
+    X, y, n_train = _load_mnist_cache()
+    if scaled:
+        X = scale_mnist(X)
+        y = np.array(y)
+    return X, y
+
+def load_mnist_split():
+    """
+    Loads the train and test sets of MNIST as views of the decoded uint8 cache (see load_mnist).
+    Nothing is copied : use scale_mnist on every batch. The views are READ-ONLY memory maps.
+
+    Return
+    ------
+        (X_train, y_train), (X_test, y_test) : the read-only uint8 images and labels of each set
+    """
+    X, y, n_train = _load_mnist_cache()
+    return (X[:n_train], y[:n_train]), (X[n_train:], y[n_train:])
+
+def scale_mnist(X):
+    """
+    Convert uint8 MNIST images to float32 in range [0, 255/256].
+    (Not [0, 1], for compatibility to the version provided at http://deeplearning.net/data/mnist/mnist.pkl.gz.)
+    """
+    return np.true_divide(X, np.float32(256), dtype=np.float32)
+
+def _load_mnist_cache():
+    """Returns the memory mapped images and labels and the number of train images"""
+    data_dir = _maybe_download_mnist()
+    images_file = os.path.join(data_dir, CACHE_IMAGES)
+    labels_file = os.path.join(data_dir, CACHE_LABELS)
+    sources_file = os.path.join(data_dir, CACHE_SOURCES)
+    sources = _mnist_sources(data_dir)
+    n_train = _idx_count(os.path.join(data_dir, FNAME_TRAIN_LABELS))
+    if not (os.path.exists(images_file) and os.path.exists(labels_file)) or _read_json(sources_file) != sources:
+        try:
+            _write_mnist_cache(data_dir, images_file, labels_file)
+            _write_json(sources_file, sources)
+        except (IOError, OSError) as e:
+            # Read-only data directory : decode the IDX files in memory
+            warnings.warn("Could not write the MNIST cache in {} : {}".format(data_dir, e), RuntimeWarning)
+            n_items = _mnist_count(data_dir)
+            X, y = [_decode_mnist(data_dir, np.empty((n_items,) + idx[1], dtype=np.uint8), idx)
+                    for idx in [IDX_IMAGES, IDX_LABELS]]
+            X.flags.writeable = False
+            y.flags.writeable = False
+            return X, y, n_train
+    X = np.load(images_file, mmap_mode='r')
+    y = np.load(labels_file, mmap_mode='r')
+    return X, y, n_train
+
+def _mnist_sources(data_dir):
+    """Size and modification time of the IDX files (the cache is decoded again when they change)"""
+    return [source_info(os.path.join(data_dir, fname), checksum=False)
+            for fname in [FNAME_TRAIN_IMAGES, FNAME_TRAIN_LABELS, FNAME_TEST_IMAGES, FNAME_TEST_LABELS]]
+
+def _read_json(filename):
+    try:
+        with open(filename, 'r') as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+
+def _write_json(filename, obj):
+    tmp = _make_tmp_file(filename)
+    try:
+        with open(tmp, 'w') as f:
+            json.dump(obj, f, indent=1)
+        os.replace(tmp, filename)
+    except BaseException:
+        os.remove(tmp)
+        raise
+
+def _make_tmp_file(filename):
+    """
+    Make a uniquely named temporary file next to filename (concurrent builds do not share it).
+    mkstemp creates it with mode 0600 : it is given the default mode (umask) of a new file
+    so that a shared data directory stays readable by the other users.
+    """
+    fd, tmp = tempfile.mkstemp(prefix=os.path.basename(filename) + ".", suffix=".tmp",
+                               dir=os.path.dirname(os.path.abspath(filename)))
+    os.close(fd)
+    umask = os.umask(0)
+    os.umask(umask)
+    os.chmod(tmp, 0o666 & ~umask)
+    return tmp
+
+# (header size, item shape, IDX files) of the images and of the labels
+IDX_IMAGES = (16, (28, 28, 1), [FNAME_TRAIN_IMAGES, FNAME_TEST_IMAGES])
+IDX_LABELS = (8, (), [FNAME_TRAIN_LABELS, FNAME_TEST_LABELS])
+
+def _mnist_count(data_dir):
+    return sum(_idx_count(os.path.join(data_dir, fname)) for fname in [FNAME_TRAIN_LABELS, FNAME_TEST_LABELS])
+
+def _decode_mnist(data_dir, out, idx, batch_size=10000):
+    # Decode the IDX files batch after batch into out
+    offset, item_shape, fnames = idx
+    start = 0
+    for fname in fnames:
+        for batch in _iter_idx_file(os.path.join(data_dir, fname), offset, item_shape, batch_size):
+            out[start:start+len(batch)] = batch
+            start += len(batch)
+    if start != len(out):
+        raise IOError("MNIST files are truncated : expected {} items got {}".format(len(out), start))
+    return out
+
+def _write_mnist_cache(data_dir, images_file, labels_file):
+    # Decode the IDX files into temporary .npy files, renamed once complete
+    n_items = _mnist_count(data_dir)
+    for out_file, idx in [(images_file, IDX_IMAGES), (labels_file, IDX_LABELS)]:
+        tmp = _make_tmp_file(out_file)
+        try:
+            out = np.lib.format.open_memmap(tmp, mode='w+', dtype=np.uint8, shape=(n_items,) + idx[1])
+            _decode_mnist(data_dir, out, idx)
+            out.flush()
+            del out
+            os.replace(tmp, out_file)
+        except BaseException:
+            os.remove(tmp)
+            raise
+
+def _idx_count(filename):
+    # The number of items is the big endian int32 after the magic number
     with gzip.open(filename, 'rb') as f:
-        data = np.frombuffer(f.read(), np.uint8, offset=16)
-    # The inputs are vectors now, we reshape them to monochrome 2D images,
-    # following the shape convention: [batch_size, image_width, image_height, channels]
-    data = data.reshape(-1, 28, 28, 1)
-    # The inputs come as bytes, we convert them to float32 in range [0,1].
-    # (Actually to range [0, 255/256], for compatibility to the version
-    # provided at http://deeplearning.net/data/mnist/mnist.pkl.gz.)
-    return data / np.float32(256)
-
-def _load_mnist_labels(filename):
-    # Read the labels in Yann LeCun's binary format.
+        header = f.read(8)
+    return int(np.frombuffer(header, '>i4')[1])
+
+def _iter_idx_file(filename, offset, item_shape, batch_size):
+    # Read a Yann LeCun's binary file batch after batch (without decompressing it all).
+    item_size = int(np.prod(item_shape))
     with gzip.open(filename, 'rb') as f:
-        data = np.frombuffer(f.read(), np.uint8, offset=8)
-    # The labels are vectors of integers now, that's exactly what we want.
-    return data
+        f.read(offset)
+        while True:
+            buf = f.read(batch_size * item_size)
+            if not buf:
+                break
+            yield np.frombuffer(buf, np.uint8).reshape((-1,) + item_shape)
 
-def load_mnist():
+def iter_mnist(batch_size=1000):
     """
-    TODO : doc
-    """
-    source_url = 'http://yann.lecun.com/exdb/mnist/'
-    fname_train_images = 'train-images-idx3-ubyte.gz'
-    fname_train_labels = 'train-labels-idx1-ubyte.gz'
-    fname_test_images = 't10k-images-idx3-ubyte.gz'
-    fname_test_labels = 't10k-labels-idx1-ubyte.gz'
-    data_dir = get_data_dir()
-    maybe_download(os.path.join(data_dir, fname_train_images), source_url+fname_train_images)
-    maybe_download(os.path.join(data_dir, fname_train_labels), source_url+fname_train_labels)
-    maybe_download(os.path.join(data_dir, fname_test_images), source_url+fname_test_images)
-    maybe_download(os.path.join(data_dir, fname_test_labels), source_url+fname_test_labels)
-
-    X_train = _load_mnist_images(os.path.join(data_dir, fname_train_images))
-    y_train = _load_mnist_labels(os.path.join(data_dir, fname_train_labels))
-    X_test = _load_mnist_images(os.path.join(data_dir, fname_test_images))
-    y_test = _load_mnist_labels(os.path.join(data_dir, fname_test_labels))
-    X = np.concatenate([X_train, X_test], axis=0)
-    y = np.concatenate([y_train, y_test], axis=0)
+    Iterates over MNIST by batches (train set first then test set, same order as load_mnist).
+    The batches are read from the decoded memory mapped cache (see load_mnist) and scaled one at a time.
+    A batch never mixes train and test images, hence the last train batch may be smaller.
 
-    return X, y
+    Yield
+    -----
+        X, y : a batch of images (float32 in range [0, 255/256]) and the corresponding labels
+    """
+    for X_set, y_set in load_mnist_split():
+        for start in range(0, len(X_set), batch_size):
+            yield scale_mnist(X_set[start:start+batch_size]), np.array(y_set[start:start+batch_size])
@@ -1,14 +1,30 @@
 # coding: utf-8
 import os
+import tempfile
+from contextlib import contextmanager
+
 import numpy as np
 
-def shuffle_array(*args):
+def shuffle_array(*args, seed=None, inplace=False, lazy=False, out=None, block_size=65536):
     """
     Shuffle the given data. Keeps the relative associations arr_j[i] <-> arr_k[i].
 
+    Without keyword arguments the arrays are copied in a random order drawn from
+    the global numpy.random state (previous behaviour). The other modes use a numpy.random.Generator :
+     - inplace=True : permute the arrays in place, nothing is copied.
+     - lazy=True : return PermutedArray views, the rows are read in the shuffled order on access.
+     - out=(out_1, ..., out_n) : blocked shuffle into the given arrays (which can be memory maps)
+       for arrays that do not fit twice in memory.
+
     Params
     ------
         args: (numpy arrays tuple) arr_1, arr_2, ..., arr_n to be shuffled.
+        seed: (default=None) int, numpy.random.SeedSequence or numpy.random.Generator.
+            None means random (or the global numpy.random state if no mode is given).
+        inplace: (default=False) if True shuffle the arrays in place.
+        lazy: (default=False) if True return lazy permuted views.
+        out: (default=None) the output arrays, one per given array (same shape).
+        block_size: (default=65536) the number of rows written at once with out.
     Return
     ------
         X, y : the shuffled arrays.
@@ -21,15 +37,102 @@ def shuffle_array(*args):
     for i, arr in enumerate(args):
         assert arr.shape[0] == length, "Every array should have the same shape: " \
                         " array {} length = {}  array 1 length = {} ".format(i+1, arr.shape[0], length)
-    # Make the random indices
-    indices = np.arange(length)
-    np.random.shuffle(indices)
-    # Return shuffled arrays
+    if (inplace, lazy, out is not None).count(True) > 1:
+        raise ValueError('inplace, lazy and out are mutually exclusive')
+    if seed is None and not (inplace or lazy or out is not None):
+        # Make the random indices
+        indices = np.arange(length)
+        np.random.shuffle(indices)
+        # Return shuffled arrays
+        return tuple(arr[indices] for arr in args)
+    rng = np.random.default_rng(seed)
+    if inplace:
+        # The same generator state for every array gives the same permutation
+        state = rng.bit_generator.state
+        for arr in args:
+            rng.bit_generator.state = state
+            rng.shuffle(_row_view(arr))
+        return args
+    indices = rng.permutation(length)
+    if lazy:
+        return tuple(PermutedArray(arr, indices) for arr in args)
+    if out is not None:
+        if len(out) != len(args):
+            raise ValueError('out must have one array per given array')
+        for arr, arr_out in zip(args, out):
+            _blocked_take(arr, indices, arr_out, block_size)
+        return tuple(out)
     return tuple(arr[indices] for arr in args)
 
-def make_pizza_slice(n_samples=500, radius_sep=0.5, radius_max=1, start_angle=0, end_angle=1, shuffle=True):
+def _row_view(arr):
+    """
+    View of a C contiguous array as a 1D array of rows (numpy void items), sharing its memory.
+    The 1D shuffle swaps whole rows with memcpy instead of the slow n-dimensional path
+    and draws the same permutation.
+    """
+    if not isinstance(arr, np.ndarray) or arr.dtype.hasobject or not arr.flags.c_contiguous:
+        return arr
+    if arr.ndim == 1:
+        return np.asarray(arr) # memory maps are not shuffled by the fast path
+    rows = np.asarray(arr).reshape(len(arr), -1)
+    return rows.view(np.dtype((np.void, rows.shape[1] * rows.itemsize))).reshape(len(arr))
+
+def _blocked_take(arr, indices, out, block_size):
+    """out[i] = arr[indices[i]] block after block of rows"""
+    if out.shape != arr.shape:
+        raise ValueError('out shape {} does not match array shape {}'.format(out.shape, arr.shape))
+    for start in range(0, len(indices), block_size):
+        block = indices[start:start+block_size]
+        # Read the source in increasing order (sequential access on memory maps)
+        order = np.argsort(block)
+        rows = np.take(arr, block[order], axis=0)
+        out[start + order] = rows
+
+class PermutedArray(object):
+    """
+    Lazy view of an array in a permuted order : view[i] = arr[indices[i]].
+    The rows are only copied on access (np.asarray(view) copies the whole array).
+    """
+    def __init__(self, arr, indices):
+        self.arr = arr
+        self.indices = indices
+
+    @property
+    def shape(self):
+        return (len(self.indices),) + self.arr.shape[1:]
+
+    @property
+    def dtype(self):
+        return self.arr.dtype
+
+    @property
+    def ndim(self):
+        return self.arr.ndim
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __getitem__(self, key):
+        if isinstance(key, tuple):
+            rows = self[key[0]]
+            if np.ndim(self.indices[key[0]]) == 0:
+                return rows[key[1:]]
+            return rows[(slice(None),) + key[1:]]
+        return self.arr[self.indices[key]]
+
+    def __array__(self, dtype=None, copy=None):
+        data = np.take(self.arr, self.indices, axis=0)
+        return data if dtype is None else data.astype(dtype, copy=False)
+
+def make_pizza_slice(n_samples=500, radius_sep=0.5, radius_max=1, start_angle=0, end_angle=1, shuffle=True,
+                     seed=None, dtype=None, batch_size=1000000, n_jobs=1, out=None):
     """
     Make the toy dataset.
+
+    Without seed, dtype, n_jobs and out the global numpy.random state is used (previous behaviour).
+    Otherwise the dataset is generated block by block like iter_pizza_slice, directly in the
+    shuffled order (no copy by shuffle_array). The blocks can be generated by several processes :
+    every block has its own random stream hence the result does not depend on n_jobs.
     
     Parameters
     ----------
@@ -38,14 +141,48 @@ def make_pizza_slice(n_samples=500, radius_sep=0.5, radius_max=1, start_angle=0,
         radius_max : (float, default=1) the radius of the complete data
         start_angle : the start angle
         end_angle : the end angle
+        shuffle : (default=True) if False the samples of class 0 come first
+        seed : (default=None) int or numpy.random.SeedSequence (see iter_pizza_slice)
+        dtype : (default=None) the dtype of X and y (see iter_pizza_slice). None means float64
+        batch_size : (default=1000000) the number of samples generated at once (see iter_pizza_slice)
+        n_jobs : (default=1) number of processes. The blocks are shared between n_jobs processes.
+            -1 means all the CPUs. Without out, the processes write directly into the returned arrays
+            (mapped from temporary files in /dev/shm when available, removed once generated).
+            With a numpy.memmap out they write directly into it. With any other out they write into
+            shared memory buffers which are then copied into out (twice the memory).
+        out : (default=None) preallocated (X, y) arrays receiving the data, for instance numpy.memmap
+            (np.lib.format.open_memmap) for datasets larger than the memory. dtype is the one of X.
     Return
     ------
         X: (numpy.ndarray, [n_samples, 2]) the data
         y: (numpy.ndarray, [n_samples]) the labels
     """
     assert radius_sep < radius_max, "radius_sep should be strictly smaller than radius_max."
+    if seed is not None or dtype is not None or n_jobs != 1 or out is not None:
+        blocks_seq, counts = _pizza_blocks(n_samples, batch_size, shuffle, seed)
+        params = (radius_sep, radius_max, start_angle, end_angle, shuffle)
+        if n_jobs is not None and n_jobs < 0:
+            n_jobs = os.cpu_count() or 1
+        parallel = n_jobs is not None and n_jobs > 1 and len(counts) > 1
+        if out is None:
+            dtype = np.float64 if dtype is None else dtype
+            if parallel:
+                with _temporary_outputs(n_samples, dtype) as (X, y):
+                    _pizza_parallel(X, y, blocks_seq, counts, batch_size, params, n_jobs)
+                return X.view(np.ndarray), y.view(np.ndarray)
+            X = np.empty(shape=(n_samples, 2), dtype=dtype)
+            y = np.empty(n_samples, dtype=dtype)
+        else:
+            X, y = out
+            if X.shape != (n_samples, 2) or y.shape != (n_samples,):
+                raise ValueError("out arrays should have the shapes {} and {}".format((n_samples, 2), (n_samples,)))
+        if parallel:
+            _pizza_parallel(X, y, blocks_seq, counts, batch_size, params, n_jobs)
+        else:
+            _make_pizza_blocks(X, y, blocks_seq, counts, batch_size, params, range(len(counts)))
+        return X, y
     rho_0 = np.random.uniform(high=radius_sep, size=n_samples//2)
-    rho_1 = np.random.uniform(low=radius_sep, high=radius_max, size=n_samples//2)
+    rho_1 = np.random.uniform(low=radius_sep, high=radius_max, size=n_samples-n_samples//2)
     rho = np.concatenate((rho_0, rho_1), axis=0)
     
     theta = np.random.uniform(low=start_angle, high=end_angle, size=n_samples)
@@ -60,3 +197,203 @@ def make_pizza_slice(n_samples=500, radius_sep=0.5, radius_max=1, start_angle=0,
     if shuffle:
         X, y = shuffle_array(X, y)
     return X, y
+
+def iter_pizza_slice(n_samples=500, radius_sep=0.5, radius_max=1, start_angle=0, end_angle=1, shuffle=True,
+                     seed=None, dtype=np.float64, batch_size=1000000):
+    """
+    Generate the toy dataset (see make_pizza_slice) batch by batch with numpy.random.Generator.
+    Only one batch at a time is held in memory.
+
+    The n_samples//2 samples of class 0 and the others of class 1 are directly placed in
+    a uniformly shuffled order : the number of samples of class 1 in every batch is drawn from
+    the hypergeometric distribution, then the labels are shuffled inside the batch.
+    numpy only draws hypergeometric numbers below 10**9 samples per class : above (n_samples >= 2*10**9)
+    the counts are drawn from the binomial approximation, clipped so that the class totals stay exact.
+    Every batch has its own random stream (spawned from the seed) : the same
+    (seed, batch_size) always gives the same dataset.
+
+    Parameters
+    ----------
+        n_samples : (int, default=500) the total number of samples in the dataset
+        radius_sep : (float, default=0.5) the radius of the frontier between the 2 classes
+        radius_max : (float, default=1) the radius of the complete data
+        start_angle : the start angle
+        end_angle : the end angle
+        shuffle : (default=True) if False the samples of class 0 come first
+        seed : (default=None) int or numpy.random.SeedSequence. None means random.
+        dtype : (default=numpy.float64) the dtype of X and y : numpy.float32 or numpy.float64
+        batch_size : (default=1000000) the number of samples per batch
+    Yield
+    -----
+        X: (numpy.ndarray, [batch_size, 2]) a batch of the data
+        y: (numpy.ndarray, [batch_size]) the labels of the batch
+    """
+    assert radius_sep < radius_max, "radius_sep should be strictly smaller than radius_max."
+    blocks_seq, counts = _pizza_blocks(n_samples, batch_size, shuffle, seed)
+    for i, n_ones in enumerate(counts):
+        start = i * batch_size
+        n = min(batch_size, n_samples - start)
+        X = np.empty(shape=(n, 2), dtype=dtype)
+        y = np.empty(n, dtype=dtype)
+        _make_pizza_block(_block_seed(blocks_seq, i), n_ones, radius_sep, radius_max, start_angle, end_angle,
+                          shuffle, X, y)
+        yield X, y
+
+def _pizza_blocks(n_samples, batch_size, shuffle, seed):
+    """
+    Returns the root of the block random streams and the number of samples of class 1 in every block.
+    """
+    seed_seq = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+    # Not seed_seq.spawn(2) : a SeedSequence given as seed must not be modified
+    counts_seq, blocks_seq = [_block_seed(seed_seq, i) for i in range(2)]
+    rng = np.random.default_rng(counts_seq)
+    n_zeros = n_samples // 2
+    n_ones = n_samples - n_zeros
+    counts = []
+    for start in range(0, n_samples, batch_size):
+        n = min(batch_size, n_samples - start)
+        if not shuffle:
+            # class 0 first : the block overlap with [n_samples//2, n_samples)
+            k = min(max(start + n - n_samples // 2, 0), n)
+        elif n == n_zeros + n_ones:
+            k = n_ones
+        else:
+            k = _draw_ones(rng, n_ones, n_zeros, n) if n_ones and n_zeros else (n if n_ones else 0)
+        counts.append(int(k))
+        n_ones -= k
+        n_zeros -= n - k
+    return blocks_seq, np.array(counts, dtype=np.int64)
+
+# numpy.random.Generator.hypergeometric needs ngood and nbad < 10**9
+HYPERGEOMETRIC_MAX = 10**9
+
+def _draw_ones(rng, n_ones, n_zeros, n):
+    """Number of samples of class 1 among n drawn without replacement from n_ones + n_zeros samples"""
+    if n_ones < HYPERGEOMETRIC_MAX and n_zeros < HYPERGEOMETRIC_MAX:
+        return rng.hypergeometric(n_ones, n_zeros, n)
+    # Binomial approximation : the relative error on the variance is about n / (n_ones + n_zeros).
+    # Clipped to the feasible counts so that the remaining blocks can still be filled.
+    k = rng.binomial(n, n_ones / (n_ones + n_zeros))
+    return min(max(k, n - n_zeros), n_ones)
+
+def _make_pizza_blocks(X, y, blocks_seq, counts, batch_size, params, blocks):
+    """Fill the given blocks of X and y"""
+    for i in blocks:
+        start = i * batch_size
+        stop = min(start + batch_size, len(y))
+        _make_pizza_block(_block_seed(blocks_seq, i), counts[i], *(params + (X[start:stop], y[start:stop])))
+
+def _pizza_parallel(X, y, blocks_seq, counts, batch_size, params, n_jobs):
+    """
+    Run _make_pizza_blocks on contiguous ranges of blocks in a process pool.
+    The processes write directly into X and y if they are numpy.memmap (see _temporary_outputs),
+    otherwise into shared memory buffers copied into X and y at the end (no pickling of the arrays).
+    """
+    from multiprocessing import shared_memory
+    from concurrent.futures import ProcessPoolExecutor
+
+    buffers = []
+    try:
+        targets = []
+        for arr in (X, y):
+            target = _memmap_target(arr)
+            if target is None:
+                shm = shared_memory.SharedMemory(create=True, size=max(arr.nbytes, 1))
+                buffers.append((shm, arr))
+                target = ("shm", shm.name, 0, arr.shape, arr.dtype.str)
+            targets.append(target)
+        shards = [(targets, blocks_seq, counts, batch_size, params, blocks)
+                  for blocks in np.array_split(np.arange(len(counts)), n_jobs) if len(blocks)]
+        with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+            for _ in pool.map(_pizza_shard, shards):
+                pass
+        for shm, arr in buffers:
+            arr[...] = np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)
+    finally:
+        for shm, arr in buffers:
+            shm.close()
+            shm.unlink()
+
+@contextmanager
+def _temporary_outputs(n_samples, dtype):
+    """
+    X and y as numpy.memmap of temporary files for the processes of _pizza_parallel
+    (in /dev/shm when available : the data stays in memory). The files are removed on exit,
+    the memory is released with the arrays.
+    """
+    directory = "/dev/shm" if os.path.isdir("/dev/shm") else None
+    paths = []
+    try:
+        arrays = []
+        for shape in [(n_samples, 2), (n_samples,)]:
+            fd, path = tempfile.mkstemp(prefix="pizza.", suffix=".npy", dir=directory)
+            os.close(fd)
+            paths.append(path)
+            arrays.append(np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=shape))
+        yield arrays
+    finally:
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass # mapped files cannot be removed on Windows
+
+def _memmap_target(arr):
+    """('file', filename, offset, shape, dtype) if arr is a whole C contiguous numpy.memmap, else None"""
+    import mmap
+    if isinstance(arr, np.memmap) and isinstance(arr.base, mmap.mmap) and arr.flags.c_contiguous \
+            and arr.filename is not None and arr.flags.writeable:
+        arr.flush()
+        return ("file", arr.filename, arr.offset, arr.shape, arr.dtype.str)
+    return None
+
+def _open_target(target):
+    """Open in a worker an array described by _pizza_parallel. Returns the array and its buffer"""
+    from multiprocessing import shared_memory
+    kind, name, offset, shape, dtype = target
+    if kind == "file":
+        arr = np.memmap(name, dtype=dtype, mode='r+', offset=offset, shape=shape)
+        return arr, None
+    shm = shared_memory.SharedMemory(name=name)
+    return np.ndarray(shape, dtype=dtype, buffer=shm.buf), shm
+
+def _pizza_shard(shard):
+    """Worker of _pizza_parallel : generate the given blocks into the shared arrays"""
+    targets, blocks_seq, counts, batch_size, params, blocks = shard
+    (X, shm_X), (y, shm_y) = [_open_target(target) for target in targets]
+    try:
+        _make_pizza_blocks(X, y, blocks_seq, counts, batch_size, params, blocks)
+        for arr in (X, y):
+            if isinstance(arr, np.memmap):
+                arr.flush()
+        del X, y
+    finally:
+        for shm in (shm_X, shm_y):
+            if shm is not None:
+                shm.close()
+
+def _block_seed(blocks_seq, i):
+    """The i-th child of blocks_seq (same as blocks_seq.spawn(i+1)[i] without spawning the others)"""
+    return np.random.SeedSequence(blocks_seq.entropy, spawn_key=blocks_seq.spawn_key + (i,))
+
+def _make_pizza_block(block_seq, n_ones, radius_sep, radius_max, start_angle, end_angle, shuffle, X, y):
+    """Fill X and y with a block of len(y) samples, n_ones of them of class 1"""
+    rng = np.random.default_rng(block_seq)
+    dtype = X.dtype
+    n = len(y)
+    y[:n - n_ones] = 0
+    y[n - n_ones:] = 1
+    if shuffle:
+        rng.shuffle(y)
+    # rho uniform in [0, radius_sep) for class 0 and in [radius_sep, radius_max) for class 1
+    rho = rng.random(n, dtype=dtype)
+    rho *= np.where(y == 1, dtype.type(radius_max - radius_sep), dtype.type(radius_sep))
+    rho += y * dtype.type(radius_sep)
+    theta = rng.random(n, dtype=dtype)
+    theta *= dtype.type(end_angle - start_angle)
+    theta += dtype.type(start_angle)
+    np.cos(theta, out=X[:, 0])
+    X[:, 0] *= rho
+    np.sin(theta, out=theta)
+    theta *= rho
+    X[:, 1] = theta
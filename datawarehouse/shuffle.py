@@ -0,0 +1,89 @@
+# coding: utf-8
+"""
+External memory shuffle of datasets given chunk by chunk (for the out-of-core scripts).
+
+Two passes bucketed random partitioning :
+ 1. every row is sent to a random bucket, the buckets are appended to temporary files.
+ 2. the buckets are read back one at a time and randomly permuted in memory.
+Every bucket receives each row independently with the same probability so the concatenation
+of the permuted buckets is a uniform random permutation of the whole dataset.
+The memory is bounded by the size of one chunk plus the size of one bucket (about n_rows / n_buckets).
+"""
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import os
+import shutil
+import pickle
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+
+def external_shuffle(chunks, n_buckets=16, seed=None, tmp_dir=None):
+    """
+    Shuffle the rows of the given chunks using temporary files.
+    The same seed with the same input chunks always gives the same output.
+
+    Args
+    ----
+        chunks: iterable of pandas.DataFrame with the same columns.
+        n_buckets: (default=16) the number of buckets. Each bucket holds about n_rows / n_buckets rows
+            and must fit in memory.
+        seed: (default=None) the seed (int or numpy.random.SeedSequence). None means random.
+        tmp_dir: (default=None) the directory of the temporary files. None means the system default.
+
+    Yield
+    -----
+        data : the shuffled rows as pandas.DataFrame (one per non empty bucket, with a RangeIndex)
+    """
+    seed_seq = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+    # The 2 children of seed_seq without spawning : a SeedSequence given as seed is not modified
+    scatter_seq, gather_seq = [np.random.SeedSequence(seed_seq.entropy, spawn_key=seed_seq.spawn_key + (i,))
+                               for i in range(2)]
+    directory = tempfile.mkdtemp(prefix="shuffle.", dir=tmp_dir)
+    try:
+        paths = [os.path.join(directory, "bucket_{}.pkl".format(i)) for i in range(n_buckets)]
+        _scatter(chunks, paths, np.random.default_rng(scatter_seq))
+        rng = np.random.default_rng(gather_seq)
+        for path in paths:
+            data = _read_bucket(path)
+            os.remove(path)
+            if data is None:
+                continue
+            yield data.iloc[rng.permutation(len(data))].reset_index(drop=True)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def _scatter(chunks, paths, rng):
+    """Append the rows of every chunk to randomly chosen bucket files"""
+    n_buckets = len(paths)
+    files = [open(path, 'wb') for path in paths]
+    try:
+        for data in chunks:
+            buckets = rng.integers(n_buckets, size=len(data))
+            # One gather per chunk : the rows sorted by bucket, then one slice per bucket
+            data = data.iloc[np.argsort(buckets, kind='stable')]
+            bounds = np.concatenate(([0], np.cumsum(np.bincount(buckets, minlength=n_buckets))))
+            for i in np.flatnonzero(np.diff(bounds)):
+                pickle.dump(data.iloc[bounds[i]:bounds[i+1]], files[i], protocol=pickle.HIGHEST_PROTOCOL)
+    finally:
+        for f in files:
+            f.close()
+
+
+def _read_bucket(path):
+    """Read back the pieces of a bucket file. Returns None if the bucket is empty"""
+    pieces = []
+    with open(path, 'rb') as f:
+        while True:
+            try:
+                pieces.append(pickle.load(f))
+            except EOFError:
+                break
+    if not pieces:
+        return None
+    return pd.concat(pieces, ignore_index=True)
@@ -0,0 +1,186 @@
+# coding: utf-8
+"""
+Synthetic datasets following the HiggsML schema, to test the pipelines at any scale without network.
+
+The primary (PRI) features are sampled from simple but plausible distributions
+(pt thresholds, back to back tau and lepton for the signal, jet multiplicity, ...).
+The derived (DER) features are computed from them with the same 4-vector code as the
+systematics (see features.py) and the missing values (-999) follow the jet multiplicity.
+The weights are sampled among the known subpopulations (see higgsml.DETAIL_LABEL_NUM)
+so that add_detail_label works on the synthetic data.
+
+The data is generated chunk by chunk from a seed : the same (seed, chunksize) always gives
+the same dataset whatever the way it is consumed.
+"""
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import numpy as np
+import pandas as pd
+
+from .higgsml import HIGGS_COLUMNS
+from .cache import write_cache_chunks
+from .features import compute
+
+MISSING_VALUE = -999.0
+DECIMALS = 3
+
+SIGNAL_FRACTION = 0.342
+# Probability of 0, 1, 2 and 3 (or more) jets
+JET_NUM_PROBA = [0.400, 0.310, 0.201, 0.089]
+# Probability of the Kaggle sets (250000 train, 100000 public, 450000 private and 18238 unused)
+KAGGLE_SETS = ['t', 'b', 'v', 'u']
+KAGGLE_SET_PROBA = np.array([250000, 100000, 450000, 18238]) / 818238
+# Signal subpopulation weights and their probabilities
+SIGNAL_WEIGHTS = [0.0057207, 0.0004613, 0.0008145, 0.0004610]
+SIGNAL_WEIGHT_PROBA = [0.55, 0.25, 0.15, 0.05]
+# Z background subpopulation weights
+Z_WEIGHTS = [0.0917703, 0.5127399, 0.4435976, 0.4187604, 0.2407146, 0.1307751, 0.0944596,
+             0.0936590, 0.1093224, 0.0225326, 0.0217575, 0.0195328, 0.0254338]
+TOP_WEIGHT = 0.2268701
+# Probability of Z, top and W (continuous weights) backgrounds
+BACKGROUND_PROBA = [0.35, 0.15, 0.50]
+
+# The DER features computed from the PRI features (DER_mass_MMC is sampled)
+DER_FROM_PRI = [
+    'DER_mass_transverse_met_lep', 'DER_mass_vis', 'DER_pt_h', 'DER_deltaeta_jet_jet',
+    'DER_mass_jet_jet', 'DER_prodeta_jet_jet', 'DER_deltar_tau_lep', 'DER_pt_tot', 'DER_sum_pt',
+    'DER_pt_ratio_lep_tau', 'DER_met_phi_centrality', 'DER_lep_eta_centrality',
+    ]
+
+
+def make_higgs_like(n_samples=1000, seed=None, chunksize=100000):
+    """
+    Make a synthetic dataset following the HiggsML schema.
+
+    Args
+    ----
+        n_samples: (int, default=1000) the number of events.
+        seed: (default=None) the seed (int or numpy.random.SeedSequence). None means random.
+        chunksize: (default=100000) the number of events generated at once.
+
+    Return
+    ------
+        data : the dataset as a pandas.DataFrame (same columns as load_higgs)
+    """
+    return pd.concat(iter_higgs_like(n_samples, seed=seed, chunksize=chunksize), ignore_index=True)
+
+
+def iter_higgs_like(n_samples, seed=None, chunksize=100000):
+    """
+    Generate a synthetic dataset following the HiggsML schema chunk by chunk.
+    Only one chunk at a time is held in memory.
+
+    Args
+    ----
+        n_samples: (int) the total number of events.
+        seed: (default=None) the seed (int or numpy.random.SeedSequence). None means random.
+        chunksize: (default=100000) the number of events per chunk.
+
+    Yield
+    -----
+        data : a chunk of the dataset as a pandas.DataFrame (indexed by event number)
+    """
+    seed_seq = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+    n_chunks = -(-n_samples // chunksize)
+    for i in range(n_chunks):
+        start = i * chunksize
+        stop = min(start + chunksize, n_samples)
+        # The i-th child of seed_seq without spawning : a SeedSequence given as seed is not modified
+        child = np.random.SeedSequence(seed_seq.entropy, spawn_key=seed_seq.spawn_key + (i,))
+        data = _make_chunk(np.random.default_rng(child), stop - start, start)
+        data.index = pd.RangeIndex(start, stop)
+        yield data
+
+
+def write_higgs_like_cache(cache_dir, n_samples, seed=None, chunksize=100000):
+    """
+    Write a synthetic dataset following the HiggsML schema directly into a columnar cache
+    directory (see cache.py), chunk by chunk. Read it back with cache.read_cache or cache.iter_cache.
+
+    Args
+    ----
+        cache_dir: the cache directory.
+        n_samples: (int) the total number of events.
+        seed: (default=None) the seed (int or numpy.random.SeedSequence). None means random.
+        chunksize: (default=100000) the number of events generated at once.
+    """
+    def categorical(chunks):
+        for data in chunks:
+            data['Label'] = pd.Categorical(data['Label'], categories=['b', 's'])
+            data['KaggleSet'] = pd.Categorical(data['KaggleSet'], categories=KAGGLE_SETS)
+            yield data
+    chunks = iter_higgs_like(n_samples, seed=seed, chunksize=chunksize)
+    write_cache_chunks(cache_dir, categorical(chunks), n_samples)
+
+
+def _wrap_phi(phi):
+    return (phi + np.pi) % (2*np.pi) - np.pi
+
+
+def _make_chunk(rng, n_samples, first_event):
+    """Generate n_samples events with the given numpy.random.Generator"""
+    signal = rng.random(n_samples) < SIGNAL_FRACTION
+    jet_num = rng.choice(4, size=n_samples, p=JET_NUM_PROBA)
+    data = {}
+
+    # The tau and the lepton (back to back for the signal)
+    data['PRI_tau_pt'] = 20. + rng.exponential(np.where(signal, 30., 20.))
+    data['PRI_tau_eta'] = np.clip(rng.normal(0., 1.1, n_samples), -2.5, 2.5)
+    tau_phi = rng.uniform(-np.pi, np.pi, n_samples)
+    data['PRI_tau_phi'] = tau_phi
+    data['PRI_lep_pt'] = 20. + rng.exponential(np.where(signal, 25., 18.))
+    data['PRI_lep_eta'] = np.clip(rng.normal(0., 1.1, n_samples), -2.5, 2.5)
+    data['PRI_lep_phi'] = np.where(signal, _wrap_phi(tau_phi + np.pi + rng.normal(0., 0.8, n_samples)),
+                                   rng.uniform(-np.pi, np.pi, n_samples))
+    data['PRI_met'] = rng.exponential(np.where(signal, 35., 25.))
+    data['PRI_met_phi'] = rng.uniform(-np.pi, np.pi, n_samples)
+    data['PRI_met_sumet'] = 100. + rng.gamma(2.5, 70., n_samples)
+
+    # The jets (leading pt >= subleading pt)
+    pt_1 = 30. + rng.exponential(45., n_samples)
+    pt_2 = 30. + rng.exponential(20., n_samples)
+    data['PRI_jet_num'] = jet_num
+    data['PRI_jet_leading_pt'] = np.maximum(pt_1, pt_2)
+    data['PRI_jet_leading_eta'] = np.clip(rng.normal(0., 1.8, n_samples), -4.5, 4.5)
+    data['PRI_jet_leading_phi'] = rng.uniform(-np.pi, np.pi, n_samples)
+    data['PRI_jet_subleading_pt'] = np.minimum(pt_1, pt_2)
+    data['PRI_jet_subleading_eta'] = np.clip(rng.normal(0., 1.8, n_samples), -4.5, 4.5)
+    data['PRI_jet_subleading_phi'] = rng.uniform(-np.pi, np.pi, n_samples)
+    others_pt = 30. + rng.exponential(15., n_samples)
+    data['PRI_jet_all_pt'] = (np.where(jet_num > 0, data['PRI_jet_leading_pt'], 0.)
+                              + np.where(jet_num > 1, data['PRI_jet_subleading_pt'], 0.)
+                              + np.where(jet_num > 2, others_pt, 0.))
+    for name in ['PRI_jet_leading_pt', 'PRI_jet_leading_eta', 'PRI_jet_leading_phi']:
+        data[name][jet_num < 1] = MISSING_VALUE
+    for name in ['PRI_jet_subleading_pt', 'PRI_jet_subleading_eta', 'PRI_jet_subleading_phi']:
+        data[name][jet_num < 2] = MISSING_VALUE
+    for name in data:
+        if name != 'PRI_jet_num':
+            data[name] = np.round(data[name], decimals=DECIMALS)
+    data = pd.DataFrame(data)
+
+    # The derived features (with the same code as the systematics)
+    der = compute(data, DER_FROM_PRI, cache=False)
+    mass_MMC = np.where(signal, rng.normal(125., 15., n_samples),
+                        der['DER_mass_vis'].to_numpy() * rng.normal(1.35, 0.15, n_samples))
+    mass_MMC = np.round(np.abs(mass_MMC), decimals=DECIMALS)
+    der['DER_mass_MMC'] = np.where(rng.random(n_samples) < 0.15, MISSING_VALUE, mass_MMC)
+    for name in der.columns:
+        data[name] = der[name].to_numpy()
+
+    # The weights, labels and Kaggle sets
+    weight = rng.choice(SIGNAL_WEIGHTS, size=n_samples, p=SIGNAL_WEIGHT_PROBA)
+    background = rng.choice(3, size=n_samples, p=BACKGROUND_PROBA)
+    weight = np.where(signal, weight,
+             np.where(background == 0, rng.choice(Z_WEIGHTS, size=n_samples),
+             np.where(background == 1, TOP_WEIGHT,
+                      np.round(rng.lognormal(0., 0.7, n_samples), decimals=7))))
+    kaggle_set = rng.choice(len(KAGGLE_SETS), size=n_samples, p=KAGGLE_SET_PROBA)
+    data['EventId'] = np.arange(100000 + first_event, 100000 + first_event + n_samples)
+    data['Weight'] = weight
+    data['Label'] = np.where(signal, 's', 'b').astype(object)
+    data['KaggleSet'] = np.array(KAGGLE_SETS, dtype=object)[kaggle_set]
+    data['KaggleWeight'] = weight / KAGGLE_SET_PROBA[kaggle_set]
+    return data[HIGGS_COLUMNS]
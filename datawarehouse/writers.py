@@ -0,0 +1,270 @@
+# coding: utf-8
+"""
+Incremental writers of datasets given chunk by chunk (for the out-of-core scripts).
+
+Formats :
+ - csv : text, optionally compressed in parallel
+     - gzip : the chunks are compressed by a thread pool into independent gzip members
+       (like pigz), the concatenation is a valid gzip file readable by any gzip reader.
+     - zstd : multi-threaded zstd with the zstandard package or the zstd command line tool.
+ - parquet : one row group per chunk (needs pyarrow), the column compression is done by pyarrow.
+ - npy : uncompressed binary columnar cache directory (see cache.py), readable with memory maps.
+"""
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import os
+import gzip
+import shutil
+import subprocess
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from .cache import CacheWriter
+
+FORMATS = ["csv", "parquet", "npy"]
+COMPRESSIONS = [None, "gzip", "zstd"]
+
+
+def default_threads():
+    return os.cpu_count() or 1
+
+
+def open_writer(out_file, fmt="csv", compression="gzip", threads=None, level=None, columns=None):
+    """
+    Open an incremental writer. Use writer.write(chunk) for every chunk then writer.close()
+    (or use the writer as a context manager).
+
+    Args
+    ----
+        out_file: the output file (the output directory for the npy format).
+        fmt: (default="csv") the output format : "csv", "parquet" or "npy".
+        compression: (default="gzip") for csv : None, "gzip" or "zstd".
+            For parquet : the pyarrow column compression (None means "snappy"). Ignored for npy.
+        threads: (default=None) the number of compression threads. None means the number of cpus.
+        level: (default=None) the compression level. None means the default of the codec.
+        columns: (default=None) the columns to write. None means every column.
+            A KeyError is raised if one of them is missing from a chunk.
+
+    Return
+    ------
+        writer: the writer
+    """
+    threads = default_threads() if threads is None else threads
+    if fmt == "csv":
+        return CsvWriter(out_file, compression=compression, threads=threads, level=level, columns=columns)
+    if fmt == "parquet":
+        return ParquetWriter(out_file, compression=compression, level=level, columns=columns)
+    if fmt == "npy":
+        return NpyWriter(out_file, columns=columns)
+    raise ValueError("Unknown format {!r} (expected one of {})".format(fmt, FORMATS))
+
+
+def write_chunks(chunks, out_file, fmt="csv", compression="gzip", threads=None, level=None, columns=None):
+    """
+    Write the given chunks incrementally (see open_writer for the arguments).
+
+    Return
+    ------
+        n_rows: the number of written rows
+    """
+    with open_writer(out_file, fmt=fmt, compression=compression, threads=threads,
+                     level=level, columns=columns) as writer:
+        for data in chunks:
+            writer.write(data)
+    return writer.nrows
+
+
+class _Writer(object):
+    def __init__(self, columns=None):
+        self.columns = columns
+        self.nrows = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def _select(self, data):
+        if self.columns is None:
+            return data
+        missing = [name for name in self.columns if name not in data.columns]
+        if missing:
+            raise KeyError("Requested columns missing from the data : {}".format(missing))
+        return data[self.columns]
+
+    def abort(self):
+        self.close()
+
+
+class CsvWriter(_Writer):
+    """
+    Incremental csv writer with parallel compression.
+    The header is written with the first chunk.
+    """
+    def __init__(self, out_file, compression="gzip", threads=1, level=None, columns=None):
+        super(CsvWriter, self).__init__(columns)
+        self.out_file = out_file
+        if compression not in COMPRESSIONS:
+            raise ValueError("Unknown compression {!r} (expected one of {})".format(compression, COMPRESSIONS))
+        self.compression = compression
+        self.threads = threads
+        self.level = level
+        self.process = None
+        self.pool = None
+        self.pending = deque()
+        if compression == "zstd":
+            self._open_zstd(out_file)
+        else:
+            self.file = open(out_file, 'wb')
+            if compression == "gzip":
+                self.pool = ThreadPoolExecutor(max_workers=threads)
+
+    def _open_zstd(self, out_file):
+        level = 3 if self.level is None else self.level
+        try:
+            import zstandard
+        except ImportError:
+            zstandard = None
+        if zstandard is not None:
+            self.raw = open(out_file, 'wb')
+            compressor = zstandard.ZstdCompressor(level=level, threads=self.threads)
+            self.file = compressor.stream_writer(self.raw)
+            return
+        zstd = shutil.which("zstd") if hasattr(shutil, "which") else None
+        if zstd is None:
+            raise ImportError("zstd compression needs the zstandard package or the zstd command line tool")
+        self.raw = open(out_file, 'wb')
+        self.process = subprocess.Popen([zstd, "-q", "-T{}".format(self.threads), "-{}".format(level), "-c"],
+                                        stdin=subprocess.PIPE, stdout=self.raw)
+        self.file = self.process.stdin
+
+    def write(self, data):
+        data = self._select(data)
+        text = data.to_csv(index=False, header=(self.nrows == 0)).encode('utf-8')
+        self.nrows += len(data)
+        if self.pool is None:
+            self.file.write(text)
+            return
+        level = 6 if self.level is None else self.level
+        self.pending.append(self.pool.submit(gzip.compress, text, level))
+        # Bound the memory : at most 2 chunks per thread waiting to be written
+        while len(self.pending) > 2 * self.threads:
+            self.file.write(self.pending.popleft().result())
+
+    def close(self):
+        if self.file is None:
+            return
+        try:
+            while self.pending:
+                self.file.write(self.pending.popleft().result())
+            if self.pool is not None:
+                self.pool.shutdown()
+        finally:
+            self.file.close()
+            self.file = None
+            if self.process is not None:
+                if self.process.wait() != 0:
+                    raise IOError("zstd failed with exit code {}".format(self.process.returncode))
+            if self.compression == "zstd":
+                self.raw.close()
+
+    def abort(self):
+        """Stop the compression and remove the partial output"""
+        for future in self.pending:
+            future.cancel()
+        self.pending.clear()
+        try:
+            self.close()
+        finally:
+            if os.path.exists(self.out_file):
+                os.remove(self.out_file)
+
+
+class ParquetWriter(_Writer):
+    """
+    Incremental parquet writer (one row group per chunk). Needs pyarrow.
+    The categories of the categorical columns are written as strings : parquet dictionaries
+    need a single type (the detail labels mix integers and "W").
+    """
+    def __init__(self, out_file, compression=None, level=None, columns=None):
+        super(ParquetWriter, self).__init__(columns)
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError("The parquet format needs the pyarrow package")
+        self.pa = pyarrow
+        self.pq = pyarrow.parquet
+        self.out_file = out_file
+        self.compression = "snappy" if compression is None else compression
+        self.level = level
+        self.writer = None
+        self.schema = None
+
+    def write(self, data):
+        data = _str_categories(self._select(data))
+        table = self.pa.Table.from_pandas(data, schema=self.schema, preserve_index=False)
+        if self.writer is None:
+            self.schema = table.schema
+            self.writer = self.pq.ParquetWriter(self.out_file, self.schema, compression=self.compression,
+                                                compression_level=self.level)
+        self.writer.write_table(table)
+        self.nrows += len(data)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+    def abort(self):
+        """Close the writer and remove the partial output (a truncated parquet file looks valid)"""
+        try:
+            self.close()
+        finally:
+            if os.path.exists(self.out_file):
+                os.remove(self.out_file)
+
+
+def _str_categories(data):
+    """Copy of data with the non string categories of the categorical columns converted to str"""
+    converted = {}
+    for name in data.columns:
+        col = data[name]
+        if isinstance(col.dtype, pd.CategoricalDtype) and \
+                not all(isinstance(c, str) for c in col.cat.categories):
+            converted[name] = col.cat.rename_categories([str(c) for c in col.cat.categories])
+    if not converted:
+        return data
+    return data.assign(**converted)
+
+
+class NpyWriter(_Writer):
+    """
+    Incremental writer of an uncompressed columnar cache directory (see cache.CacheWriter).
+    """
+    def __init__(self, out_dir, columns=None):
+        super(NpyWriter, self).__init__(columns)
+        self.writer = CacheWriter(out_dir)
+
+    def write(self, data):
+        data = self._select(data)
+        self.writer.write(data)
+        self.nrows += len(data)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+    def abort(self):
+        if self.writer is not None:
+            self.writer.abort()
+            self.writer = None
@@ -1,6 +1,6 @@
 # -*- coding: utf-8 -*-
 __authors__ = 'Victor Estrade'
-from distutils.core import setup
+from setuptools import setup
 
 setup(name='datawarehouse',
 	  author=__authors__,
@@ -8,4 +8,5 @@ setup(name='datawarehouse',
 	  url='https://github.com/victor-estrade/datawarehouse',
       version='1.0',
       packages=['datawarehouse'],
+      python_requires='>=3.8',
       )
@@ -0,0 +1,28 @@
+# coding: utf-8
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import os
+
+import pytest
+
+from datawarehouse import download
+from datawarehouse.synthetic_higgs import make_higgs_like
+
+HIGGS_FILE = "atlas-higgs-challenge-2014-v2.csv.gz"
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    """A temporary data directory : the loaders read (and never download) from it"""
+    monkeypatch.setattr(download, "DATA_DIR", str(tmp_path))
+    return str(tmp_path)
+
+
+@pytest.fixture
+def higgs_csv(data_dir):
+    """A small synthetic HiggsML csv file in the data directory"""
+    filename = os.path.join(data_dir, HIGGS_FILE)
+    make_higgs_like(2000, seed=0).to_csv(filename, index=False)
+    return filename
@@ -0,0 +1,50 @@
+# coding: utf-8
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import os
+import mmap
+
+import h5py
+import numpy as np
+import pandas as pd
+
+from datawarehouse import load_baldi2016_train_no_pile
+
+BALDI_FILE = "train_no_pile_10000000.h5"
+
+
+def write_baldi(filename, n_samples=500, chunks=None, seed=0):
+    rng = np.random.default_rng(seed)
+    with h5py.File(filename, 'w') as f:
+        f.create_dataset("features", data=rng.normal(size=(n_samples, 6)), chunks=chunks)
+        f.create_dataset("targets", data=rng.integers(0, 2, size=(n_samples, 1)).astype(np.float64))
+
+
+def _is_memory_mapped(arr):
+    while arr is not None:
+        if isinstance(arr, (np.memmap, mmap.mmap)):
+            return True
+        arr = getattr(arr, 'base', None)
+    return False
+
+
+def test_mmap_matches_full_read(data_dir):
+    write_baldi(os.path.join(data_dir, BALDI_FILE))
+    X, y = load_baldi2016_train_no_pile()
+    X_mmap, y_mmap = load_baldi2016_train_no_pile(mmap=True)
+    pd.testing.assert_frame_equal(X_mmap, X)
+    pd.testing.assert_frame_equal(y_mmap, y)
+    # zero copy : the frame is backed by a read-only memory map of the file
+    values = X_mmap.to_numpy()
+    assert not values.flags.writeable
+    assert _is_memory_mapped(values)
+
+
+def test_mmap_falls_back_on_chunked_datasets(data_dir):
+    write_baldi(os.path.join(data_dir, BALDI_FILE), chunks=(100, 6))
+    X, y = load_baldi2016_train_no_pile()
+    X_mmap, y_mmap = load_baldi2016_train_no_pile(mmap=True)
+    pd.testing.assert_frame_equal(X_mmap, X)
+    assert not _is_memory_mapped(X_mmap.to_numpy())
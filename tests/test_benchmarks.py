@@ -0,0 +1,30 @@
+# coding: utf-8
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+from benchmarks import run
+
+
+class Bench(object):
+    params = ([10, 1000], ['a', 'b'])
+
+
+def test_iter_params_max_size():
+    assert run.iter_params(Bench, 100) == [(10, 'a'), (10, 'b')]
+    assert len(run.iter_params(Bench, 1000)) == 4
+    assert run.iter_params(object, 100) == [()]
+
+
+def test_compare_counts_regressions(capsys):
+    previous = {'fast': 1.0, 'slow': 1.0, 'gone': 1.0}
+    results = {'fast': 0.5, 'slow': 2.0, 'new': 9.0}
+    assert run.compare(results, previous, factor=1.25) == 1
+    assert 'REGRESSION slow' in capsys.readouterr().out
+    assert run.compare(results, previous, factor=3.) == 0
+
+
+def test_run_smoke(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    results = run.run('bench_fourvector.TimeV4Array', max_size=10**4, repeat=1)
+    assert results and all(seconds > 0 for seconds in results.values())
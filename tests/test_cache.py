@@ -0,0 +1,74 @@
+# coding: utf-8
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from datawarehouse import load_higgs
+from datawarehouse.cache import get_cache_dir
+from datawarehouse.higgsml import HIGGS_COLUMNS
+from datawarehouse.higgsml import HIGGS_FEATURES
+from datawarehouse.higgsml import HIGGS_SCHEMA
+from datawarehouse.higgsml import HIGGS_SPLITS
+from datawarehouse.synthetic_higgs import make_higgs_like
+
+
+def test_load_higgs_cache_matches_csv(higgs_csv):
+    expected = load_higgs(cache=False)
+    built = load_higgs()
+    assert os.path.isdir(get_cache_dir(higgs_csv))
+    cached = load_higgs()
+    pd.testing.assert_frame_equal(built, expected)
+    pd.testing.assert_frame_equal(cached, expected)
+
+
+def test_cache_rebuilt_when_csv_changes(higgs_csv):
+    load_higgs()
+    make_higgs_like(1500, seed=1).to_csv(higgs_csv, index=False)
+    pd.testing.assert_frame_equal(load_higgs(), load_higgs(cache=False))
+    assert len(load_higgs()) == 1500
+
+
+@pytest.mark.parametrize("cache", [False, True])
+def test_load_higgs_compact(higgs_csv, cache):
+    data = load_higgs(cache=cache)
+    compact = load_higgs(cache=cache, compact=True)
+    for name in HIGGS_COLUMNS:
+        assert compact[name].dtype == HIGGS_SCHEMA[name], name
+    assert compact.memory_usage(deep=True).sum() < data.memory_usage(deep=True).sum()
+    np.testing.assert_allclose(compact[HIGGS_FEATURES].to_numpy(np.float64), data[HIGGS_FEATURES].to_numpy(), rtol=1e-6)
+    np.testing.assert_array_equal(compact["Weight"], data["Weight"])
+    np.testing.assert_array_equal(compact["Label"].astype(str), data["Label"].astype(str))
+
+
+@pytest.mark.parametrize("cache", [False, True])
+def test_load_higgs_pushdown(higgs_csv, cache):
+    full = load_higgs(cache=False)
+    columns = ['EventId', 'PRI_tau_pt', 'Label']
+    filters = [('KaggleSet', 'in', ['t', 'b']), ('PRI_jet_num', '>=', 2)]
+    load_higgs(cache=cache) # build the cache (if any)
+    data = load_higgs(cache=cache, columns=columns, nrows=1500, filters=filters)
+    head = full[:1500]
+    expected = head[head['KaggleSet'].isin(['t', 'b']) & (head['PRI_jet_num'] >= 2)][columns]
+    assert list(data.columns) == columns
+    np.testing.assert_array_equal(data.index, expected.index)
+    for name in columns:
+        np.testing.assert_array_equal(data[name].to_numpy(), expected[name].to_numpy())
+
+
+def test_load_higgs_split(higgs_csv):
+    full = load_higgs(cache=False)
+    for split, kaggle_set in HIGGS_SPLITS.items():
+        expected = full[full['KaggleSet'] == kaggle_set]
+        pd.testing.assert_frame_equal(load_higgs(split=split, cache=False), expected)
+        pd.testing.assert_frame_equal(load_higgs(split=split), expected)
+        assert os.path.exists(os.path.join(get_cache_dir(higgs_csv), "rows_{}.npy".format(split)))
+        # read back from the stored row numbers
+        pd.testing.assert_frame_equal(load_higgs(split=split), expected)
+    with pytest.raises(ValueError):
+        load_higgs(split='test')
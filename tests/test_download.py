@@ -0,0 +1,185 @@
+# coding: utf-8
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import os
+import json
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler
+from http.server import HTTPServer
+
+import pytest
+
+from datawarehouse import download
+
+CONTENT = os.urandom(300000)
+SHA256 = hashlib.sha256(CONTENT).hexdigest()
+
+
+class RangeHandler(BaseHTTPRequestHandler):
+    """Serves CONTENT with the Range support of a real server (206 and 416 answers)"""
+    ranges = True
+    requests = []
+
+    def do_GET(self):
+        header = self.headers.get("Range")
+        self.requests.append(header)
+        if header is None or not self.ranges:
+            self._send(200, CONTENT)
+            return
+        start = int(header[len("bytes="):].split("-")[0])
+        if start >= len(CONTENT):
+            self.send_response(416)
+            self.send_header("Content-Range", "bytes */{}".format(len(CONTENT)))
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self._send(206, CONTENT[start:], "bytes {}-{}/{}".format(start, len(CONTENT) - 1, len(CONTENT)))
+
+    def _send(self, code, body, content_range=None):
+        self.send_response(code)
+        self.send_header("Content-Length", str(len(body)))
+        if content_range is not None:
+            self.send_header("Content-Range", content_range)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def url():
+    RangeHandler.ranges = True
+    RangeHandler.requests = []
+    server = HTTPServer(("127.0.0.1", 0), RangeHandler)
+    thread = threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05})
+    thread.daemon = True
+    thread.start()
+    yield "http://127.0.0.1:{}/file.bin".format(server.server_address[1])
+    server.shutdown()
+    server.server_close()
+
+
+def _read(filename):
+    with open(filename, 'rb') as f:
+        return f.read()
+
+
+def test_download_verified(data_dir, url):
+    filename = os.path.join(data_dir, "file.bin")
+    download.maybe_download(filename, url, checksum=SHA256)
+    assert _read(filename) == CONTENT
+    assert not os.path.exists(filename + ".part")
+
+
+def test_resume_interrupted_download(data_dir, url):
+    filename = os.path.join(data_dir, "file.bin")
+    with open(filename + ".part", 'wb') as f:
+        f.write(CONTENT[:100000])
+    download.maybe_download(filename, url, checksum="md5:" + hashlib.md5(CONTENT).hexdigest())
+    assert RangeHandler.requests == ["bytes=100000-"]
+    assert _read(filename) == CONTENT
+
+
+def test_resume_complete_part_file(data_dir, url):
+    # the server answers 416 : the part file is accepted since its size is the size of the file
+    filename = os.path.join(data_dir, "file.bin")
+    with open(filename + ".part", 'wb') as f:
+        f.write(CONTENT)
+    download.maybe_download(filename, url, sha256=SHA256)
+    assert RangeHandler.requests == ["bytes={}-".format(len(CONTENT))]
+    assert _read(filename) == CONTENT
+
+
+def test_resume_too_large_part_file_starts_again(data_dir, url):
+    filename = os.path.join(data_dir, "file.bin")
+    with open(filename + ".part", 'wb') as f:
+        f.write(CONTENT + b"garbage")
+    download.maybe_download(filename, url, checksum=SHA256)
+    assert RangeHandler.requests == ["bytes={}-".format(len(CONTENT) + 7), None]
+    assert _read(filename) == CONTENT
+
+
+def test_server_without_range_support(data_dir, url):
+    RangeHandler.ranges = False
+    filename = os.path.join(data_dir, "file.bin")
+    with open(filename + ".part", 'wb') as f:
+        f.write(CONTENT[:100000])
+    download.maybe_download(filename, url, checksum=SHA256)
+    assert _read(filename) == CONTENT
+
+
+def test_checksum_mismatch(data_dir, url):
+    filename = os.path.join(data_dir, "file.bin")
+    with pytest.raises(IOError):
+        download.maybe_download(filename, url, checksum="0" * 64)
+    assert not os.path.exists(filename)
+    assert not os.path.exists(filename + ".part")
+
+
+def test_invalid_checksum_format(data_dir, url):
+    with pytest.raises(ValueError):
+        download.maybe_download(os.path.join(data_dir, "file.bin"), url, checksum="md5:not-a-digest")
+
+
+def test_unknown_checksum_is_recorded(data_dir, url):
+    filename = os.path.join(data_dir, "file.bin")
+    with pytest.warns(RuntimeWarning):
+        download.maybe_download(filename, url)
+    with open(os.path.join(data_dir, download.CHECKSUMS_FILE)) as f:
+        assert json.load(f) == {"file.bin": SHA256}
+    assert download.get_checksum(filename) == SHA256
+
+
+def test_existing_truncated_file_is_downloaded_again(data_dir, url):
+    filename = os.path.join(data_dir, "file.bin")
+    with open(filename, 'wb') as f:
+        f.write(CONTENT[:100000])
+    with pytest.warns(RuntimeWarning, match="Checksum mismatch"):
+        download.maybe_download(filename, url, checksum=SHA256)
+    assert RangeHandler.requests == ["bytes=100000-"]
+    assert _read(filename) == CONTENT
+
+
+def test_existing_corrupted_file_starts_again(data_dir, url):
+    filename = os.path.join(data_dir, "file.bin")
+    with open(filename, 'wb') as f:
+        f.write(b"garbage")
+    with pytest.warns(RuntimeWarning, match="Checksum mismatch"):
+        download.maybe_download(filename, url, checksum=SHA256)
+    assert RangeHandler.requests == ["bytes=7-", None]
+    assert _read(filename) == CONTENT
+
+
+def test_existing_file_verified_once(data_dir, url, monkeypatch):
+    filename = os.path.join(data_dir, "file.bin")
+    with open(filename, 'wb') as f:
+        f.write(CONTENT)
+    download.maybe_download(filename, url, checksum=SHA256)
+    assert RangeHandler.requests == []
+
+    def file_checksum(*args):
+        raise AssertionError("the file is hashed again")
+    monkeypatch.setattr(download, "file_checksum", file_checksum)
+    download.maybe_download(filename, url, checksum=SHA256)
+    # a modified file is verified again
+    with open(filename, 'ab') as f:
+        f.write(b"more")
+    with pytest.raises(AssertionError):
+        download.maybe_download(filename, url, checksum=SHA256)
+
+
+def test_maybe_download_all(data_dir, url):
+    filenames = [os.path.join(data_dir, "file_{}.bin".format(i)) for i in range(5)]
+    download.maybe_download_all([(filename, url, SHA256) for filename in filenames], max_workers=3)
+    for filename in filenames:
+        assert _read(filename) == CONTENT
+    assert len(RangeHandler.requests) == 5
+    with pytest.raises(IOError):
+        download.maybe_download_all([(os.path.join(data_dir, "bad.bin"), url, "0" * 64),
+                                     (os.path.join(data_dir, "good.bin"), url, SHA256)])
+    assert _read(os.path.join(data_dir, "good.bin")) == CONTENT
+    assert not os.path.exists(os.path.join(data_dir, "bad.bin"))
@@ -0,0 +1,69 @@
+# coding: utf-8
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import numpy as np
+import pandas as pd
+
+from datawarehouse import features
+from datawarehouse import higgsml
+from datawarehouse.synthetic_higgs import make_higgs_like
+
+
+def test_compute_matches_tau_energy_scale():
+    data = make_higgs_like(500, seed=0)
+    names = ["DER_mass_vis", "DER_pt_h", "DER_deltar_tau_lep", "DER_mass_transverse_met_lep", "DER_pt_tot"]
+    result = features.compute(data, names + ["radian_1"])
+    expected = data.copy()
+    higgsml.tau_energy_scale(expected, 1.)
+    for name in names:
+        np.testing.assert_allclose(result[name], expected[name], atol=1e-3, err_msg=name)
+    np.testing.assert_array_equal(result["radian_1"], higgsml.add_radian_1(data, inplace=False)["radian_1"])
+
+
+def _counting_registry(**kwargs):
+    registry = features.FeatureRegistry(**kwargs)
+    calls = []
+
+    @registry.register("double", ["a"])
+    def _double(a):
+        calls.append("double")
+        return 2 * a
+
+    @registry.register("total", ["double", "b"])
+    def _total(double, b):
+        calls.append("total")
+        return double + b
+    return registry, calls
+
+
+def test_cache_invalidated_by_input_columns():
+    registry, calls = _counting_registry()
+    data = pd.DataFrame({"a": np.arange(10.), "b": np.ones(10)})
+    registry.compute(data, ["total"])
+    registry.compute(data, ["total", "double"])
+    assert calls == ["double", "total"]
+    data["b"] = 2.
+    result = registry.compute(data, ["total"])
+    # only the feature depending on b is recomputed
+    assert calls == ["double", "total", "total"]
+    np.testing.assert_array_equal(result["total"], 2 * np.arange(10.) + 2.)
+    registry.clear()
+    assert registry.nbytes == 0
+    registry.compute(data, ["total"])
+    assert calls[-2:] == ["double", "total"]
+
+
+def test_cache_bounds():
+    data = pd.DataFrame({"a": np.arange(100.), "b": np.ones(100)})
+    registry, calls = _counting_registry(max_bytes=1000)
+    registry.compute(data, ["total", "double"])
+    assert registry.nbytes <= 1000 and len(registry._cache) == 1
+    registry, calls = _counting_registry(maxsize=0)
+    registry.compute(data, ["total"])
+    registry.compute(data, ["total"])
+    assert calls == ["double", "total"] * 2
+    assert registry.nbytes == 0
+    # the global registry does not cache unless asked to
+    assert features.REGISTRY.maxsize == 0
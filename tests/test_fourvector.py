@@ -0,0 +1,43 @@
+# coding: utf-8
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import numpy as np
+
+from datawarehouse.fourvector import V4Array
+from datawarehouse.higgsml import V4
+
+
+def _random_pt_eta_phi(rng, n=1000):
+    return rng.uniform(20, 100, n), rng.uniform(-2.5, 2.5, n), rng.uniform(-np.pi, np.pi, n)
+
+
+def test_v4array_matches_v4():
+    rng = np.random.default_rng(0)
+    a, b = _random_pt_eta_phi(rng), _random_pt_eta_phi(rng)
+    v4_a, v4_b = V4(), V4()
+    v4_a.setPtEtaPhiM(*a, m=0.8)
+    v4_b.setPtEtaPhiM(*b, m=0.)
+    arr_a = V4Array.fromPtEtaPhiM(*a, m=0.8)
+    arr_b = V4Array.fromPtEtaPhiM(*b, m=0.)
+    for name in ["pt", "eta", "phi", "m", "p"]:
+        np.testing.assert_allclose(getattr(arr_a, name)(), getattr(v4_a, name)(), rtol=1e-12, atol=1e-12)
+    np.testing.assert_allclose(arr_a.deltaR(arr_b), v4_a.deltaR(v4_b), rtol=1e-12)
+    np.testing.assert_allclose((arr_a + arr_b).m(), (v4_a + v4_b).m(), rtol=1e-12)
+
+    v4_a.scaleFixedM(1.05)
+    arr_a.scaleFixedM(1.05)
+    np.testing.assert_allclose(arr_a.pt(), v4_a.pt(), rtol=1e-12)
+    np.testing.assert_allclose(arr_a.m(), v4_a.m(), rtol=1e-9)
+
+
+def test_cache_invalidated_by_setters():
+    v = V4Array.fromPtEtaPhiM(np.array([10., 20.]), 0., 0., 0.)
+    np.testing.assert_allclose(v.pt(), [10., 20.])
+    v.px = np.array([3., 6.])
+    v.py = np.array([4., 8.])
+    np.testing.assert_allclose(v.pt(), [5., 10.])
+    v += V4Array.fromPtEtaPhiM(np.array([5., 10.]), 0., 0., 0.)
+    np.testing.assert_allclose(v.px, [8., 16.])
+    np.testing.assert_allclose(v.pt(), np.hypot([8., 16.], [4., 8.]))
@@ -0,0 +1,146 @@
+# coding: utf-8
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from datawarehouse import higgsml
+from datawarehouse.synthetic_higgs import make_higgs_like
+
+
+@pytest.fixture
+def higgs():
+    return make_higgs_like(1000, seed=0)
+
+
+def test_detail_label_matches_getDetailLabel(higgs):
+    for num in [True, False]:
+        labels = higgsml.detail_label(higgs["Weight"], higgs["Label"], num=num)
+        expected = [higgsml.getDetailLabel(w, label, num=num) for w, label in zip(higgs["Weight"], higgs["Label"])]
+        assert list(labels) == expected
+    data = higgs.copy()
+    higgsml.add_detail_label(data)
+    assert isinstance(data["detailLabel"].dtype, pd.CategoricalDtype)
+
+
+def test_detail_label_rejects_unknown_signal_weight():
+    with pytest.raises(ValueError):
+        higgsml.detail_label(np.array([0.0057207, 0.123]), np.array(['s', 's']))
+
+
+def test_tau_energy_scale_matches_reference(higgs):
+    # higgstautau.tau_energy_scale is the unfused version (4-vectors and pandas columns)
+    from datawarehouse import higgstautau
+    data, reference = higgs.copy(), higgs.copy()
+    higgsml.tau_energy_scale(data, 1.03)
+    higgstautau.tau_energy_scale(reference, 1.03)
+    for name in ["PRI_tau_pt", "PRI_met", "PRI_met_phi", "DER_mass_transverse_met_lep", "DER_mass_vis",
+                 "DER_pt_h", "DER_deltar_tau_lep", "DER_pt_ratio_lep_tau", "DER_met_phi_centrality"]:
+        np.testing.assert_allclose(data[name], reference[name], atol=1e-3, err_msg=name)
+    pd.testing.assert_series_equal(data["ORIG_sum_pt"], higgs["DER_sum_pt"], check_names=False)
+
+
+def test_tau_energy_scale_columns_numba_backend(higgs):
+    pytest.importorskip("numba")
+    columns = {name: higgs[name].to_numpy() for name in higgsml.TES_INPUTS}
+    before = {name: values.copy() for name, values in columns.items()}
+    expected = higgsml.tau_energy_scale_columns(columns, 0.97, backend="numpy")
+    results = higgsml.tau_energy_scale_columns(columns, 0.97, backend="numba")
+    for name in higgsml.TES_OUTPUTS:
+        # the math libraries may differ by one unit in the last (3rd) decimal
+        np.testing.assert_allclose(results[name], expected[name], atol=1.5e-3, err_msg=name)
+    for name, values in columns.items():
+        np.testing.assert_array_equal(values, before[name])
+
+
+def test_tau_energy_scale_grid_matches_single_scales(higgs):
+    scales = [0.95, 1., 1.05]
+    before = higgs.copy()
+    results = higgsml.tau_energy_scale_grid(higgs, scales)
+    assert results.shape == (len(scales), len(higgsml.TES_OUTPUTS), len(higgs))
+    pd.testing.assert_frame_equal(higgs, before)
+    for scale, result in zip(scales, results):
+        data = higgs.copy()
+        higgsml.tau_energy_scale(data, scale)
+        np.testing.assert_array_equal(result, data[higgsml.TES_OUTPUTS].to_numpy().T)
+
+
+def test_systematic_pipeline_matches_inplace_functions(higgs):
+    before = higgs.copy()
+    pipeline = higgsml.SystematicPipeline().label_to_float().bkg_weight_norm(1.05).tau_energy_scale(1.03)
+    new_data = pipeline.apply(higgs)
+    pd.testing.assert_frame_equal(higgs, before)
+
+    expected = higgs.copy()
+    higgsml.label_to_float(expected)
+    higgsml.bkg_weight_norm(expected, 1.05)
+    higgsml.tau_energy_scale(expected, 1.03)
+    pd.testing.assert_frame_equal(new_data[expected.columns], expected)
+    # the unchanged columns are not copied
+    assert np.shares_memory(new_data["PRI_jet_num"].to_numpy(), higgs["PRI_jet_num"].to_numpy())
+
+
+@pytest.mark.parametrize("compact", [False, True])
+def test_tau_energy_scale_n_jobs(higgs, compact):
+    if compact:
+        higgs = higgsml.compact_dtypes(higgs, higgsml.HIGGS_SCHEMA)
+    serial, parallel = higgs.copy(), higgs.copy()
+    higgsml.tau_energy_scale(serial, 1.05, n_jobs=1)
+    higgsml.tau_energy_scale(parallel, 1.05, n_jobs=2)
+    pd.testing.assert_frame_equal(parallel, serial)
+
+
+def _wrapped_difference(a, b):
+    return (a - b + np.pi) % (2*np.pi) - np.pi
+
+
+def test_add_radians_matches_pandas_formula(higgs):
+    higgs.loc[:10, 'PRI_met_phi'] = np.nan
+    tau_lep = _wrapped_difference(higgs['PRI_tau_phi'], higgs['PRI_lep_phi'])
+    tau_met = _wrapped_difference(higgs['PRI_tau_phi'], higgs['PRI_met_phi'])
+    lep_met = _wrapped_difference(higgs['PRI_lep_phi'], higgs['PRI_met_phi'])
+    expected = {'radian_1': [tau_lep, tau_met, lep_met],
+                'radian_2': [tau_met, lep_met],
+                'radian_3': [tau_lep, tau_met],
+                'radian_4': [tau_lep, lep_met],
+                }
+    data = higgsml.add_radians(higgs, inplace=False)
+    assert 'radian_1' not in higgs.columns
+    for name, differences in expected.items():
+        np.testing.assert_allclose(data[name], pd.concat(differences, axis=1).min(axis=1), rtol=1e-12, err_msg=name)
+    data32 = higgsml.add_radian_1(higgs, inplace=False, dtype=np.float32)
+    assert data32['radian_1'].dtype == np.float32
+
+
+def test_centralities_in_place():
+    rng = np.random.default_rng(0)
+    phi = [rng.uniform(-np.pi, np.pi, 1000) for _ in range(3)]
+    eta = [rng.uniform(-2.5, 2.5, 1000) for _ in range(3)]
+    # zero divisions : a == b
+    phi[1][:10] = phi[0][:10]
+    eta[2][:10] = eta[1][:10]
+    with np.errstate(divide='raise', invalid='raise'):
+        met_phi = higgsml.METphi_centrality(*phi)
+        lep_eta = higgsml.eta_centrality(*eta)
+    assert np.isfinite(met_phi).all() and np.isfinite(lep_eta).all()
+    out = np.empty(1000)
+    assert higgsml.METphi_centrality(*phi, out=out) is out
+    np.testing.assert_array_equal(out, met_phi)
+    assert higgsml.eta_centrality(*eta, out=out) is out
+    np.testing.assert_array_equal(out, lep_eta)
+    # dead center
+    np.testing.assert_allclose(higgsml.METphi_centrality(np.array([-0.5]), np.array([0.5]), np.array([0.])), np.sqrt(2))
+    np.testing.assert_allclose(higgsml.eta_centrality(np.array([0.]), np.array([-1.]), np.array([1.])), 1.)
+
+
+def test_centralities_numba_backend():
+    pytest.importorskip("numba")
+    rng = np.random.default_rng(0)
+    phi = [rng.uniform(-np.pi, np.pi, 1000) for _ in range(3)]
+    np.testing.assert_allclose(higgsml.METphi_centrality(*phi, backend="numba"), higgsml.METphi_centrality(*phi),
+                               rtol=1e-12)
+    np.testing.assert_allclose(higgsml.eta_centrality(*phi, backend="numba"), higgsml.eta_centrality(*phi),
+                               rtol=1e-12)
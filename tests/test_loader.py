@@ -0,0 +1,76 @@
+# coding: utf-8
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from datawarehouse.loader import BatchLoader
+
+
+def make_data(n_samples=103):
+    X = np.arange(2 * n_samples, dtype=np.float64).reshape(n_samples, 2)
+    y = np.arange(n_samples)
+    return X, y
+
+
+def collect(batches):
+    return [tuple(np.array(arr) for arr in batch) for batch in batches]
+
+
+def assert_same_batches(batches, expected):
+    assert len(batches) == len(expected)
+    for batch, other in zip(batches, expected):
+        for arr, other_arr in zip(batch, other):
+            np.testing.assert_array_equal(arr, other_arr)
+
+
+@pytest.mark.parametrize('prefetch', [0, 2])
+def test_epochs_are_deterministic(prefetch):
+    X, y = make_data()
+    loader = BatchLoader(X, y, batch_size=10, seed=0, prefetch=prefetch)
+    first, second = collect(loader), collect(loader)
+    assert loader.epoch == 2
+    assert_same_batches(collect(loader.iter_epoch(0)), first)
+    assert_same_batches(collect(BatchLoader(X, y, batch_size=10, seed=0, prefetch=2 - prefetch)), first)
+    assert not np.array_equal(np.concatenate([b[1] for b in first]), np.concatenate([b[1] for b in second]))
+
+
+def test_every_row_once():
+    X, y = make_data()
+    batches = collect(BatchLoader(pd.DataFrame(X), y, batch_size=10, seed=1))
+    assert [len(b[1]) for b in batches] == [10] * 10 + [3]
+    y_all = np.concatenate([b[1] for b in batches])
+    assert sorted(y_all) == list(range(103))
+    # X and y stay aligned
+    np.testing.assert_array_equal(np.concatenate([b[0] for b in batches]), X[y_all])
+
+
+def test_drop_last_and_no_shuffle():
+    X, y = make_data()
+    loader = BatchLoader(X, y, batch_size=10, shuffle=False, drop_last=True)
+    batches = collect(loader)
+    assert len(loader) == len(batches) == 10
+    np.testing.assert_array_equal(np.concatenate([b[1] for b in batches]), np.arange(100))
+
+
+def test_transform_and_weights():
+    X, y = make_data()
+    W = np.ones(len(y))
+    batches = collect(BatchLoader(X, y, W, batch_size=50, seed=0, transform=lambda X: -X))
+    for X_batch, y_batch, W_batch in batches:
+        np.testing.assert_array_equal(X_batch, -X[y_batch])
+        assert len(W_batch) == len(y_batch)
+
+
+def test_errors_are_raised():
+    X, y = make_data()
+    with pytest.raises(ValueError):
+        BatchLoader(X, y[:-1])
+
+    def fail(X):
+        raise RuntimeError("boom")
+    with pytest.raises(RuntimeError):
+        collect(BatchLoader(X, batch_size=10, transform=fail))
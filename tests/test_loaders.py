@@ -0,0 +1,58 @@
+# coding: utf-8
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from datawarehouse import load_higgs
+from datawarehouse import iter_higgs
+from datawarehouse import load_htautau
+from datawarehouse import iter_htautau
+from datawarehouse import load_higgstautau
+from datawarehouse import load_gamma_telescope
+from datawarehouse import iter_gamma_telescope
+
+
+@pytest.mark.parametrize("cache", [False, True])
+def test_iter_higgs_matches_load_higgs(higgs_csv, cache):
+    expected = load_higgs(cache=cache)
+    chunks = list(iter_higgs(chunksize=300, cache=cache))
+    assert max(len(data) for data in chunks) == 300
+    pd.testing.assert_frame_equal(pd.concat(chunks), expected)
+
+
+def test_iter_htautau_matches_load_htautau(data_dir):
+    rng = np.random.default_rng(0)
+    pd.DataFrame(rng.normal(size=(1000, 25)).round(3)).to_csv(
+        os.path.join(data_dir, "htautau.txt.gz"), sep='\t', header=False, index=False)
+    expected = load_htautau(restricted_cols=False)
+    chunks = list(iter_htautau(chunksize=300, restricted_cols=False))
+    pd.testing.assert_frame_equal(pd.concat(chunks), expected)
+
+
+def test_iter_gamma_telescope_matches_load(data_dir):
+    rng = np.random.default_rng(0)
+    data = pd.DataFrame(rng.uniform(0, 100, size=(1000, 10)).round(4))
+    data[10] = np.where(rng.random(1000) < 0.65, 'g', 'h')
+    data.to_csv(os.path.join(data_dir, "magic04.data"), header=False, index=False)
+    X, y = load_gamma_telescope()
+    chunks = list(iter_gamma_telescope(chunksize=300))
+    pd.testing.assert_frame_equal(pd.concat([X_chunk for X_chunk, y_chunk in chunks]), X)
+    pd.testing.assert_series_equal(pd.concat([y_chunk for X_chunk, y_chunk in chunks]), y)
+
+
+def test_load_higgstautau_compact(data_dir):
+    rng = np.random.default_rng(0)
+    for name in ["htautau.txt.gz", "ztautau.txt.gz"]:
+        pd.DataFrame(rng.normal(size=(100, 25)).round(3)).to_csv(
+            os.path.join(data_dir, name), sep='\t', header=False, index=False)
+    data = load_higgstautau()
+    compact = load_higgstautau(compact=True)
+    assert (compact.drop(columns=["Label", "Weight"]).dtypes == np.float32).all()
+    assert compact["Label"].dtype == np.int8
+    np.testing.assert_allclose(compact.to_numpy(np.float64), data.to_numpy(), rtol=1e-6)
@@ -0,0 +1,73 @@
+# coding: utf-8
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import os
+import gzip
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from benchmarks.common import write_mnist
+from datawarehouse import download
+from datawarehouse import mnist
+
+
+@pytest.fixture
+def mnist_dir(data_dir, monkeypatch):
+    # random IDX files : not the checksums of the real ones
+    monkeypatch.setattr(download, 'CHECKSUMS', {})
+    write_mnist(data_dir, n_train=300, n_test=100, seed=0)
+    return data_dir
+
+
+def read_idx(filename, offset):
+    with gzip.open(filename, 'rb') as f:
+        return np.frombuffer(f.read(), np.uint8)[offset:]
+
+
+def test_cache_matches_idx_files(mnist_dir):
+    X, y = mnist.load_mnist(scaled=False)
+    assert X.shape == (400, 28, 28, 1) and isinstance(X, np.memmap)
+    images = [read_idx(os.path.join(mnist_dir, fname), 16) for fname in [mnist.FNAME_TRAIN_IMAGES, mnist.FNAME_TEST_IMAGES]]
+    labels = [read_idx(os.path.join(mnist_dir, fname), 8) for fname in [mnist.FNAME_TRAIN_LABELS, mnist.FNAME_TEST_LABELS]]
+    np.testing.assert_array_equal(X.ravel(), np.concatenate(images))
+    np.testing.assert_array_equal(y, np.concatenate(labels))
+    (X_train, _), (X_test, _) = mnist.load_mnist_split()
+    assert len(X_train) == 300 and len(X_test) == 100
+    assert not [name for name in os.listdir(mnist_dir) if name.endswith('.tmp')]
+
+
+def test_cache_rebuilt_when_idx_changes(mnist_dir):
+    _, y = mnist.load_mnist()
+    write_mnist(mnist_dir, n_train=200, n_test=100, seed=1)
+    X, y = mnist.load_mnist()
+    assert len(y) == 300
+    np.testing.assert_array_equal(y[200:], read_idx(os.path.join(mnist_dir, mnist.FNAME_TEST_LABELS), 8))
+
+
+def test_concurrent_builds(mnist_dir):
+    with ThreadPoolExecutor(4) as pool:
+        results = list(pool.map(lambda _: mnist.load_mnist(scaled=False), range(4)))
+    X, y = mnist.load_mnist(scaled=False)
+    for X_other, y_other in results:
+        np.testing.assert_array_equal(X_other, X)
+        np.testing.assert_array_equal(y_other, y)
+    assert not [name for name in os.listdir(mnist_dir) if name.endswith('.tmp')]
+
+
+def test_read_only_data_dir(mnist_dir, monkeypatch):
+    X_cache, y_cache = mnist.load_mnist(scaled=False)
+    os.remove(os.path.join(mnist_dir, mnist.CACHE_SOURCES))
+
+    def mkstemp(*args, **kwargs):
+        raise PermissionError(13, "Permission denied")
+    # chmod does not stop root : make the temporary files fail instead
+    monkeypatch.setattr(mnist.tempfile, 'mkstemp', mkstemp)
+    with pytest.warns(RuntimeWarning, match="Could not write the MNIST cache"):
+        X, y = mnist.load_mnist(scaled=False)
+    assert not isinstance(X, np.memmap)
+    np.testing.assert_array_equal(X, X_cache)
+    np.testing.assert_array_equal(y, y_cache)
@@ -0,0 +1,133 @@
+# coding: utf-8
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import os
+
+import numpy as np
+import pytest
+
+from datawarehouse.pizza import shuffle_array
+
+
+def make_arrays(n_samples=1000):
+    X = np.arange(3 * n_samples, dtype=np.float64).reshape(n_samples, 3)
+    y = np.arange(n_samples)
+    return X, y
+
+
+def test_shuffle_modes_give_the_same_permutation():
+    X, y = make_arrays()
+    X_copy, y_copy = shuffle_array(X, y, seed=0)
+    np.testing.assert_array_equal(X_copy, X[y_copy])
+    assert not np.array_equal(y_copy, y)
+    X_lazy, y_lazy = shuffle_array(X, y, seed=0, lazy=True)
+    np.testing.assert_array_equal(np.asarray(X_lazy), X_copy)
+    np.testing.assert_array_equal(X_lazy[10:20, 1], X_copy[10:20, 1])
+    out = (np.empty_like(X), np.empty_like(y))
+    X_out, y_out = shuffle_array(X, y, seed=0, out=out, block_size=64)
+    assert X_out is out[0] and y_out is out[1]
+    np.testing.assert_array_equal(out[0], X_copy)
+    np.testing.assert_array_equal(out[1], y_copy)
+    shuffle_array(X, y, seed=0, inplace=True)
+    np.testing.assert_array_equal(X, X_copy)
+    np.testing.assert_array_equal(y, y_copy)
+
+
+def test_shuffle_errors():
+    X, y = make_arrays()
+    with pytest.raises(ValueError):
+        shuffle_array()
+    with pytest.raises(ValueError):
+        shuffle_array(X, y, seed=0, inplace=True, lazy=True)
+    with pytest.raises(ValueError):
+        shuffle_array(X, y, seed=0, out=(np.empty_like(X),))
+
+
+def test_pizza_counts_are_seeded():
+    from datawarehouse.pizza import _pizza_blocks
+    _, counts = _pizza_blocks(10**5, 1000, True, 0)
+    np.testing.assert_array_equal(counts, _pizza_blocks(10**5, 1000, True, 0)[1])
+    assert counts.sum() == 10**5 - 10**5 // 2
+    assert not np.array_equal(counts, _pizza_blocks(10**5, 1000, True, 1)[1])
+    _, counts = _pizza_blocks(10**5, 1000, False, 0)
+    assert counts[:50].sum() == 0 and (counts[50:] == 1000).all()
+
+
+def test_pizza_billion_samples():
+    from datawarehouse.pizza import _pizza_blocks
+    from datawarehouse.pizza import iter_pizza_slice
+    n_samples = 2 * 10**9 + 1
+    _, counts = _pizza_blocks(n_samples, 10**6, True, 0)
+    assert len(counts) == 2001
+    assert counts.sum() == n_samples - n_samples // 2
+    assert ((0 <= counts) & (counts <= 10**6)).all()
+    np.testing.assert_array_equal(counts, _pizza_blocks(n_samples, 10**6, True, 0)[1])
+    X, y = next(iter_pizza_slice(n_samples, seed=0, batch_size=1000))
+    assert X.shape == (1000, 2) and 300 < y.sum() < 700
+
+
+@pytest.mark.parametrize('dtype', [np.float32, np.float64])
+def test_pizza_n_jobs(dtype):
+    from datawarehouse.pizza import iter_pizza_slice
+    from datawarehouse.pizza import make_pizza_slice
+    X, y = make_pizza_slice(10**4, seed=0, dtype=dtype, batch_size=1000)
+    assert X.dtype == dtype and y.sum() == 5000
+    X_jobs, y_jobs = make_pizza_slice(10**4, seed=0, dtype=dtype, batch_size=1000, n_jobs=3)
+    np.testing.assert_array_equal(X_jobs, X)
+    np.testing.assert_array_equal(y_jobs, y)
+    batches = list(iter_pizza_slice(10**4, seed=0, dtype=dtype, batch_size=1000))
+    np.testing.assert_array_equal(np.concatenate([b[0] for b in batches]), X)
+
+
+def test_pizza_n_jobs_memmap(tmp_path):
+    from datawarehouse.pizza import make_pizza_slice
+    X, y = make_pizza_slice(10**4, seed=0, batch_size=1000)
+    out = (np.lib.format.open_memmap(str(tmp_path / 'X.npy'), mode='w+', dtype=np.float64, shape=(10**4, 2)),
+           np.lib.format.open_memmap(str(tmp_path / 'y.npy'), mode='w+', dtype=np.float64, shape=(10**4,)))
+    X_out, y_out = make_pizza_slice(10**4, seed=0, batch_size=1000, n_jobs=2, out=out)
+    assert X_out is out[0] and y_out is out[1]
+    del X_out, y_out
+    del out
+    np.testing.assert_array_equal(np.load(str(tmp_path / 'X.npy')), X)
+    np.testing.assert_array_equal(np.load(str(tmp_path / 'y.npy')), y)
+
+
+def test_pizza_seed_sequence_seed():
+    from datawarehouse.pizza import iter_pizza_slice
+    from datawarehouse.pizza import make_pizza_slice
+    seed_seq = np.random.SeedSequence(3)
+    X, y = make_pizza_slice(1000, seed=seed_seq, batch_size=300)
+    X_again, y_again = make_pizza_slice(1000, seed=seed_seq, batch_size=300)
+    np.testing.assert_array_equal(X_again, X)
+    np.testing.assert_array_equal(y_again, y)
+    X_int, _ = make_pizza_slice(1000, seed=3, batch_size=300)
+    np.testing.assert_array_equal(X_int, X)
+    batches = list(iter_pizza_slice(1000, seed=seed_seq, batch_size=300))
+    np.testing.assert_array_equal(np.concatenate([b[0] for b in batches]), X)
+
+
+def test_pizza_n_jobs_outputs(monkeypatch, tmp_path):
+    import tempfile
+    from datawarehouse.pizza import make_pizza_slice
+    X, y = make_pizza_slice(10**4, seed=0, batch_size=1000)
+    # the processes write into temporary files, removed once the data is generated
+    paths = []
+    mkstemp = tempfile.mkstemp
+
+    def mkstemp_in_tmp_path(**kwargs):
+        fd, path = mkstemp(**dict(kwargs, dir=str(tmp_path)))
+        paths.append(path)
+        return fd, path
+    monkeypatch.setattr(tempfile, 'mkstemp', mkstemp_in_tmp_path)
+    X_jobs, y_jobs = make_pizza_slice(10**4, seed=0, batch_size=1000, n_jobs=2)
+    assert type(X_jobs) is np.ndarray and X_jobs.flags.writeable
+    assert len(paths) == 2 and os.listdir(str(tmp_path)) == []
+    np.testing.assert_array_equal(X_jobs, X)
+    np.testing.assert_array_equal(y_jobs, y)
+    # any other out : shared memory copied into it
+    out = (np.empty_like(X), np.empty_like(y))
+    make_pizza_slice(10**4, seed=0, batch_size=1000, n_jobs=2, out=out)
+    np.testing.assert_array_equal(out[0], X)
+    np.testing.assert_array_equal(out[1], y)
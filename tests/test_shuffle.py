@@ -0,0 +1,49 @@
+# coding: utf-8
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from datawarehouse.shuffle import external_shuffle
+
+
+def make_chunks(n_chunks=5, chunksize=200):
+    for i in range(n_chunks):
+        start = i * chunksize
+        ids = np.arange(start, start + chunksize)
+        yield pd.DataFrame({'id': ids, 'twice': 2 * ids})
+
+
+def shuffle(seed, tmp_dir, n_buckets=4):
+    return pd.concat(external_shuffle(make_chunks(), n_buckets=n_buckets, seed=seed, tmp_dir=tmp_dir),
+                     ignore_index=True)
+
+
+def test_permutation_of_the_rows(tmp_path):
+    data = shuffle(0, str(tmp_path))
+    assert sorted(data['id']) == list(range(1000))
+    np.testing.assert_array_equal(data['twice'], 2 * data['id'])
+    assert not (data['id'].values == np.arange(1000)).all()
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_deterministic_per_seed(tmp_path):
+    data = shuffle(0, str(tmp_path))
+    pd.testing.assert_frame_equal(data, shuffle(0, str(tmp_path)))
+    assert not data.equals(shuffle(1, str(tmp_path)))
+
+
+def test_more_buckets_than_rows(tmp_path):
+    data = pd.concat(external_shuffle(make_chunks(1, 3), n_buckets=16, seed=0, tmp_dir=str(tmp_path)))
+    assert sorted(data['id']) == [0, 1, 2]
+
+
+def test_seed_sequence_seed(tmp_path):
+    seed_seq = np.random.SeedSequence(3)
+    data = shuffle(seed_seq, str(tmp_path))
+    pd.testing.assert_frame_equal(data, shuffle(seed_seq, str(tmp_path)))
+    pd.testing.assert_frame_equal(data, shuffle(3, str(tmp_path)))
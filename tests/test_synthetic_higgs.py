@@ -0,0 +1,48 @@
+# coding: utf-8
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import numpy as np
+import pandas as pd
+
+from datawarehouse import cache
+from datawarehouse import higgsml
+from datawarehouse.synthetic_higgs import iter_higgs_like
+from datawarehouse.synthetic_higgs import make_higgs_like
+from datawarehouse.synthetic_higgs import write_higgs_like_cache
+
+
+def test_same_seed_same_data():
+    data = make_higgs_like(500, seed=1, chunksize=200)
+    pd.testing.assert_frame_equal(data, make_higgs_like(500, seed=1, chunksize=200))
+    chunks = list(iter_higgs_like(500, seed=1, chunksize=200))
+    assert [len(chunk) for chunk in chunks] == [200, 200, 100]
+    pd.testing.assert_frame_equal(pd.concat(chunks, ignore_index=True), data)
+    assert not data.equals(make_higgs_like(500, seed=2, chunksize=200))
+
+
+def test_schema():
+    data = make_higgs_like(500, seed=0)
+    assert list(data.columns) == higgsml.HIGGS_COLUMNS
+    missing = data['PRI_jet_num'] < 2
+    assert (data.loc[missing, 'DER_mass_jet_jet'] == -999.0).all()
+    assert (data.loc[~missing, 'DER_mass_jet_jet'] != -999.0).all()
+    higgsml.add_detail_label(data)
+    assert data['detailLabel'].notnull().all()
+
+
+def test_write_cache(tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    write_higgs_like_cache(cache_dir, 500, seed=0, chunksize=200)
+    data = cache.read_cache(cache_dir)
+    expected = make_higgs_like(500, seed=0, chunksize=200)
+    for name in expected.columns:
+        np.testing.assert_array_equal(np.asarray(data[name]), np.asarray(expected[name]))
+
+
+def test_seed_sequence_seed():
+    seed_seq = np.random.SeedSequence(3)
+    data = make_higgs_like(300, seed=seed_seq, chunksize=100)
+    pd.testing.assert_frame_equal(data, make_higgs_like(300, seed=seed_seq, chunksize=100))
+    pd.testing.assert_frame_equal(data, make_higgs_like(300, seed=3, chunksize=100))
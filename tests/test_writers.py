@@ -0,0 +1,63 @@
+# coding: utf-8
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+
+import os
+
+import pandas as pd
+import pytest
+
+from datawarehouse import cache
+from datawarehouse.writers import open_writer
+from datawarehouse.writers import write_chunks
+
+
+def make_chunks(n_chunks=3, chunksize=100):
+    for i in range(n_chunks):
+        start = i * chunksize
+        yield pd.DataFrame({'a': range(start, start + chunksize), 'b': [0.5] * chunksize})
+
+
+def failing_chunks():
+    for i, data in enumerate(make_chunks()):
+        if i == 2:
+            raise RuntimeError("boom")
+        yield data
+
+
+@pytest.mark.parametrize('compression', [None, 'gzip'])
+def test_csv_roundtrip(tmp_path, compression):
+    out_file = str(tmp_path / 'out.csv')
+    assert write_chunks(make_chunks(), out_file, compression=compression, threads=2) == 300
+    data = pd.read_csv(out_file, compression=compression)
+    pd.testing.assert_frame_equal(data, pd.concat(make_chunks(), ignore_index=True))
+
+
+def test_parquet_roundtrip(tmp_path):
+    pytest.importorskip('pyarrow')
+    out_file = str(tmp_path / 'out.parquet')
+    write_chunks(make_chunks(), out_file, fmt='parquet', columns=['a'])
+    data = pd.read_parquet(out_file)
+    assert list(data.columns) == ['a']
+    assert data['a'].tolist() == list(range(300))
+
+
+@pytest.mark.parametrize('fmt', ['csv', 'parquet', 'npy'])
+def test_abort_removes_output(tmp_path, fmt):
+    if fmt == 'parquet':
+        pytest.importorskip('pyarrow')
+    out_file = str(tmp_path / ('out.' + fmt))
+    with pytest.raises(RuntimeError):
+        write_chunks(failing_chunks(), out_file, fmt=fmt)
+    assert not os.path.exists(out_file)
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_npy_roundtrip(tmp_path):
+    out_dir = str(tmp_path / 'out')
+    with open_writer(out_dir, fmt='npy') as writer:
+        for data in make_chunks():
+            writer.write(data)
+    data = cache.read_cache(out_dir)
+    assert data['a'].tolist() == list(range(300))